@@ -0,0 +1,215 @@
+import math
+import shutil
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+from db.job import job_get_completed_seconds, job_get_queued_seconds
+from db.usage import usage_get_day, usage_save
+from settings import get_settings
+from sqlmodel import Session
+from typing import Optional
+
+settings = get_settings()
+
+# Longest Retry-After sent to clients
+MAX_RETRY_AFTER = 60 * 60
+
+# Tenant of requests without an X-User header
+ANONYMOUS = "anonymous"
+
+
+class AdmissionError(Exception):
+    """
+    Raised when an upload or a job is not admitted. The status code is
+    429 when the tenant is over its limits and 503 when the broker is.
+    """
+
+    def __init__(self, status_code: int, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = min(max(math.ceil(retry_after), 1), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """
+    Allow requests at a steady rate with bursts up to the bucket size.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take a token. Returns 0 if there was one, otherwise the seconds
+        until the next token.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+
+def today() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def seconds_to_midnight() -> float:
+    now = datetime.utcnow()
+    midnight = (now + timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    return (midnight - now).total_seconds()
+
+
+class Admission:
+    """
+    Decide if uploads and jobs are accepted, based on the free disk, the
+    bytes being uploaded, the hours of audio in the queue and the rate
+    limits and daily audio quotas of the tenants.
+
+    The usage of the tenants is counted in memory and persisted by
+    persist(), so it survives restarts.
+    """
+
+    def __init__(self) -> None:
+        self.inflight_bytes = 0
+        self.buckets: dict[str, TokenBucket] = {}
+        self.day = ""
+        self.usage: dict[str, tuple[float, int]] = {}
+        self.dirty: set[str] = set()
+
+    def load(self, session: Session) -> None:
+        """
+        Load the usage of today, when starting and at midnight.
+        """
+        self.day = today()
+        self.usage = usage_get_day(session, self.day)
+        self.dirty = set()
+
+    def persist(self, session: Session) -> None:
+        """
+        Store the usage changed since the last call.
+        """
+        if self.dirty:
+            usage_save(
+                session,
+                {(tenant, self.day): self.usage[tenant] for tenant in self.dirty},
+            )
+            self.dirty = set()
+
+        if self.day != today():
+            self.load(session)
+
+    def check_rate(self, tenant: str) -> None:
+        if not settings.TENANT_REQUESTS_PER_MINUTE:
+            return
+
+        if tenant not in self.buckets:
+            self.buckets[tenant] = TokenBucket(
+                settings.TENANT_REQUESTS_PER_MINUTE / 60, settings.TENANT_BURST
+            )
+
+        if wait := self.buckets[tenant].take():
+            raise AdmissionError(429, "Too many requests", wait)
+
+    def check_quota(self, tenant: str, seconds: float = 0) -> None:
+        if not (quota := settings.TENANT_AUDIO_MINUTES_PER_DAY * 60):
+            return
+
+        used, _ = self.usage.get(tenant, (0, 0))
+        if used + seconds > quota:
+            raise AdmissionError(
+                429,
+                f"Daily quota of {settings.TENANT_AUDIO_MINUTES_PER_DAY} "
+                "audio minutes exceeded",
+                seconds_to_midnight(),
+            )
+
+    def check_queue(self, session: Session, seconds: float = 0) -> None:
+        """
+        Refuse work while the queue holds more than ADMISSION_MAX_QUEUE_HOURS
+        of audio. Clients are asked to retry when the excess would be
+        transcribed at the rate of the last hour.
+        """
+        if not (limit := settings.ADMISSION_MAX_QUEUE_HOURS * 3600):
+            return
+
+        excess = job_get_queued_seconds(session) + seconds - limit
+        if excess <= 0:
+            return
+
+        since = datetime.utcnow() - timedelta(hours=1)
+        rate = job_get_completed_seconds(session, since) / 3600
+
+        raise AdmissionError(
+            503,
+            "The transcription queue is full",
+            excess / rate if rate else settings.ADMISSION_RETRY_AFTER,
+        )
+
+    def check_storage(self, size: int) -> None:
+        """
+        Refuse uploads that would fill the disk or exceed the bytes allowed
+        to be uploaded at the same time.
+        """
+        if self.inflight_bytes + size > settings.ADMISSION_MAX_INFLIGHT_BYTES:
+            raise AdmissionError(
+                503, "Too many uploads in progress", settings.ADMISSION_RETRY_AFTER
+            )
+
+        # Uploads to an object store are spooled to temporary files first
+        if settings.STORAGE_BACKEND == "local":
+            path = settings.API_FILE_UPLOAD_DIR
+        else:
+            path = tempfile.gettempdir()
+
+        free = shutil.disk_usage(path).free - self.inflight_bytes - size
+        if free < settings.ADMISSION_MIN_FREE_BYTES:
+            raise AdmissionError(
+                503, "Not enough free disk space", settings.RETENTION_INTERVAL
+            )
+
+    def check_submission(self, session: Session, tenant: str) -> None:
+        """
+        Check a new job before its file is uploaded.
+        """
+        self.check_rate(tenant)
+        self.check_quota(tenant)
+        self.check_queue(session)
+
+    def check_upload(self, session: Session, tenant: str, size: int) -> None:
+        """
+        Check an upload of the given size through the broker before its
+        body is read.
+        """
+        self.check_submission(session, tenant)
+        self.check_storage(size)
+
+    def admit_job(self, session: Session, tenant: str, seconds: float) -> None:
+        """
+        Check a job with the given seconds of audio being queued and
+        count the audio towards the daily quota of the tenant.
+        """
+        self.check_quota(tenant, seconds)
+        self.check_queue(session, seconds)
+
+        used, jobs = self.usage.get(tenant, (0, 0))
+        self.usage[tenant] = (used + seconds, jobs + 1)
+        self.dirty.add(tenant)
+
+
+def tenant_of(owner: Optional[str]) -> str:
+    return owner or ANONYMOUS
+
+
+admission = Admission()
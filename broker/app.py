@@ -1,11 +1,24 @@
+import asyncio
+
+from dispatch import dispatcher
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_utils.tasks import repeat_every
-from routers.transcriber import router as transcriber_router
+from media import check_upload
+from admission import admission
+from middleware import AdmissionMiddleware, UploadSniffMiddleware
+from retention import delete_job_files, enforce_retention
+from routers.analytics import router as analytics_router
+from routers.deadletter import router as deadletter_router
+from routers.dispatch import router as dispatch_router
+from routers.registry import router as registry_router
+from routers.transcriber import router as transcriber_router, worker_job
 from routers.static import router as static_router
+from routers.search import router as search_router
 from settings import get_settings
-from db.job import job_cleanup
+from db.analytics import analytics_rollup
+from db.job import job_cleanup, job_get_unprobed
 from db.session import get_session
 
 settings = get_settings()
@@ -22,6 +35,16 @@ app = FastAPI(
     ],
 )
 
+app.add_middleware(
+    UploadSniffMiddleware,
+    paths=[f"{settings.API_PREFIX}/transcriber"],
+)
+
+app.add_middleware(
+    AdmissionMiddleware,
+    paths=[f"{settings.API_PREFIX}/transcriber"],
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -30,8 +53,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(dispatch_router, prefix=settings.API_PREFIX, tags=["transcriber"])
 app.include_router(transcriber_router, prefix=settings.API_PREFIX, tags=["transcriber"])
 app.include_router(static_router, prefix="", tags=["static"])
+app.include_router(search_router, prefix=settings.API_PREFIX, tags=["transcriber"])
+app.include_router(analytics_router, prefix=settings.API_PREFIX, tags=["transcriber"])
+app.include_router(deadletter_router, prefix=settings.API_PREFIX, tags=["transcriber"])
+app.include_router(registry_router, prefix=settings.API_PREFIX, tags=["transcriber"])
 
 
 @app.get("/", response_class=RedirectResponse, include_in_schema=False)
@@ -42,6 +70,41 @@ async def index():
     return RedirectResponse(url="/docs")
 
 
+@app.on_event("startup")
+@repeat_every(seconds=settings.USAGE_PERSIST_INTERVAL)
+async def persist_usage():
+    """
+    Persist the usage of the tenants, loading it first when starting.
+    """
+    db_session = get_session()
+
+    if not admission.day:
+        admission.load(db_session)
+
+    admission.persist(db_session)
+
+
+@app.on_event("startup")
+async def start_dispatcher():
+    """
+    Push pending jobs to workers connected over WebSockets.
+    """
+    app.state.dispatcher = asyncio.create_task(dispatcher.run(worker_job))
+
+
+@app.on_event("startup")
+async def check_uploads():
+    """
+    Probe the uploads the broker stopped before probing, they can not be
+    submitted until then.
+    """
+    db_session = get_session()
+    loop = asyncio.get_running_loop()
+
+    for uuid in job_get_unprobed(db_session):
+        loop.run_in_executor(None, check_upload, uuid)
+
+
 @app.on_event("startup")
 @repeat_every(seconds=60 * 5)  # 5 minutes
 def clean_jobs():
@@ -49,4 +112,29 @@ def clean_jobs():
     Clean up old jobs stuck in wrong state.
     """
     db_session = get_session()
-    job_cleanup(db_session)
+
+    for uuid in job_cleanup(db_session):
+        delete_job_files(uuid)
+
+
+@app.on_event("startup")
+@repeat_every(
+    seconds=settings.RETENTION_INTERVAL, wait_first=settings.RETENTION_INTERVAL
+)
+def retention():
+    """
+    Delete orphaned files and evict old jobs and jobs over quota.
+    """
+    enforce_retention()
+
+
+@app.on_event("startup")
+@repeat_every(seconds=settings.ANALYTICS_ROLLUP_INTERVAL)
+def rollup_events():
+    """
+    Count the job status changes of the past hours for the latency
+    analytics and delete old events.
+    """
+    db_session = get_session()
+
+    analytics_rollup(db_session, settings.ANALYTICS_EVENT_DAYS)
@@ -0,0 +1,222 @@
+import math
+
+from datetime import datetime, timedelta
+from db.models import Job, JobEvent, JobLatencyRollup, JobStatusEnum
+from sqlalchemy import func, or_
+from sqlmodel import Session
+from typing import Optional
+
+# Status changes measured, as (from, to) by the name of the phase
+PHASES = {
+    "upload_to_pending": (JobStatusEnum.UPLOADED, JobStatusEnum.PENDING),
+    "pending_to_claimed": (JobStatusEnum.PENDING, JobStatusEnum.IN_PROGRESS),
+    "claimed_to_completed": (JobStatusEnum.IN_PROGRESS, JobStatusEnum.COMPLETED),
+}
+
+# Latency histogram buckets grow by this factor, about 19% wide
+BUCKET_BASE = 2**0.25
+
+# Latencies shorter than this share the first bucket, seconds
+MIN_LATENCY = 0.01
+
+# Duration ranges of the media files, by upper bound in seconds
+DURATION_BUCKETS = [(60, "<1m"), (600, "1-10m"), (3600, "10-60m")]
+
+ROLLUP_COLUMNS = [
+    JobEvent.hour,
+    JobEvent.from_status,
+    JobEvent.to_status,
+    JobEvent.model_type,
+    JobEvent.duration_bucket,
+    JobEvent.latency_bucket,
+]
+
+
+def to_hour(time: datetime) -> datetime:
+    return time.replace(minute=0, second=0, microsecond=0)
+
+
+def latency_bucket(seconds: float) -> int:
+    """
+    Get the logarithmic histogram bucket of a latency.
+    """
+    return math.floor(math.log(max(seconds, MIN_LATENCY), BUCKET_BASE))
+
+
+def bucket_seconds(bucket: int) -> float:
+    """
+    Get the latency in the geometric middle of a histogram bucket.
+    """
+    return BUCKET_BASE ** (bucket + 0.5)
+
+
+def duration_bucket(duration: Optional[float]) -> str:
+    """
+    Get the duration range of a media file.
+    """
+    if duration is None:
+        return "unknown"
+
+    for limit, name in DURATION_BUCKETS:
+        if duration < limit:
+            return name
+
+    return ">1h"
+
+
+def event_add(
+    session: Session,
+    job: Job,
+    status: JobStatusEnum,
+    now: datetime,
+    worker: Optional[str] = None,
+    measure: bool = True,
+) -> None:
+    """
+    Add the status change of a job to the session, so it is committed
+    together with the change. Changes that are not measured are left
+    out of the latency analytics.
+    """
+    seconds = (now - job.status_at).total_seconds() if job.status else None
+    measure = measure and seconds is not None
+
+    session.add(
+        JobEvent(
+            job_uuid=job.uuid,
+            from_status=JobStatusEnum(job.status).value if job.status else None,
+            to_status=JobStatusEnum(status).value,
+            worker=worker,
+            created_at=now,
+            hour=to_hour(now),
+            seconds=seconds,
+            latency_bucket=latency_bucket(seconds) if measure else None,
+            model_type=job.model_type or "",
+            duration_bucket=duration_bucket(job.duration),
+        )
+    )
+
+
+def measured():
+    """
+    Get the condition selecting the events of the measured phases.
+    """
+    return or_(
+        *(
+            (JobEvent.from_status == start.value) & (JobEvent.to_status == end.value)
+            for start, end in PHASES.values()
+        )
+    )
+
+
+def analytics_rollup(session: Session, keep_days: int) -> int:
+    """
+    Count the measured status changes of every complete hour that is not
+    rolled up yet, and delete events older than keep_days that are
+    rolled up. Returns the number of rollup rows added.
+    """
+    current = to_hour(datetime.utcnow())
+    last = session.query(func.max(JobLatencyRollup.hour)).scalar()
+
+    query = session.query(*ROLLUP_COLUMNS, func.count(JobEvent.id)).filter(
+        JobEvent.hour < current, JobEvent.latency_bucket.is_not(None), measured()
+    )
+    if last:
+        query = query.filter(JobEvent.hour > last)
+
+    rows = query.group_by(*ROLLUP_COLUMNS).all()
+
+    session.add_all(
+        JobLatencyRollup(
+            hour=hour,
+            from_status=from_status,
+            to_status=to_status,
+            model_type=model_type,
+            duration_bucket=duration,
+            latency_bucket=bucket,
+            count=count,
+        )
+        for hour, from_status, to_status, model_type, duration, bucket, count in rows
+    )
+
+    session.query(JobEvent).filter(
+        JobEvent.hour < current - timedelta(days=keep_days)
+    ).delete(synchronize_session=False)
+    session.commit()
+
+    return len(rows)
+
+
+def percentile(histogram: dict[int, int], fraction: float) -> float:
+    """
+    Estimate a percentile from the counts of the latency buckets.
+    """
+    total = sum(histogram.values())
+    seen = 0
+
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= fraction * total:
+            return bucket_seconds(bucket)
+
+    return 0.0
+
+
+def analytics_latency(
+    session: Session, since: datetime, model_type: Optional[str] = None
+) -> list[dict]:
+    """
+    Get the count, median and 95th percentile of the time spent in every
+    phase since the given hour, by model and duration range. Complete
+    hours are read from the rollups and the rest from the events.
+    """
+    since = to_hour(since)
+    last = session.query(func.max(JobLatencyRollup.hour)).scalar()
+    rolled_until = last + timedelta(hours=1) if last else since
+
+    rollups = session.query(
+        JobLatencyRollup.from_status,
+        JobLatencyRollup.to_status,
+        JobLatencyRollup.model_type,
+        JobLatencyRollup.duration_bucket,
+        JobLatencyRollup.latency_bucket,
+        func.sum(JobLatencyRollup.count),
+    ).filter(JobLatencyRollup.hour >= since)
+    if model_type:
+        rollups = rollups.filter(JobLatencyRollup.model_type == model_type)
+
+    events = session.query(*ROLLUP_COLUMNS[1:], func.count(JobEvent.id)).filter(
+        JobEvent.hour >= max(since, rolled_until),
+        JobEvent.latency_bucket.is_not(None),
+        measured(),
+    )
+    if model_type:
+        events = events.filter(JobEvent.model_type == model_type)
+
+    histograms: dict[tuple, dict[int, int]] = {}
+    phases = {(start.value, end.value): name for name, (start, end) in PHASES.items()}
+
+    for query, columns in ((rollups, JobLatencyRollup), (events, JobEvent)):
+        grouped = query.group_by(
+            columns.from_status,
+            columns.to_status,
+            columns.model_type,
+            columns.duration_bucket,
+            columns.latency_bucket,
+        )
+
+        for from_status, to_status, model, duration, bucket, count in grouped:
+            key = (phases[(from_status, to_status)], model, duration)
+            histogram = histograms.setdefault(key, {})
+            histogram[bucket] = histogram.get(bucket, 0) + count
+
+    return [
+        {
+            "phase": phase,
+            "model_type": model,
+            "duration": duration,
+            "count": sum(histogram.values()),
+            "p50": round(percentile(histogram, 0.5), 1),
+            "p95": round(percentile(histogram, 0.95), 1),
+        }
+        for (phase, model, duration), histogram in sorted(histograms.items())
+    ]
@@ -1,9 +1,42 @@
-from db.models import Job, JobStatusEnum, Jobs
-from typing import Optional
+import json
+
+from db.models import (
+    Job,
+    JobStatusEnum,
+    Jobs,
+    ResultStageEnum,
+    TranscriptCue,
+    TranscriptEdit,
+)
+from typing import Iterable, Optional
+from sqlalchemy import func
 from sqlmodel import Session
+from db.analytics import event_add
 from db.session import get_session
 from datetime import datetime, timedelta
 
+# Record reads of a job's files at most this often
+ACCESS_RESOLUTION = timedelta(minutes=10)
+
+
+def set_status(
+    session: Session,
+    job: Job,
+    status: JobStatusEnum,
+    worker: Optional[str] = None,
+    measure: bool = True,
+) -> None:
+    """
+    Change the status of a job and log the change in the same transaction.
+    """
+    if job.status == status:
+        return
+
+    now = datetime.utcnow()
+    event_add(session, job, status, now, worker, measure)
+    job.status = status
+    job.status_at = now
+
 
 def job_create(
     session: Session,
@@ -12,16 +45,18 @@ def job_create(
     model_type: Optional[str] = "",
     filename: Optional[str] = "",
     output_format: Optional[str] = "",
+    owner: Optional[str] = None,
 ) -> dict:
     job = Job(
+        owner=owner,
         job_type=job_type,
         language=language,
         model_type=model_type,
-        status=JobStatusEnum.UPLOADING,
         output_format=output_format,
         filename=filename,
     )
 
+    set_status(session, job, JobStatusEnum.UPLOADING)
     session.add(job)
     session.commit()
 
@@ -38,25 +73,84 @@ def job_get(session: Session, uuid: str) -> Optional[Job]:
     return job.as_dict() if job else {}
 
 
-def job_get_next(session: Session) -> dict:
+def job_get_next(session: Session, worker: Optional[str] = None) -> dict:
     """
-    Get the next available job from the database.
+    Get the next available job from the database, the oldest job with
+    the highest priority, and mark it as claimed by the worker. Failed
+    jobs are not claimed before their retry time.
     """
 
-    job = session.query(Job).filter(Job.status == JobStatusEnum.PENDING).first()
+    job = (
+        session.query(Job)
+        .filter(
+            Job.status == JobStatusEnum.PENDING,
+            Job.not_before.is_(None) | (Job.not_before <= datetime.utcnow()),
+        )
+        .order_by(Job.priority.desc(), Job.id)
+        .first()
+    )
 
     if job:
-        job.status = JobStatusEnum.IN_PROGRESS
+        set_status(session, job, JobStatusEnum.IN_PROGRESS, worker)
         session.commit()
 
     return job.as_dict() if job else {}
 
 
+def job_requeue(session: Session, uuid: str) -> Optional[dict]:
+    """
+    Give a claimed job back to the queue, unless a worker already
+    finished it.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job or job.status != JobStatusEnum.IN_PROGRESS:
+        return None
+
+    set_status(session, job, JobStatusEnum.PENDING)
+    session.commit()
+
+    return job.as_dict()
+
+
+def job_get_queued_seconds(session: Session) -> float:
+    """
+    Get the seconds of audio waiting for or being transcribed.
+    """
+    queued = (
+        session.query(func.sum(Job.duration))
+        .filter(
+            Job.status.in_([JobStatusEnum.PENDING, JobStatusEnum.IN_PROGRESS]),
+            Job.parent_uuid.is_(None),
+        )
+        .scalar()
+    )
+
+    return queued or 0
+
+
+def job_get_completed_seconds(session: Session, since: datetime) -> float:
+    """
+    Get the seconds of audio transcribed since the given time.
+    """
+    completed = (
+        session.query(func.sum(Job.duration))
+        .filter(
+            Job.status == JobStatusEnum.COMPLETED,
+            Job.updated_at >= since,
+            Job.parent_uuid.is_(None),
+        )
+        .scalar()
+    )
+
+    return completed or 0
+
+
 def job_get_all(session: Session) -> list[Job]:
     """
-    Get all jobs from the database.
+    Get all jobs from the database, without the segments of split jobs.
     """
-    jobs = session.query(Job).all()
+    jobs = session.query(Job).filter(Job.parent_uuid.is_(None)).all()
 
     return {"jobs": [job.as_dict() for job in jobs]}
 
@@ -84,50 +178,595 @@ def job_update(
     model_type: Optional[str] = None,
     output_format: Optional[str] = None,
     error: Optional[str] = None,
+    detected_language: Optional[str] = None,
+    result_stage: Optional[ResultStageEnum] = None,
+    worker: Optional[str] = None,
 ) -> Optional[Job]:
     """
-    Update a job by UUID.
+    Update a job by UUID, logging a status change reported by a worker
+    together with the worker.
     """
     job = session.query(Job).filter(Job.uuid == uuid).first()
 
     if not job:
         return None
 
-    if status:
-        job.status = status
     if error:
         job.error = error
     if language:
         job.language = language
+    if detected_language:
+        job.detected_language = detected_language
     if model_type:
         job.model_type = model_type
     if output_format:
         job.output_format = output_format
+    if result_stage:
+        job.result_stage = result_stage.value
+    if status:
+        set_status(session, job, status, worker)
+    if status == JobStatusEnum.COMPLETED:
+        job.progress = 1
+
+    session.commit()
+
+    return job.as_dict()
+
+
+def job_submit(
+    session: Session,
+    uuid: str,
+    draft_model: Optional[str] = None,
+    quantization: str = "",
+    latency_target: Optional[float] = None,
+    model_name: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Start a new run of a submitted job, with the draft model first and
+    refining the result with the requested model later, or only with the
+    requested model if there is no draft model.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job:
+        return None
+
+    if draft_model and draft_model != job.model_type:
+        job.refine_model = job.model_type
+        job.model_type = draft_model
+    else:
+        job.refine_model = None
+
+    job.quantization = quantization
+    job.latency_target = latency_target
+    job.model_name = model_name
+    job.segment_count = None
+    job.priority = 0
+    job.progress = 0
+    job.attempts = 0
+    job.not_before = None
+    job.error_class = None
+    job.error_history = None
+    session.commit()
+
+    return job.as_dict()
+
+
+def job_publish_draft(session: Session, uuid: str, priority: int) -> Optional[dict]:
+    """
+    Serve the result of a job as a draft and queue the refinement with
+    the requested model at the given priority.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job:
+        return None
+
+    job.result_stage = ResultStageEnum.DRAFT.value
+    job.model_type = job.refine_model
+    job.refine_model = None
+    job.priority = priority
+    set_status(session, job, JobStatusEnum.PENDING)
+    job.error = None
+    session.commit()
+
+    return job.as_dict()
+
+
+def job_add_failure(
+    session: Session,
+    uuid: str,
+    error: Optional[str],
+    error_class: str,
+    worker: Optional[str] = None,
+    not_before: Optional[datetime] = None,
+) -> Optional[dict]:
+    """
+    Add a failed attempt to the error history of a job, and queue the
+    job again to be retried at not_before if given.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job:
+        return None
+
+    job.attempts += 1
+    job.error = error
+    job.error_class = error_class
+    job.error_history = json.dumps(
+        json.loads(job.error_history or "[]")
+        + [
+            {
+                "attempt": job.attempts,
+                "time": str(datetime.utcnow()),
+                "error_class": error_class,
+                "error": error,
+                "worker": worker,
+                "model_type": job.model_type,
+            }
+        ]
+    )
+
+    job.not_before = not_before
+    if not_before:
+        set_status(session, job, JobStatusEnum.PENDING, worker)
+
+    session.commit()
+
+    return job.as_dict()
+
+
+def job_get_dead_letters(
+    session: Session, error_class: Optional[str] = None
+) -> list[dict]:
+    """
+    Get the jobs that ran out of attempts, oldest first. Segments are
+    left out, their split job is a dead letter as well.
+    """
+    query = session.query(Job).filter(
+        Job.status == JobStatusEnum.DEAD_LETTER, Job.parent_uuid.is_(None)
+    )
+
+    if error_class:
+        query = query.filter(Job.error_class == error_class)
+
+    return [job.as_dict() for job in query.order_by(Job.status_at)]
+
+
+def job_requeue_dead_letters(
+    session: Session,
+    uuids: Optional[list[str]] = None,
+    error_class: Optional[str] = None,
+) -> list[str]:
+    """
+    Queue dead letter jobs again with new attempts, all of them or the
+    given ones or those with the given class of error. The error history
+    is kept. A split job gets its segments that are not done queued
+    again. Returns the UUIDs of the requeued jobs.
+    """
+    query = session.query(Job).filter(
+        Job.status == JobStatusEnum.DEAD_LETTER, Job.parent_uuid.is_(None)
+    )
+
+    if uuids is not None:
+        query = query.filter(Job.uuid.in_(uuids))
+    if error_class:
+        query = query.filter(Job.error_class == error_class)
+
+    jobs = query.all()
+
+    for job in jobs:
+        segments = session.query(Job).filter(Job.parent_uuid == job.uuid).all()
+        retried = [s for s in segments if s.status != JobStatusEnum.COMPLETED]
+
+        # A split job waits for its segments instead of being claimed
+        if segments:
+            set_status(session, job, JobStatusEnum.IN_PROGRESS, measure=False)
+        else:
+            set_status(session, job, JobStatusEnum.PENDING)
+
+        for segment in retried:
+            set_status(session, segment, JobStatusEnum.PENDING)
+
+        for retry in [job] + retried:
+            retry.attempts = 0
+            retry.not_before = None
+
+    session.commit()
+
+    return [job.uuid for job in jobs]
+
+
+def job_split(
+    session: Session, uuid: str, segments: list[tuple[float, float]]
+) -> list[dict]:
+    """
+    Split a submitted job into pending segment jobs of (start, duration)
+    seconds of its upload, replacing the segments of an earlier run.
+    The job itself stays in progress until the segments are merged.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job:
+        return []
+
+    session.query(Job).filter(Job.parent_uuid == uuid).delete()
+
+    children = [
+        Job(
+            owner=job.owner,
+            job_type=job.job_type,
+            language=job.language,
+            model_type=job.model_type,
+            quantization=job.quantization,
+            model_name=job.model_name,
+            latency_target=job.latency_target,
+            output_format=job.output_format,
+            filename=job.filename,
+            duration=duration,
+            priority=job.priority,
+            parent_uuid=uuid,
+            segment_start=start,
+        )
+        for start, duration in segments
+    ]
+
+    for child in children:
+        set_status(session, child, JobStatusEnum.PENDING)
+
+    # No worker claimed the job, the segments are claimed instead
+    set_status(session, job, JobStatusEnum.IN_PROGRESS, measure=False)
+    job.progress = 0
+    job.segment_count = len(children)
+    session.add_all(children)
+    session.commit()
+
+    return [child.as_dict() for child in children]
+
+
+def job_get_segments(session: Session, uuid: str) -> list[dict]:
+    """
+    Get the segment jobs of a split job in the order of the audio.
+    """
+    children = (
+        session.query(Job)
+        .filter(Job.parent_uuid == uuid)
+        .order_by(Job.segment_start)
+        .all()
+    )
+
+    return [child.as_dict() for child in children]
+
+
+def job_segment_completed(session: Session, uuid: str) -> tuple[dict, bool]:
+    """
+    Update the progress of a split job from its completed segments, the
+    sum of their durations. Returns the job and whether all segments it
+    was split into are completed.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job:
+        return {}, False
+
+    rows = session.query(Job.status, Job.duration).filter(Job.parent_uuid == uuid).all()
+    total = sum(duration or 0 for _, duration in rows)
+    done = sum(
+        duration or 0 for status, duration in rows if status == JobStatusEnum.COMPLETED
+    )
+
+    job.progress = done / total if total else 0
+    session.commit()
+
+    completed = sum(1 for status, _ in rows if status == JobStatusEnum.COMPLETED)
+    complete = bool(job.segment_count) and completed == job.segment_count
+
+    return job.as_dict(), complete
+
+
+def job_fail_segments(session: Session, uuid: str, segment: dict, error: str) -> None:
+    """
+    Make a split job a dead letter when one of its segments ran out of
+    attempts, with the error history of the segment, and fail the
+    segments that are not done.
+    """
+    jobs = (
+        session.query(Job)
+        .filter(
+            (Job.uuid == uuid)
+            | (
+                (Job.parent_uuid == uuid)
+                & Job.status.in_([JobStatusEnum.PENDING, JobStatusEnum.IN_PROGRESS])
+            )
+        )
+        .all()
+    )
+
+    for job in jobs:
+        if job.uuid != uuid:
+            set_status(session, job, JobStatusEnum.FAILED)
+            continue
+
+        set_status(session, job, JobStatusEnum.DEAD_LETTER)
+        job.error = error
+        job.error_class = segment["error_class"]
+        job.error_history = json.dumps(segment["error_history"])
+
+    session.commit()
+
+
+def job_delete_segments(session: Session, uuid: str) -> None:
+    """
+    Delete the segment jobs of a split job.
+    """
+    session.query(Job).filter(Job.parent_uuid == uuid).delete()
+    session.commit()
+
+
+def job_cancel(session: Session, uuid: str) -> list[str]:
+    """
+    Cancel a job that is queued or being transcribed, together with the
+    segments of a split job, and return the UUIDs of the cancelled jobs.
+    A cancelled refinement leaves the draft as the final result.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+    active = [JobStatusEnum.PENDING, JobStatusEnum.IN_PROGRESS]
+
+    if not job or job.status not in active:
+        return []
+
+    if job.result_stage == ResultStageEnum.DRAFT.value:
+        set_status(session, job, JobStatusEnum.COMPLETED)
+        job.result_stage = ResultStageEnum.FINAL.value
+        job.error = "Refinement cancelled"
+        job.progress = 1
+    else:
+        set_status(session, job, JobStatusEnum.CANCELLED)
+
+    job.not_before = None
+    cancelled = [job.uuid]
+
+    segments = session.query(Job).filter(
+        Job.parent_uuid == uuid, Job.status.in_(active)
+    )
+    for segment in segments:
+        set_status(session, segment, JobStatusEnum.CANCELLED)
+        cancelled.append(segment.uuid)
 
     session.commit()
 
+    return cancelled
+
+
+def job_heartbeat(session: Session, uuid: str) -> Optional[dict]:
+    """
+    Record that a worker is still processing a job, so it is not
+    cleaned up as stuck. A segment keeps its split job alive as well.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job:
+        return None
+
+    now = datetime.utcnow()
+    job.updated_at = now
+    if job.parent_uuid:
+        session.query(Job).filter(Job.uuid == job.parent_uuid).update(
+            {Job.updated_at: now}, synchronize_session=False
+        )
+    session.commit()
+
     return job.as_dict()
 
 
-def job_cleanup(session: Session) -> None:
+def job_update_media(session: Session, uuid: str, media: dict) -> Optional[dict]:
     """
-    Remove all jobs from the database.
+    Store the media information of the uploaded file on a job.
     """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job:
+        return None
+
+    job.duration = media.get("duration")
+    job.container = media.get("container")
+    job.audio_codec = media.get("audio_codec")
+    job.audio_channels = media.get("audio_channels")
+    job.audio_sample_rate = media.get("audio_sample_rate")
+    job.probed_at = datetime.utcnow()
 
-    # Get all jobs that have been in progress for more than 1 hour
-    jobs_to_delete = (
+    session.commit()
+
+    return job.as_dict()
+
+
+def job_reject_upload(session: Session, uuid: str, error: str) -> bool:
+    """
+    Fail a job whose upload can not be transcribed, unless it has left
+    the uploaded state since. Returns True if the job was failed.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job or job.status != JobStatusEnum.UPLOADED:
+        return False
+
+    # Only change the job if it is still uploaded when the change is made
+    now = datetime.utcnow()
+    rejected = (
         session.query(Job)
-        .filter(Job.updated_at < datetime.utcnow() - timedelta(hours=1))
+        .filter(Job.uuid == uuid, Job.status == JobStatusEnum.UPLOADED)
+        .update(
+            {
+                Job.status: JobStatusEnum.FAILED,
+                Job.status_at: now,
+                Job.error: error,
+                Job.probed_at: now,
+            },
+            synchronize_session=False,
+        )
+    )
+
+    if rejected:
+        event_add(session, job, JobStatusEnum.FAILED, now)
+    session.commit()
+
+    return bool(rejected)
+
+
+def job_get_unprobed(session: Session) -> list[str]:
+    """
+    Get the UUIDs of uploads whose media information was never stored,
+    e.g. because the broker stopped while probing them.
+    """
+    jobs = session.query(Job.uuid).filter(
+        Job.status == JobStatusEnum.UPLOADED,
+        Job.probed_at.is_(None),
+        Job.parent_uuid.is_(None),
+    )
+
+    return [job.uuid for job in jobs]
+
+
+def job_touch(session: Session, uuid: str) -> None:
+    """
+    Record that the files of a job were read, for LRU eviction. The
+    last update time is kept, it tells if a worker is still active.
+    """
+    now = datetime.utcnow()
+
+    session.query(Job).filter(
+        Job.uuid == uuid, Job.accessed_at < now - ACCESS_RESOLUTION
+    ).update(
+        {Job.accessed_at: now, Job.updated_at: Job.updated_at},
+        synchronize_session=False,
+    )
+    session.commit()
+
+
+def job_delete(session: Session, uuid: str) -> None:
+    """
+    Delete a job together with its segments, transcript edits and
+    search index.
+    """
+    session.query(TranscriptCue).filter(TranscriptCue.job_uuid == uuid).delete()
+    session.query(TranscriptEdit).filter(TranscriptEdit.job_uuid == uuid).delete()
+    session.query(Job).filter(Job.parent_uuid == uuid).delete()
+    session.query(Job).filter(Job.uuid == uuid).delete()
+    session.commit()
+
+
+def job_existing(session: Session, uuids: Iterable[str]) -> set[str]:
+    """
+    Get the UUIDs of the given jobs that exist.
+    """
+    return {
+        uuid for (uuid,) in session.query(Job.uuid).filter(Job.uuid.in_(list(uuids)))
+    }
+
+
+def job_update_sizes(
+    session: Session, upload_bytes: dict[str, int], result_bytes: dict[str, int]
+) -> None:
+    """
+    Store the bytes used by every job, jobs missing from the dictionaries
+    have no files.
+    """
+    rows = session.query(Job.id, Job.uuid, Job.updated_at).all()
+
+    session.bulk_update_mappings(
+        Job,
+        [
+            {
+                "id": id,
+                "upload_bytes": upload_bytes.get(uuid, 0),
+                "result_bytes": result_bytes.get(uuid, 0),
+                "updated_at": updated_at,
+            }
+            for id, uuid, updated_at in rows
+        ],
+    )
+    session.commit()
+
+
+def job_get_finished(session: Session) -> list:
+    """
+    Get the jobs no worker is using any more, least recently read first.
+    """
+    return (
+        session.query(
+            Job.uuid,
+            Job.owner,
+            Job.upload_bytes,
+            Job.result_bytes,
+            Job.accessed_at,
+            Job.transcript_version,
+        )
+        .filter(
+            Job.status.in_(
+                [
+                    JobStatusEnum.UPLOADED,
+                    JobStatusEnum.COMPLETED,
+                    JobStatusEnum.FAILED,
+                    JobStatusEnum.DEAD_LETTER,
+                    JobStatusEnum.CANCELLED,
+                ]
+            ),
+            Job.parent_uuid.is_(None),
+        )
+        .order_by(Job.accessed_at)
         .all()
     )
 
-    # Delete the jobs
-    for job in jobs_to_delete:
-        if job.status == JobStatusEnum.COMPLETED:
+
+def job_cleanup(session: Session) -> list[str]:
+    """
+    Remove jobs stuck in a wrong state from the database and return
+    their UUIDs, so their files can be deleted: uploads that never
+    completed, failed jobs that are not retried, and jobs no worker has
+    reported on for an hour. Queued jobs wait as long as admission lets
+    them, and uploads that were never submitted are left to retention.
+
+    Refinements of a published draft and segments of a split job that
+    are stuck with a worker are queued again instead. A split job waits
+    for its segments.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=1)
+
+    jobs = (
+        session.query(Job)
+        .filter(
+            Job.updated_at < cutoff,
+            Job.status.in_(
+                [
+                    JobStatusEnum.UPLOADING,
+                    JobStatusEnum.FAILED,
+                    JobStatusEnum.IN_PROGRESS,
+                ]
+            ),
+        )
+        .all()
+    )
+
+    deleted = []
+    for job in jobs:
+        if job.not_before and job.not_before > cutoff:
             continue
-        session.delete(job)
+        if job.status == JobStatusEnum.IN_PROGRESS:
+            # The heartbeat updates updated_at, status_at is when it started
+            if job.status_at > cutoff or job.segment_count:
+                continue
+            if job.parent_uuid or job.result_stage == ResultStageEnum.DRAFT.value:
+                set_status(session, job, JobStatusEnum.PENDING)
+                continue
+        deleted.append(job.uuid)
+
     session.commit()
 
+    for uuid in deleted:
+        job_delete(session, uuid)
+
+    return deleted
+
 
 if __name__ == "__main__":
     session = get_session()
@@ -1,7 +1,10 @@
+import json
+
 from pydantic import BaseModel
 from typing import Optional, List
 from uuid import uuid4
 from datetime import datetime
+from sqlalchemy import Index, UniqueConstraint
 from sqlalchemy.types import Enum as SQLAlchemyEnum
 from sqlmodel import Field
 from enum import Enum
@@ -19,6 +22,8 @@ class JobStatusEnum(str, Enum):
     UPLOADED = "uploaded"
     COMPLETED = "completed"
     FAILED = "failed"
+    DEAD_LETTER = "dead_letter"
+    CANCELLED = "cancelled"
 
 
 class JobStatus(BaseModel):
@@ -36,6 +41,15 @@ class OutputFormatEnum(str, Enum):
     CSV = "csv"
 
 
+class ResultStageEnum(str, Enum):
+    """
+    Enum representing the stage of the result served for a job.
+    """
+
+    DRAFT = "draft"
+    FINAL = "final"
+
+
 class JobType(str, Enum):
     """
     Enum representing the type of job.
@@ -77,7 +91,14 @@ class Job(SQLModel, table=True):
         default_factory=datetime.utcnow,
         description="Last updated timestamp",
     )
+    status_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Time of the last status change",
+    )
     language: str = Field(default="Swedish", description="Language used for the job")
+    detected_language: Optional[str] = Field(
+        default=None, description="Language detected by the worker if language is auto"
+    )
     model_type: str = Field(default="base", description="Model type used for the job")
     error: Optional[str] = Field(default=None, description="Error message if any")
     filename: str = Field(default="", description="Filename of the audio file")
@@ -86,6 +107,74 @@ class Job(SQLModel, table=True):
         sa_column=Field(sa_column=SQLAlchemyEnum(OutputFormatEnum)),
         description="Output format of the transcription",
     )
+    transcript_version: int = Field(
+        default=0, description="Version of the edited transcript, 0 if unedited"
+    )
+    duration: Optional[float] = Field(
+        default=None, description="Duration of the media file in seconds"
+    )
+    container: Optional[str] = Field(
+        default=None, description="Container format of the media file"
+    )
+    audio_codec: Optional[str] = Field(
+        default=None, description="Codec of the first audio stream"
+    )
+    audio_channels: Optional[int] = Field(
+        default=None, description="Channels of the first audio stream"
+    )
+    audio_sample_rate: Optional[int] = Field(
+        default=None, description="Sample rate of the first audio stream"
+    )
+    probed_at: Optional[datetime] = Field(
+        default=None, description="Time the media information was stored"
+    )
+    owner: Optional[str] = Field(
+        default=None, index=True, description="User who submitted the job"
+    )
+    upload_bytes: int = Field(default=0, description="Bytes stored for the upload")
+    result_bytes: int = Field(
+        default=0, description="Bytes stored for results, previews and edits"
+    )
+    accessed_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Last time the files of the job were read",
+    )
+    priority: int = Field(
+        default=0, index=True, description="Jobs with higher priority run first"
+    )
+    result_stage: Optional[str] = Field(
+        default=None, description="Stage of the result, draft or final"
+    )
+    refine_model: Optional[str] = Field(
+        default=None, description="Model refining the draft result once published"
+    )
+    parent_uuid: Optional[str] = Field(
+        default=None, index=True, description="UUID of the job split into segments"
+    )
+    segment_start: Optional[float] = Field(
+        default=None, description="Start of the segment in the parent upload, seconds"
+    )
+    segment_count: Optional[int] = Field(
+        default=None, description="Number of segments the job was split into"
+    )
+    progress: float = Field(default=0, description="Fraction of the audio transcribed")
+    attempts: int = Field(default=0, description="Failed attempts of the current run")
+    not_before: Optional[datetime] = Field(
+        default=None, index=True, description="Time a failed job is retried at"
+    )
+    error_class: Optional[str] = Field(
+        default=None, index=True, description="Class of the last error"
+    )
+    error_history: Optional[str] = Field(
+        default=None, description="Errors of the failed attempts as JSON"
+    )
+    quantization: str = Field(default="", description="Preferred model quantization")
+    model_name: Optional[str] = Field(
+        default=None, description="Registry model chosen for the job"
+    )
+    latency_target: Optional[float] = Field(
+        default=None, description="Seconds the transcription should take at most"
+    )
 
     def as_dict(self) -> dict:
         """
@@ -100,11 +189,38 @@ class Job(SQLModel, table=True):
             "job_type": self.job_type,
             "created_at": str(self.created_at),
             "updated_at": str(self.updated_at),
+            "status_at": str(self.status_at),
             "language": self.language,
+            "detected_language": self.detected_language,
             "model_type": self.model_type,
             "filename": self.filename,
             "output_format": self.output_format,
             "error": self.error,
+            "transcript_version": self.transcript_version,
+            "duration": self.duration,
+            "container": self.container,
+            "audio_codec": self.audio_codec,
+            "audio_channels": self.audio_channels,
+            "audio_sample_rate": self.audio_sample_rate,
+            "probed_at": str(self.probed_at) if self.probed_at else None,
+            "owner": self.owner,
+            "upload_bytes": self.upload_bytes,
+            "result_bytes": self.result_bytes,
+            "accessed_at": str(self.accessed_at),
+            "priority": self.priority,
+            "result_stage": self.result_stage,
+            "refine_model": self.refine_model,
+            "parent_uuid": self.parent_uuid,
+            "segment_start": self.segment_start,
+            "segment_count": self.segment_count,
+            "progress": self.progress,
+            "attempts": self.attempts,
+            "not_before": str(self.not_before) if self.not_before else None,
+            "error_class": self.error_class,
+            "error_history": json.loads(self.error_history or "[]"),
+            "quantization": self.quantization,
+            "model_name": self.model_name,
+            "latency_target": self.latency_target,
         }
 
 
@@ -114,3 +230,189 @@ class Jobs(BaseModel):
     """
 
     jobs: List[Job]
+
+
+class TranscriptEdit(SQLModel, table=True):
+    """
+    Model representing the cue edits that make up one transcript version.
+    """
+
+    __tablename__ = "transcript_edits"
+    __table_args__ = (UniqueConstraint("job_uuid", "version"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="Primary key")
+    job_uuid: str = Field(index=True, description="UUID of the job")
+    version: int = Field(description="Transcript version created by the edits")
+    ops: str = Field(description="Cue edits as JSON")
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Creation timestamp",
+    )
+
+
+class TenantUsage(SQLModel, table=True):
+    """
+    Model representing the audio submitted by a tenant on one day.
+    """
+
+    __tablename__ = "tenant_usage"
+    __table_args__ = (UniqueConstraint("tenant", "day"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="Primary key")
+    tenant: str = Field(description="Tenant, the user in the X-User header")
+    day: str = Field(description="UTC day as YYYY-MM-DD")
+    audio_seconds: float = Field(default=0, description="Seconds of audio submitted")
+    jobs: int = Field(default=0, description="Number of jobs submitted")
+
+
+class TranscriptCue(SQLModel, table=True):
+    """
+    Model representing a cue of a completed transcript, the rows are
+    indexed for full-text search.
+    """
+
+    __tablename__ = "transcript_cues"
+    __table_args__ = (
+        Index("ix_transcript_cues_job_position", "job_uuid", "position"),
+        Index("ix_transcript_cues_job_cue", "job_uuid", "cue_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="Primary key")
+    job_uuid: str = Field(description="UUID of the job")
+    cue_id: str = Field(description="ID of the cue in the transcript")
+    position: int = Field(description="Order of the cue in the transcript, with gaps")
+    start_ms: int = Field(description="Start time of the cue in milliseconds")
+    end_ms: int = Field(description="End time of the cue in milliseconds")
+    text: str = Field(description="Text of the cue")
+
+
+class JobEvent(SQLModel, table=True):
+    """
+    Model representing a status change of a job. Rows are only appended,
+    in the same transaction as the change.
+    """
+
+    __tablename__ = "job_events"
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="Primary key")
+    job_uuid: str = Field(index=True, description="UUID of the job")
+    from_status: Optional[str] = Field(
+        default=None, description="Status before the change, None for new jobs"
+    )
+    to_status: str = Field(description="Status after the change")
+    worker: Optional[str] = Field(
+        default=None, description="Worker that reported the change"
+    )
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Time of the change",
+    )
+    hour: datetime = Field(index=True, description="Time of the change to the hour")
+    seconds: Optional[float] = Field(
+        default=None, description="Seconds the job spent in the previous status"
+    )
+    latency_bucket: Optional[int] = Field(
+        default=None, description="Logarithmic histogram bucket of the seconds"
+    )
+    model_type: str = Field(default="", description="Model type of the job")
+    duration_bucket: str = Field(
+        default="", description="Duration range of the media file"
+    )
+
+
+class JobLatencyRollup(SQLModel, table=True):
+    """
+    Model representing the number of status changes in an hour with the
+    same statuses, model, duration range and latency bucket.
+    """
+
+    __tablename__ = "job_latency_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "hour",
+            "from_status",
+            "to_status",
+            "model_type",
+            "duration_bucket",
+            "latency_bucket",
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="Primary key")
+    hour: datetime = Field(index=True, description="Hour of the changes")
+    from_status: str = Field(description="Status before the changes")
+    to_status: str = Field(description="Status after the changes")
+    model_type: str = Field(description="Model type of the jobs")
+    duration_bucket: str = Field(description="Duration range of the media files")
+    latency_bucket: int = Field(description="Logarithmic histogram bucket")
+    count: int = Field(default=0, description="Number of changes")
+
+
+class ModelFile(SQLModel, table=True):
+    """
+    Model representing a model file in the registry, used by workers for
+    the jobs of its model type and language. Models without a language
+    are used for all languages without a model of their own.
+    """
+
+    __tablename__ = "model_files"
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="Primary key")
+    name: str = Field(index=True, unique=True, description="Name of the model")
+    model_type: str = Field(index=True, description="Model type of the jobs")
+    language: str = Field(default="", description="Language, empty for any")
+    quantization: str = Field(default="", description="Quantization, e.g. q5_0")
+    size: int = Field(description="Size of the file in bytes")
+    sha256: str = Field(description="SHA-256 checksum of the file")
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Creation timestamp",
+    )
+
+    def as_dict(self) -> dict:
+        """
+        Convert the model file to a dictionary.
+        """
+        return {
+            "name": self.name,
+            "model_type": self.model_type,
+            "language": self.language,
+            "quantization": self.quantization,
+            "size": self.size,
+            "sha256": self.sha256,
+            "created_at": str(self.created_at),
+        }
+
+
+class ModelBenchmark(SQLModel, table=True):
+    """
+    Model representing the speed and accuracy of a model in the registry
+    measured by a worker on its reference corpus.
+    """
+
+    __tablename__ = "model_benchmarks"
+    __table_args__ = (UniqueConstraint("model_name", "worker"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="Primary key")
+    model_name: str = Field(index=True, description="Name of the model")
+    worker: str = Field(description="Worker that ran the benchmark")
+    rtf: float = Field(description="Seconds of transcription per second of audio")
+    wer: float = Field(description="Word error rate on the reference corpus")
+    audio_seconds: float = Field(description="Seconds of audio in the corpus")
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Creation timestamp",
+    )
+
+    def as_dict(self) -> dict:
+        """
+        Convert the benchmark to a dictionary.
+        """
+        return {
+            "model_name": self.model_name,
+            "worker": self.worker,
+            "rtf": self.rtf,
+            "wer": self.wer,
+            "audio_seconds": self.audio_seconds,
+            "created_at": str(self.created_at),
+        }
@@ -0,0 +1,185 @@
+from datetime import datetime
+from db.models import ModelBenchmark, ModelFile
+from sqlalchemy import func
+from sqlmodel import Session
+from typing import Optional
+
+
+def registry_get_all(session: Session) -> list[dict]:
+    """
+    Get all models in the registry.
+    """
+    models = session.query(ModelFile).order_by(ModelFile.name).all()
+
+    return [model.as_dict() for model in models]
+
+
+def registry_get(session: Session, name: str) -> Optional[dict]:
+    """
+    Get a model by name.
+    """
+    model = session.query(ModelFile).filter(ModelFile.name == name).first()
+
+    return model.as_dict() if model else None
+
+
+def registry_match(
+    session: Session, model_type: str, language: str, quantization: str = ""
+) -> Optional[dict]:
+    """
+    Get the model for jobs of the given model type and language, the
+    model of the language if there is one and otherwise the most recent
+    model for any language. A variant of the given quantization is
+    preferred over the language, other variants are used without one.
+    """
+    model = (
+        session.query(ModelFile)
+        .filter(
+            ModelFile.model_type == model_type,
+            ModelFile.language.in_([language, ""]),
+        )
+        .order_by(
+            (ModelFile.quantization == quantization).desc(),
+            (ModelFile.language == "").asc(),
+            ModelFile.created_at.desc(),
+        )
+        .first()
+    )
+
+    return model.as_dict() if model else None
+
+
+def registry_add(
+    session: Session,
+    name: str,
+    model_type: str,
+    language: str,
+    quantization: str,
+    size: int,
+    sha256: str,
+) -> dict:
+    """
+    Add a model to the registry, replacing the model of the same name.
+    """
+    model = session.query(ModelFile).filter(ModelFile.name == name).first()
+
+    if not model:
+        model = ModelFile(name=name, size=size, sha256=sha256, model_type=model_type)
+        session.add(model)
+
+    # Benchmarks of a replaced model file no longer apply
+    if model.sha256 != sha256:
+        session.query(ModelBenchmark).filter(ModelBenchmark.model_name == name).delete()
+
+    model.model_type = model_type
+    model.language = language
+    model.quantization = quantization
+    model.size = size
+    model.sha256 = sha256
+    session.commit()
+
+    return model.as_dict()
+
+
+def registry_delete(session: Session, name: str) -> Optional[dict]:
+    """
+    Remove a model from the registry, returning the removed model.
+    """
+    model = session.query(ModelFile).filter(ModelFile.name == name).first()
+
+    if not model:
+        return None
+
+    session.query(ModelBenchmark).filter(ModelBenchmark.model_name == name).delete()
+    session.delete(model)
+    session.commit()
+
+    return model.as_dict()
+
+
+def registry_in_use(session: Session, sha256: str) -> bool:
+    """
+    Check if a model file is used by any model in the registry.
+    """
+    return (
+        session.query(ModelFile).filter(ModelFile.sha256 == sha256).first() is not None
+    )
+
+
+def registry_get_benchmarks(session: Session) -> list[dict]:
+    """
+    Get the benchmarks of all models by all workers.
+    """
+    benchmarks = (
+        session.query(ModelBenchmark)
+        .order_by(ModelBenchmark.model_name, ModelBenchmark.worker)
+        .all()
+    )
+
+    return [benchmark.as_dict() for benchmark in benchmarks]
+
+
+def registry_add_benchmark(
+    session: Session,
+    name: str,
+    worker: str,
+    rtf: float,
+    wer: float,
+    audio_seconds: float,
+) -> dict:
+    """
+    Add the benchmark of a model by a worker, replacing its earlier
+    benchmark of the model.
+    """
+    benchmark = (
+        session.query(ModelBenchmark)
+        .filter(ModelBenchmark.model_name == name, ModelBenchmark.worker == worker)
+        .first()
+    )
+
+    if not benchmark:
+        benchmark = ModelBenchmark(
+            model_name=name, worker=worker, rtf=rtf, wer=wer, audio_seconds=0
+        )
+        session.add(benchmark)
+
+    benchmark.rtf = rtf
+    benchmark.wer = wer
+    benchmark.audio_seconds = audio_seconds
+    benchmark.created_at = datetime.utcnow()
+    session.commit()
+
+    return benchmark.as_dict()
+
+
+def registry_choose(
+    session: Session, language: str, seconds: float, latency_target: float
+) -> Optional[dict]:
+    """
+    Choose the most accurate model for the language that transcribes the
+    given seconds of audio within the latency target, or the fastest
+    model if none does. Speed is the real-time factor of the slowest
+    worker, accuracy the mean word error rate over the workers, models
+    without benchmarks are not chosen.
+    """
+    rows = (
+        session.query(
+            ModelFile, func.max(ModelBenchmark.rtf), func.avg(ModelBenchmark.wer)
+        )
+        .join(ModelBenchmark, ModelBenchmark.model_name == ModelFile.name)
+        .filter(ModelFile.language.in_([language, ""]))
+        .group_by(ModelFile.id)
+        .all()
+    )
+
+    if not rows:
+        return None
+
+    fast = [row for row in rows if seconds * row[1] <= latency_target]
+
+    if fast:
+        model, _, _ = min(fast, key=lambda row: (row[2], row[1]))
+    else:
+        model, _, _ = min(rows, key=lambda row: row[1])
+
+    return model.as_dict()
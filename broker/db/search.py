@@ -0,0 +1,247 @@
+import re
+
+from db.models import TranscriptCue
+from sqlalchemy import Engine, insert, text
+from typing import Optional
+from sqlmodel import Session
+
+# Distance between the positions of indexed cues, so a cue inserted by
+# an edit gets a position between its neighbours without moving others
+POSITION_GAP = 1024
+
+# Full-text index over the cue text, kept in sync by the triggers
+SEARCH_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS transcript_search USING fts5(
+        text,
+        content='transcript_cues',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transcript_cues_ai AFTER INSERT ON transcript_cues
+    BEGIN
+        INSERT INTO transcript_search(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transcript_cues_ad AFTER DELETE ON transcript_cues
+    BEGIN
+        INSERT INTO transcript_search(transcript_search, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS transcript_cues_au AFTER UPDATE OF text ON transcript_cues
+    BEGIN
+        INSERT INTO transcript_search(transcript_search, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO transcript_search(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+SEARCH_QUERY = """
+    SELECT
+        c.job_uuid,
+        c.cue_id,
+        (
+            SELECT COUNT(*) FROM transcript_cues AS p
+            WHERE p.job_uuid = c.job_uuid AND p.position < c.position
+        ) AS cue_index,
+        c.start_ms,
+        c.end_ms,
+        j.filename,
+        snippet(transcript_search, 0, '<mark>', '</mark>', '…', 16) AS snippet,
+        bm25(transcript_search) AS score
+    FROM transcript_search
+    JOIN transcript_cues AS c ON c.id = transcript_search.rowid
+    JOIN jobs AS j ON j.uuid = c.job_uuid
+    WHERE transcript_search MATCH :query {job_filter}
+    ORDER BY score
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def search_supported(engine: Engine) -> bool:
+    """
+    Full-text search uses SQLite FTS5.
+    """
+    return engine.dialect.name == "sqlite"
+
+
+def create_search_index(engine: Engine) -> None:
+    """
+    Create the full-text index and the triggers that maintain it.
+    """
+    if not search_supported(engine):
+        return
+
+    with engine.begin() as connection:
+        for statement in SEARCH_SCHEMA:
+            connection.execute(text(statement))
+
+
+def search_query(query: str) -> Optional[str]:
+    """
+    Turn user input into an FTS5 query matching all words, the last
+    one as a prefix so results show up while typing.
+    Returns None if there is nothing to search for.
+    """
+    if not (words := re.findall(r"\w+", query)):
+        return None
+
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def search_index_transcript(session: Session, uuid: str, cues: list[dict]) -> None:
+    """
+    Index the cues of a transcript, replacing what was indexed before.
+    """
+    session.query(TranscriptCue).filter(TranscriptCue.job_uuid == uuid).delete()
+
+    if cues:
+        session.execute(
+            insert(TranscriptCue),
+            [
+                {
+                    "job_uuid": uuid,
+                    "cue_id": cue["id"],
+                    "position": index * POSITION_GAP,
+                    "start_ms": cue["start_ms"],
+                    "end_ms": cue["end_ms"],
+                    "text": cue["text"],
+                }
+                for index, cue in enumerate(cues)
+            ],
+        )
+
+    session.commit()
+
+
+def search_apply_edits(session: Session, uuid: str, ops: list[dict]) -> None:
+    """
+    Apply cue edits to the index of a transcript, without committing so
+    the index changes together with the transcript version.
+
+    Edits are applied the same way as subtitles.apply_edits(), edits of
+    unknown cues are ignored. Only the edited cues are written, unless
+    an inserted cue finds no gap between the positions of its neighbours
+    and the positions of the transcript are spread out again.
+    """
+    cues = session.query(TranscriptCue).filter(TranscriptCue.job_uuid == uuid)
+
+    # Transcripts are indexed when their result arrives
+    if not cues.first():
+        return
+
+    def find(cue_id: str) -> Optional[TranscriptCue]:
+        return cues.filter(TranscriptCue.cue_id == cue_id).first()
+
+    def position_after(cue: Optional[TranscriptCue]) -> Optional[int]:
+        """
+        Get a free position after a cue, or before the first cue.
+        """
+        ordered = cues.order_by(TranscriptCue.position)
+
+        if cue is None:
+            following = ordered.first()
+            return following.position - POSITION_GAP if following else 0
+
+        following = ordered.filter(TranscriptCue.position > cue.position).first()
+        if not following:
+            return cue.position + POSITION_GAP
+        if following.position - cue.position < 2:
+            return None
+
+        return (cue.position + following.position) // 2
+
+    def respace() -> None:
+        for index, cue in enumerate(cues.order_by(TranscriptCue.position)):
+            cue.position = index * POSITION_GAP
+        session.flush()
+
+    for op in ops:
+        match op["op"]:
+            case "insert":
+                if find(op["id"]):
+                    continue
+
+                if (after := op.get("after")) is None:
+                    cue = None
+                elif not (cue := find(after)):
+                    continue
+
+                if (position := position_after(cue)) is None:
+                    respace()
+                    position = position_after(cue)
+
+                session.add(
+                    TranscriptCue(
+                        job_uuid=uuid,
+                        cue_id=op["id"],
+                        position=position,
+                        start_ms=op["start_ms"],
+                        end_ms=op["end_ms"],
+                        text=op["text"],
+                    )
+                )
+                session.flush()
+            case "update":
+                if cue := find(op["id"]):
+                    for key in ("start_ms", "end_ms", "text"):
+                        if key in op:
+                            setattr(cue, key, op[key])
+                    session.flush()
+            case "delete":
+                if cue := find(op["id"]):
+                    session.delete(cue)
+                    session.flush()
+
+
+def search_delete_transcript(session: Session, uuid: str) -> None:
+    """
+    Remove a transcript from the index.
+    """
+    session.query(TranscriptCue).filter(TranscriptCue.job_uuid == uuid).delete()
+    session.commit()
+
+
+def search_transcripts(
+    session: Session,
+    query: str,
+    job_uuid: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[dict]:
+    """
+    Search all indexed transcripts, best matches first.
+    """
+    if not (match := search_query(query)):
+        return []
+
+    params = {"query": match, "limit": limit, "offset": offset}
+    job_filter = ""
+
+    if job_uuid:
+        job_filter = "AND c.job_uuid = :job_uuid"
+        params["job_uuid"] = job_uuid
+
+    rows = session.execute(
+        text(SEARCH_QUERY.format(job_filter=job_filter)), params
+    ).mappings()
+
+    return [
+        {
+            "uuid": row["job_uuid"],
+            "filename": row["filename"],
+            "cue_id": row["cue_id"],
+            "cue_index": row["cue_index"] + 1,
+            "start_ms": row["start_ms"],
+            "end_ms": row["end_ms"],
+            "snippet": row["snippet"],
+            "score": row["score"],
+        }
+        for row in rows
+    ]
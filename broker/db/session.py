@@ -1,18 +1,71 @@
 from functools import lru_cache
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from functools import wraps
 from sqlmodel import SQLModel
+from db.search import create_search_index
 from settings import get_settings
 
 settings = get_settings()
 
 
+def upgrade_schema(engine: Engine) -> None:
+    """
+    Add the columns and indexes of the models missing in tables created
+    by an earlier version, create_all() only creates missing tables.
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} "
+                        f"ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+
+                # Existing rows get the default of the column, taken when
+                # upgrading for defaults computed for every row, without
+                # touching their update timestamps
+                if column.default is not None:
+                    default = column.default.arg
+                    if callable(default):
+                        default = default(None)
+                    values = {
+                        other.name: other
+                        for other in table.columns
+                        if other.onupdate is not None and other.name in columns
+                    }
+                    values[column.name] = default
+                    connection.execute(table.update().values(values))
+
+                print(f"Added column {column.name} to table {table.name}")
+
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+
+
 @lru_cache
 def init():
     db_url = settings.DATABASE_URL
     engine = create_engine(db_url, connect_args={"check_same_thread": False})
     SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+    create_search_index(engine)
     return sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -0,0 +1,58 @@
+import json
+
+from db.models import Job, TranscriptEdit
+from db.search import search_apply_edits
+from typing import Optional
+from sqlmodel import Session
+
+
+def transcript_add_edits(
+    session: Session, uuid: str, version: int, ops: list[dict]
+) -> Optional[int]:
+    """
+    Store cue edits as a new version on top of the given version.
+    Returns the new version, or None if the transcript has changed since.
+    """
+    job = session.query(Job).filter(Job.uuid == uuid).first()
+
+    if not job or job.transcript_version != version:
+        return None
+
+    job.transcript_version = version + 1
+    session.add(TranscriptEdit(job_uuid=uuid, version=version + 1, ops=json.dumps(ops)))
+    search_apply_edits(session, uuid, ops)
+    session.commit()
+
+    return job.transcript_version
+
+
+def transcript_get_edits(
+    session: Session, uuid: str, version: int, after: int = 0
+) -> list[list]:
+    """
+    Get the cue edits of the versions after the given base version up to
+    the given version, in order.
+    """
+    rows = (
+        session.query(TranscriptEdit.ops)
+        .filter(
+            TranscriptEdit.job_uuid == uuid,
+            TranscriptEdit.version > after,
+            TranscriptEdit.version <= version,
+        )
+        .order_by(TranscriptEdit.version)
+    )
+
+    return [json.loads(row.ops) for row in rows]
+
+
+def transcript_reset(session: Session, uuid: str) -> None:
+    """
+    Remove all edits of a transcript, e.g. when a new result replaces it.
+    """
+    session.query(TranscriptEdit).filter(TranscriptEdit.job_uuid == uuid).delete()
+
+    if job := session.query(Job).filter(Job.uuid == uuid).first():
+        job.transcript_version = 0
+
+    session.commit()
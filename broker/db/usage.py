@@ -0,0 +1,34 @@
+from db.models import TenantUsage
+from sqlmodel import Session
+
+
+def usage_get_day(session: Session, day: str) -> dict[str, tuple[float, int]]:
+    """
+    Get the audio seconds and jobs submitted per tenant on a day.
+    """
+    rows = session.query(TenantUsage).filter(TenantUsage.day == day)
+
+    return {row.tenant: (row.audio_seconds, row.jobs) for row in rows}
+
+
+def usage_save(
+    session: Session, usage: dict[tuple[str, str], tuple[float, int]]
+) -> None:
+    """
+    Store the usage per (tenant, day), replacing the stored totals.
+    """
+    for (tenant, day), (audio_seconds, jobs) in usage.items():
+        row = (
+            session.query(TenantUsage)
+            .filter(TenantUsage.tenant == tenant, TenantUsage.day == day)
+            .first()
+        )
+
+        if not row:
+            row = TenantUsage(tenant=tenant, day=day)
+            session.add(row)
+
+        row.audio_seconds = audio_seconds
+        row.jobs = jobs
+
+    session.commit()
@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+from db.job import job_get_next, job_requeue
+from db.session import get_session
+from fastapi import WebSocket
+from typing import Callable
+
+db_session = get_session()
+
+# Seconds a worker has to acknowledge an assignment before the job is
+# given to another worker
+ACK_TIMEOUT = 10
+
+# Seconds between checks for unacknowledged assignments
+CHECK_INTERVAL = 1
+
+
+class WorkerConnection:
+    """
+    A worker connected over a WebSocket, with the number of jobs it can
+    take and the models it recently used.
+    """
+
+    def __init__(self, websocket: WebSocket) -> None:
+        self.websocket = websocket
+        self.name = ""
+        self.free = 0
+        self.warm: set[tuple[str, str]] = set()
+        self.unacked: dict[str, float] = {}
+
+    def update(self, message: dict) -> None:
+        """
+        Update the worker from a status message. Jobs sent to the worker
+        but not yet acknowledged are not counted in its free slots yet.
+        """
+        self.name = str(message.get("name", self.name))
+        self.free = max(int(message.get("free", 0)) - len(self.unacked), 0)
+        self.warm = {
+            (str(language), str(model_type))
+            for language, model_type in message.get("warm", [])
+        }
+
+    def prefers(self, job: dict) -> tuple[bool, int]:
+        """
+        Sort key preferring workers with the model of the job warm, then
+        workers with more free slots.
+        """
+        return (job["language"], job["model_type"]) in self.warm, self.free
+
+
+class Dispatcher:
+    """
+    Push pending jobs to connected workers as soon as they are queued,
+    instead of waiting for the workers to poll for them.
+
+    Jobs are claimed the same way as by polling workers, so both kinds
+    of workers can share a queue. A job is given back to the queue if the
+    worker refuses it, does not acknowledge it in time or disconnects
+    before acknowledging it.
+    """
+
+    def __init__(self) -> None:
+        self.workers: set[WorkerConnection] = set()
+        self.wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """
+        Wake up the dispatcher, a job was queued or a worker has free slots.
+        """
+        self.wakeup.set()
+
+    def connect(self, worker: WorkerConnection) -> None:
+        self.workers.add(worker)
+
+    def disconnect(self, worker: WorkerConnection) -> None:
+        """
+        Forget a worker and requeue the jobs it never acknowledged.
+        """
+        self.workers.discard(worker)
+
+        for uuid in list(worker.unacked):
+            self.requeue(worker, uuid)
+
+    async def ack(self, worker: WorkerConnection, uuid: str) -> None:
+        """
+        Accept the acknowledgement of a job. A job acknowledged after it
+        was given back to the queue may already run on another worker, so
+        the late worker is told to stop it.
+        """
+        if worker.unacked.pop(uuid, None) is not None:
+            return
+
+        print(f"Stopping job {uuid} acknowledged late by worker {worker.name}")
+
+        try:
+            await worker.websocket.send_json({"type": "cancel", "uuids": [uuid]})
+        except Exception as e:
+            print(f"Error sending cancel to worker {worker.name}: {e}")
+            self.disconnect(worker)
+
+    def requeue(self, worker: WorkerConnection, uuid: str) -> None:
+        """
+        Give an unacknowledged job back to the queue.
+        """
+        if worker.unacked.pop(uuid, None) is None:
+            return
+
+        print(f"Requeuing job {uuid} not accepted by worker {worker.name}")
+        job_requeue(db_session, uuid)
+        self.notify()
+
+    async def cancel(self, uuids: list[str]) -> None:
+        """
+        Tell the connected workers to stop cancelled jobs. The worker
+        running a job kills its processes, the others ignore the message.
+        """
+        for worker in list(self.workers):
+            for uuid in uuids:
+                worker.unacked.pop(uuid, None)
+
+            try:
+                await worker.websocket.send_json({"type": "cancel", "uuids": uuids})
+            except Exception as e:
+                print(f"Error sending cancel to worker {worker.name}: {e}")
+                self.disconnect(worker)
+
+    def requeue_expired(self) -> None:
+        deadline = time.monotonic() - ACK_TIMEOUT
+
+        for worker in list(self.workers):
+            for uuid, sent in list(worker.unacked.items()):
+                if sent < deadline:
+                    self.requeue(worker, uuid)
+
+    async def dispatch(self, payload: Callable[[dict], dict]) -> None:
+        """
+        Assign pending jobs to workers with free slots.
+        """
+        while workers := [worker for worker in self.workers if worker.free > 0]:
+            job = job_get_next(db_session)
+
+            if not job:
+                return
+
+            worker = max(workers, key=lambda worker: worker.prefers(job))
+            worker.free -= 1
+            worker.unacked[job["uuid"]] = time.monotonic()
+
+            try:
+                await worker.websocket.send_json({"type": "job", "job": payload(job)})
+            except Exception as e:
+                print(f"Error sending job {job['uuid']} to worker {worker.name}: {e}")
+                self.disconnect(worker)
+
+    async def run(self, payload: Callable[[dict], dict]) -> None:
+        """
+        Dispatch jobs whenever woken up, describing each job for the
+        worker with payload().
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), CHECK_INTERVAL)
+            except TimeoutError:
+                pass
+
+            self.wakeup.clear()
+            self.requeue_expired()
+
+            try:
+                await self.dispatch(payload)
+            except Exception as e:
+                print(f"Error dispatching jobs: {e}")
+
+
+dispatcher = Dispatcher()
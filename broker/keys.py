@@ -0,0 +1,41 @@
+from db.models import OutputFormatEnum
+from settings import get_settings
+
+settings = get_settings()
+
+
+def preview_key(job_id: str) -> str:
+    return f"{job_id}.preview.mp4"
+
+
+def peaks_key(job_id: str) -> str:
+    return f"{job_id}.peaks.json"
+
+
+def edited_key(job_id: str, version: int) -> str:
+    """
+    Get the storage key of a rendered version of an edited transcript.
+    """
+    return f"{job_id}.v{version}.srt"
+
+
+def draft_key(job_id: str, output_format: str) -> str:
+    """
+    Get the storage key of the draft result kept after it is refined.
+    """
+    return f"{job_id}.draft.{OutputFormatEnum(output_format).value}"
+
+
+def snapshot_key(job_id: str, version: int) -> str:
+    """
+    Get the storage key of the saved cues of a transcript version.
+    """
+    return f"{job_id}.s{version}.json"
+
+
+def snapshot_version(version: int) -> int:
+    """
+    Get the latest version up to the given one with a snapshot, saved
+    every TRANSCRIPT_SNAPSHOT_VERSIONS versions, or 0 for none.
+    """
+    return version - version % settings.TRANSCRIPT_SNAPSHOT_VERSIONS
@@ -0,0 +1,373 @@
+import json
+import numpy as np
+import subprocess
+import tempfile
+import threading
+
+from db.job import job_reject_upload, job_update_media
+from db.session import handle_database_errors
+from keys import peaks_key, preview_key
+from pathlib import Path
+from serving import precompress
+from settings import get_settings
+from storage import Storage, get_result_storage, get_upload_storage
+from typing import Optional
+
+settings = get_settings()
+
+# Sample rate of the audio the peaks are computed from
+SAMPLE_RATE = 16000
+
+# Signatures of common file types that are certainly not audio or video,
+# as (offset, magic bytes, description)
+NON_MEDIA_SIGNATURES = [
+    (0, b"%PDF-", "PDF document"),
+    (0, b"PK\x03\x04", "ZIP archive or office document"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "office document"),
+    (0, b"\x89PNG\r\n\x1a\n", "PNG image"),
+    (0, b"\xff\xd8\xff", "JPEG image"),
+    (0, b"GIF87a", "GIF image"),
+    (0, b"GIF89a", "GIF image"),
+    (0, b"\x1f\x8b", "gzip archive"),
+    (0, b"7z\xbc\xaf\x27\x1c", "7-Zip archive"),
+    (0, b"Rar!\x1a\x07", "RAR archive"),
+    (0, b"MZ", "executable"),
+    (0, b"\x7fELF", "executable"),
+    (0, b"SQLite format 3\x00", "SQLite database"),
+    (0, b"{\\rtf", "RTF document"),
+    (0, b"<!DOCTYPE", "HTML document"),
+    (0, b"<html", "HTML document"),
+    (0, b"<?xml", "XML document"),
+    (8, b"WEBP", "WebP image"),
+]
+
+# Number of bytes needed to check all signatures
+SNIFF_SIZE = max(offset + len(magic) for offset, magic, _ in NON_MEDIA_SIGNATURES)
+
+# Length of the quiet stretch looked for around a cut point, seconds
+SILENCE_WINDOW = 0.5
+
+# Limit the number of concurrent ffmpeg processes on the broker
+media_slots = threading.BoundedSemaphore(settings.MEDIA_WORKERS)
+
+
+class MediaError(Exception):
+    """
+    Raised when an upload can not be transcribed.
+    """
+
+
+def sniff_non_media(head: bytes) -> Optional[str]:
+    """
+    Check the first bytes of a file against file types that are certainly
+    not media, returning a description of the file type if one matches.
+    """
+    for offset, magic, description in NON_MEDIA_SIGNATURES:
+        if head[offset : offset + len(magic)] == magic:
+            return description
+
+    return None
+
+
+def media_input(storage: Storage, key: str) -> str:
+    """
+    Get a path or URL that ffmpeg can read the object from.
+    """
+    if file_path := storage.local_path(key):
+        return str(file_path)
+
+    return storage.presign_get(key)
+
+
+def probe_upload(job_id: str) -> dict:
+    """
+    Get the duration, container and first audio stream of the upload
+    with ffprobe. Raises MediaError if the file is not a media file or
+    has no audio.
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_format",
+        "-show_streams",
+        "-of",
+        "json",
+        media_input(get_upload_storage(), job_id),
+    ]
+
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise MediaError(
+            f"Not a supported media file: {result.stderr.decode().strip()}"
+        )
+
+    info = json.loads(result.stdout)
+    media_format = info.get("format", {})
+    audio = next(
+        (
+            stream
+            for stream in info.get("streams", [])
+            if stream.get("codec_type") == "audio"
+        ),
+        None,
+    )
+
+    if not audio:
+        raise MediaError("The file has no audio stream")
+
+    def number(value, cast):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "duration": number(
+            media_format.get("duration") or audio.get("duration"), float
+        ),
+        "container": media_format.get("format_name"),
+        "audio_codec": audio.get("codec_name"),
+        "audio_channels": number(audio.get("channels"), int),
+        "audio_sample_rate": number(audio.get("sample_rate"), int),
+    }
+
+
+@handle_database_errors
+def store_probe(job_id: str, media: dict, session=None) -> None:
+    """
+    Store the media information on the job.
+    """
+    job_update_media(session, job_id, media)
+
+
+@handle_database_errors
+def reject_upload(job_id: str, error: str, session=None) -> None:
+    """
+    Fail the job of an upload that can not be transcribed and remove the
+    file. An upload that was submitted meanwhile is left to the worker.
+    """
+    if not job_reject_upload(session, job_id, error):
+        print(f"Not rejecting upload {job_id}, it is no longer waiting: {error}")
+        return
+
+    print(f"Rejecting upload {job_id}: {error}")
+    get_upload_storage().delete(job_id)
+
+
+def generate_preview(job_id: str) -> bool:
+    """
+    Create a low bitrate rendition of the upload for the subtitle editor.
+    Audio only uploads result in an audio only MP4.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = Path(tmp_dir) / preview_key(job_id)
+        command = [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            media_input(get_upload_storage(), job_id),
+            "-map",
+            "0:v:0?",
+            "-map",
+            "0:a:0?",
+            "-vf",
+            f"scale=-2:'min({settings.PREVIEW_HEIGHT},ih)'",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-b:v",
+            settings.PREVIEW_VIDEO_BITRATE,
+            "-c:a",
+            "aac",
+            "-ac",
+            "1",
+            "-b:a",
+            settings.PREVIEW_AUDIO_BITRATE,
+            "-movflags",
+            "+faststart",
+            "-f",
+            "mp4",
+            "-y",
+            str(output_path),
+        ]
+
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode != 0:
+            print(f"Error creating preview for {job_id}: {result.stderr.decode()}")
+            return False
+
+        with open(output_path, "rb") as fd:
+            get_result_storage().save(preview_key(job_id), fd)
+
+    return True
+
+
+def compute_peaks(stream, samples_per_bucket: int) -> np.ndarray:
+    """
+    Compute the minimum and maximum sample of every bucket from a
+    stream of 16 bit mono PCM, reading a bounded chunk at a time.
+    """
+    peaks = []
+    remainder = np.empty(0, dtype=np.int16)
+
+    while chunk := stream.read(samples_per_bucket * 2 * 1024):
+        samples = np.concatenate([remainder, np.frombuffer(chunk, dtype="<i2")])
+        whole = len(samples) - len(samples) % samples_per_bucket
+        buckets = samples[:whole].reshape(-1, samples_per_bucket)
+        peaks.append(np.stack([buckets.min(axis=1), buckets.max(axis=1)], axis=1))
+        remainder = samples[whole:]
+
+    if len(remainder):
+        peaks.append(np.array([[remainder.min(), remainder.max()]], dtype=np.int16))
+
+    if not peaks:
+        return np.empty((0, 2), dtype=np.int16)
+
+    return np.concatenate(peaks)
+
+
+def generate_peaks(job_id: str) -> bool:
+    """
+    Create a waveform peaks file from the 16 kHz mono audio of the upload,
+    in the JSON format used by audiowaveform with 8 bit resolution.
+    """
+    samples_per_bucket = settings.PEAKS_SAMPLES_PER_BUCKET
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        media_input(get_upload_storage(), job_id),
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        str(SAMPLE_RATE),
+        "-f",
+        "s16le",
+        "-",
+    ]
+
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    peaks = compute_peaks(process.stdout, samples_per_bucket)
+
+    if process.wait() != 0:
+        print(f"Error creating peaks for {job_id}: ffmpeg exited {process.returncode}")
+        return False
+
+    data = (peaks.astype(np.int32) >> 8).astype(np.int8)
+    waveform = {
+        "version": 2,
+        "channels": 1,
+        "sample_rate": SAMPLE_RATE,
+        "samples_per_pixel": samples_per_bucket,
+        "bits": 8,
+        "length": len(data),
+        "data": data.ravel().tolist(),
+    }
+
+    with tempfile.TemporaryFile() as fd:
+        fd.write(json.dumps(waveform, separators=(",", ":")).encode())
+        fd.seek(0)
+        get_result_storage().save(peaks_key(job_id), fd)
+
+    precompress(get_result_storage(), peaks_key(job_id))
+
+    return True
+
+
+def load_peaks(job_id: str) -> Optional[dict]:
+    """
+    Get the waveform peaks of an upload, or None if there are none.
+    """
+    storage = get_result_storage()
+
+    if not storage.exists(peaks_key(job_id)):
+        return None
+
+    with storage.open(peaks_key(job_id)) as fd:
+        return json.loads(fd.read())
+
+
+def quietest_point(
+    amplitude: np.ndarray, bucket_seconds: float, target: float, search: float
+) -> float:
+    """
+    Get the middle of the quietest stretch of audio within search seconds
+    of the target, given the peak to peak amplitude of every bucket.
+    """
+    window = max(1, round(SILENCE_WINDOW / bucket_seconds))
+    first = max(0, int((target - search) / bucket_seconds))
+    last = min(len(amplitude), int((target + search) / bucket_seconds) + 1)
+
+    if last - first < window:
+        return target
+
+    loudness = np.convolve(amplitude[first:last], np.ones(window), mode="valid")
+    quietest = first + int(np.argmin(loudness)) + window / 2
+
+    return quietest * bucket_seconds
+
+
+def split_segments(job_id: str, duration: float) -> list[tuple[float, float]]:
+    """
+    Get the (start, duration) segments a long upload is transcribed in,
+    about SPLIT_SEGMENT_SECONDS each. Every cut is moved to the quietest
+    moment near it, found in the waveform peaks, so words are not cut in
+    half. Each segment runs SPLIT_OVERLAP_SECONDS past the next cut, so
+    speech crossing a cut is complete in the segment before it.
+    """
+    count = max(1, round(duration / settings.SPLIT_SEGMENT_SECONDS))
+    cuts = [duration * index / count for index in range(1, count)]
+
+    if cuts and (waveform := load_peaks(job_id)):
+        data = np.array(waveform["data"], dtype=np.int16).reshape(-1, 2)
+        amplitude = data[:, 1] - data[:, 0]
+        bucket_seconds = waveform["samples_per_pixel"] / waveform["sample_rate"]
+        search = min(settings.SPLIT_SEARCH_SECONDS, duration / count / 2)
+        cuts = [quietest_point(amplitude, bucket_seconds, cut, search) for cut in cuts]
+
+    starts = [0.0] + cuts
+    ends = [min(cut + settings.SPLIT_OVERLAP_SECONDS, duration) for cut in cuts]
+    ends.append(duration)
+
+    return [(start, end - start) for start, end in zip(starts, ends)]
+
+
+def check_upload(job_id: str) -> bool:
+    """
+    Probe an upload and store its media information, or reject it if it
+    can not be transcribed. The upload can not be submitted before this
+    is done. Returns False if the upload was rejected.
+    """
+    try:
+        store_probe(job_id, probe_upload(job_id))
+    except MediaError as e:
+        reject_upload(job_id, str(e))
+        return False
+    except Exception as e:
+        print(f"Error probing upload {job_id}: {e}")
+        store_probe(job_id, {})
+
+    return True
+
+
+def process_upload(job_id: str) -> None:
+    """
+    Background processing of a completed upload. The upload is probed
+    first so files that can not be transcribed are rejected right away.
+    """
+    if not check_upload(job_id) or not settings.PREVIEW_ENABLED:
+        return
+
+    with media_slots:
+        try:
+            generate_peaks(job_id)
+            generate_preview(job_id)
+        except Exception as e:
+            print(f"Error processing upload {job_id}: {e}")
@@ -0,0 +1,179 @@
+from admission import AdmissionError, admission, tenant_of
+from db.session import get_session
+from fastapi.responses import JSONResponse
+from media import SNIFF_SIZE, sniff_non_media
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Optional
+
+# Give up looking for the file in a multipart body after this many bytes
+SNIFF_LIMIT = 64 * 1024
+
+db_session = get_session()
+
+
+def admission_response(error: AdmissionError) -> JSONResponse:
+    """
+    Answer a request that was not admitted, telling when to retry.
+    """
+    return JSONResponse(
+        content={
+            "result": {
+                "error": f"{error}, retry in {error.retry_after} seconds",
+                "retry_after": error.retry_after,
+            }
+        },
+        status_code=error.status_code,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def multipart_boundary(content_type: str) -> Optional[bytes]:
+    """
+    Get the boundary of a multipart/form-data content type.
+    """
+    media_type, _, params = content_type.partition(";")
+    if media_type.strip().lower() != "multipart/form-data":
+        return None
+
+    for param in params.split(";"):
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary" and value:
+            return value.strip('"').encode()
+
+    return None
+
+
+def sniff_multipart(data: bytes, boundary: bytes, complete: bool) -> tuple[bool, str]:
+    """
+    Look for the first file in the start of a multipart body and check
+    its first bytes. Returns whether the check is done and, if the file
+    is certainly not media, a description of what it is.
+    """
+    delimiter = b"--" + boundary
+    position = 0
+
+    while (start := data.find(delimiter, position)) >= 0:
+        header_end = data.find(b"\r\n\r\n", start)
+        if header_end < 0:
+            break
+
+        headers = data[start:header_end]
+        content_start = header_end + 4
+
+        if b"filename=" in headers:
+            head = data[content_start : content_start + SNIFF_SIZE]
+            if len(head) < SNIFF_SIZE and not complete:
+                break
+
+            return True, sniff_non_media(head) or ""
+
+        position = content_start
+
+    return complete, ""
+
+
+class UploadSniffMiddleware:
+    """
+    Check the magic bytes of files uploaded as multipart forms while the
+    body is still streaming, so files that are certainly not media are
+    rejected with 415 before the rest of the body is read.
+    """
+
+    def __init__(self, app: ASGIApp, paths: list[str]) -> None:
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        boundary = multipart_boundary(headers.get(b"content-type", b"").decode())
+
+        if not boundary:
+            await self.app(scope, receive, send)
+            return
+
+        messages: list[Message] = []
+        data = b""
+        file_type = ""
+
+        while True:
+            message = await receive()
+            messages.append(message)
+
+            if message["type"] != "http.request":
+                break
+
+            data += message.get("body", b"")
+            complete = not message.get("more_body", False)
+            done, file_type = sniff_multipart(data, boundary, complete)
+
+            if done or complete or len(data) > SNIFF_LIMIT:
+                break
+
+        if file_type:
+            response = JSONResponse(
+                content={
+                    "result": {"error": f"Not an audio or video file: {file_type}"}
+                },
+                status_code=415,
+            )
+            await response(scope, receive, send)
+            return
+
+        async def replay() -> Message:
+            if messages:
+                return messages.pop(0)
+
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+
+class AdmissionMiddleware:
+    """
+    Admit uploads before their body is read, so a full disk or a deep
+    queue is reported to the client instead of accepting gigabytes that
+    can not be stored or transcribed. The size of admitted uploads is
+    counted as in flight until the request is done.
+    """
+
+    def __init__(self, app: ASGIApp, paths: list[str]) -> None:
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        tenant = tenant_of(headers.get(b"x-user", b"").decode())
+
+        try:
+            size = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            size = 0
+
+        try:
+            admission.check_upload(db_session, tenant, size)
+        except AdmissionError as e:
+            print(f"Upload of {size} bytes by {tenant} not admitted: {e}")
+            await admission_response(e)(scope, receive, send)
+            return
+
+        admission.inflight_bytes += size
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.inflight_bytes -= size
@@ -0,0 +1,157 @@
+import time
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from db.job import (
+    job_delete,
+    job_existing,
+    job_get_finished,
+    job_update_sizes,
+)
+from db.models import OutputFormatEnum
+from db.session import handle_database_errors
+from itertools import islice
+from keys import (
+    draft_key,
+    edited_key,
+    peaks_key,
+    preview_key,
+    snapshot_key,
+    snapshot_version,
+)
+from serving import delete_with_variants
+from settings import get_settings
+from sqlmodel import Session
+from storage import Storage, get_result_storage, get_upload_storage
+from typing import Iterable, Iterator, Optional
+
+settings = get_settings()
+
+
+def job_uuid(key: str) -> str:
+    """
+    Get the UUID of the job an object belongs to, all keys start with it.
+    """
+    return key.split(".", 1)[0]
+
+
+def batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def scan_storage(session: Session, storage: Storage) -> dict[str, int]:
+    """
+    Sum the bytes stored per job and delete objects of jobs that no
+    longer exist, looking the jobs up one batch of objects at a time.
+    Objects younger than the orphan grace period are kept, their job
+    may still be uploading.
+    """
+    sizes = defaultdict(int)
+    grace = time.time() - settings.RETENTION_ORPHAN_GRACE
+
+    for batch in batches(storage.list_objects(), settings.RETENTION_BATCH_SIZE):
+        existing = job_existing(session, {job_uuid(key) for key, _, _ in batch})
+
+        for key, size, mtime in batch:
+            if (uuid := job_uuid(key)) in existing:
+                sizes[uuid] += size
+            elif mtime < grace:
+                print(f"Deleting orphaned file {key}")
+                storage.delete(key)
+
+    return sizes
+
+
+def delete_job_files(uuid: str, transcript_version: int = 0) -> None:
+    """
+    Delete the upload, results, previews and edited transcripts of a job.
+    """
+    result_storage = get_result_storage()
+
+    get_upload_storage().delete(uuid)
+
+    keys = [f"{uuid}.{output_format.value}" for output_format in OutputFormatEnum]
+    keys += [draft_key(uuid, output_format) for output_format in OutputFormatEnum]
+    keys += [preview_key(uuid), peaks_key(uuid)]
+    keys += [edited_key(uuid, version) for version in range(1, transcript_version + 1)]
+
+    for key in keys:
+        delete_with_variants(result_storage, key)
+
+    if snapshot := snapshot_version(transcript_version):
+        result_storage.delete(snapshot_key(uuid, snapshot))
+
+
+def select_evictions(
+    jobs: list,
+    upload_bytes: dict[str, int],
+    result_bytes: dict[str, int],
+    now: Optional[datetime] = None,
+) -> list:
+    """
+    Pick the finished jobs to delete, least recently read first: jobs not
+    read for RETENTION_MAX_AGE_DAYS, and jobs of a storage or a user over
+    its quota until the usage is under the quota again. A quota of 0 is
+    unlimited.
+    """
+    now = now or datetime.utcnow()
+    max_age = settings.RETENTION_MAX_AGE_DAYS
+    expired = now - timedelta(days=max_age) if max_age else None
+
+    upload_total = sum(upload_bytes.values())
+    result_total = sum(result_bytes.values())
+    owner_totals = defaultdict(int)
+    for job in jobs:
+        owner_totals[job.owner] += job.upload_bytes + job.result_bytes
+
+    def over(total: int, quota: int) -> bool:
+        return bool(quota) and total > quota
+
+    evictions = []
+    for job in jobs:
+        if not (
+            (expired and job.accessed_at < expired)
+            or (job.upload_bytes and over(upload_total, settings.UPLOAD_QUOTA_BYTES))
+            or (job.result_bytes and over(result_total, settings.RESULT_QUOTA_BYTES))
+            or (
+                job.owner is not None
+                and over(owner_totals[job.owner], settings.USER_QUOTA_BYTES)
+            )
+        ):
+            continue
+
+        evictions.append(job)
+        upload_total -= job.upload_bytes
+        result_total -= job.result_bytes
+        owner_totals[job.owner] -= job.upload_bytes + job.result_bytes
+
+    return evictions
+
+
+@handle_database_errors
+def enforce_retention(session: Optional[Session] = None) -> None:
+    """
+    Reconcile the storages with the database, then evict jobs by age and
+    quota. Runs in a thread, the event loop is never blocked by the scans.
+    """
+    started = time.monotonic()
+
+    upload_bytes = scan_storage(session, get_upload_storage())
+    result_bytes = scan_storage(session, get_result_storage())
+    job_update_sizes(session, upload_bytes, result_bytes)
+
+    evictions = select_evictions(job_get_finished(session), upload_bytes, result_bytes)
+
+    for job in evictions:
+        print(f"Evicting job {job.uuid}")
+        delete_job_files(job.uuid, job.transcript_version)
+        job_delete(session, job.uuid)
+
+    print(
+        f"Retention: {sum(upload_bytes.values())} upload bytes, "
+        f"{sum(result_bytes.values())} result bytes, {len(evictions)} jobs "
+        f"evicted in {time.monotonic() - started:.1f} s"
+    )
@@ -0,0 +1,30 @@
+import random
+
+from datetime import datetime, timedelta
+from settings import get_settings
+from typing import Optional
+
+settings = get_settings()
+
+# Policy of unclassified errors if none is configured, no retries
+DEFAULT_POLICY = (1, 0)
+
+
+def retry_at(error_class: str, attempt: int) -> Optional[datetime]:
+    """
+    Get when a job is retried after the given failed attempt, or None if
+    the job has no attempts left.
+
+    Every error class has a policy of (attempts, delay in seconds), the
+    delay doubles with every attempt up to RETRY_MAX_DELAY. Random jitter
+    keeps jobs that failed together from being retried together.
+    """
+    policies = settings.RETRY_POLICIES
+    attempts, delay = policies.get(error_class, policies.get("unknown", DEFAULT_POLICY))
+
+    if attempt >= attempts:
+        return None
+
+    delay = min(settings.RETRY_MAX_DELAY, delay * 2 ** (attempt - 1))
+
+    return datetime.utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from db.analytics import analytics_latency
+from db.session import get_session
+from typing import Optional
+
+router = APIRouter(tags=["transcriber"])
+db_session = get_session()
+
+
+@router.get("/analytics/latency")
+async def latency(hours: int = 24, model: Optional[str] = None) -> JSONResponse:
+    """
+    Get the median and 95th percentile in seconds of the time from upload
+    to submission, from submission to a worker claiming the job and from
+    the claim to the result, by model and media duration, over the last
+    hours.
+    """
+    since = datetime.utcnow() - timedelta(hours=min(max(hours, 1), 24 * 365))
+    rows = analytics_latency(db_session, since, model_type=model)
+
+    return JSONResponse(content={"result": {"since": str(since), "latency": rows}})
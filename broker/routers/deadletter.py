@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from db.job import job_get_dead_letters, job_requeue_dead_letters
+from db.session import get_session
+from dispatch import dispatcher
+from typing import Optional
+
+router = APIRouter(tags=["transcriber"])
+db_session = get_session()
+
+
+@router.get("/deadletter")
+async def get_dead_letters(error_class: Optional[str] = None) -> JSONResponse:
+    """
+    Get the jobs that ran out of attempts with the errors of all their
+    attempts, optionally only those that last failed with the given
+    class of error.
+    """
+    jobs = job_get_dead_letters(db_session, error_class=error_class)
+
+    return JSONResponse(content={"result": {"jobs": jobs}})
+
+
+@router.post("/deadletter/requeue")
+async def requeue_dead_letters(request: Request) -> JSONResponse:
+    """
+    Queue dead letter jobs again with new attempts. Pass a list of job
+    UUIDs as uuids and/or an error_class to requeue only some of them,
+    an empty body requeues all of them.
+    """
+    data = await request.json()
+    uuids = data.get("uuids")
+
+    if uuids is not None and not isinstance(uuids, list):
+        return JSONResponse(
+            content={"result": {"error": "uuids must be a list"}}, status_code=400
+        )
+
+    requeued = job_requeue_dead_letters(
+        db_session, uuids=uuids, error_class=data.get("error_class")
+    )
+
+    if requeued:
+        dispatcher.notify()
+
+    return JSONResponse(content={"result": {"requeued": requeued}})
@@ -0,0 +1,43 @@
+from dispatch import WorkerConnection, dispatcher
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+router = APIRouter(tags=["transcriber"])
+
+
+@router.websocket("/transcriber/dispatch")
+async def dispatch_socket(websocket: WebSocket) -> None:
+    """
+    Persistent connection of a worker process. The worker sends status
+    messages with its free slots and warm models and acknowledges or
+    refuses the jobs pushed to it:
+
+        {"type": "status", "name": "...", "free": 2, "warm": [["sv", "base"]]}
+        {"type": "ack", "uuid": "..."}
+        {"type": "nack", "uuid": "..."}
+
+    Jobs are pushed as {"type": "job", "job": {...}}, with the same job
+    description as returned by GET /transcriber/next. Workers are told to
+    stop jobs with {"type": "cancel", "uuids": [...]}, also a job they
+    acknowledged after it was given to another worker.
+    """
+    await websocket.accept()
+
+    worker = WorkerConnection(websocket)
+    dispatcher.connect(worker)
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+
+            match message.get("type"):
+                case "status":
+                    worker.update(message)
+                    dispatcher.notify()
+                case "ack":
+                    await dispatcher.ack(worker, message.get("uuid", ""))
+                case "nack":
+                    dispatcher.requeue(worker, message.get("uuid", ""))
+    except (WebSocketDisconnect, ValueError, TypeError) as e:
+        print(f"Worker {worker.name} disconnected: {e!r}")
+    finally:
+        dispatcher.disconnect(worker)
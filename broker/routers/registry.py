@@ -0,0 +1,189 @@
+from fastapi import APIRouter, Form, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
+from db.registry import (
+    registry_add,
+    registry_add_benchmark,
+    registry_choose,
+    registry_delete,
+    registry_get,
+    registry_get_all,
+    registry_get_benchmarks,
+    registry_in_use,
+    registry_match,
+)
+from db.session import get_session
+from routers.transcriber import content_digest
+from serving import storage_response
+from storage import get_model_storage
+
+router = APIRouter(tags=["transcriber"])
+db_session = get_session()
+model_storage = get_model_storage()
+
+
+def model_key(sha256: str) -> str:
+    """
+    Get the storage key of a model file, by checksum so the content of a
+    key never changes.
+    """
+    return f"{sha256}.bin"
+
+
+@router.get("/models")
+async def get_models() -> JSONResponse:
+    """
+    Get all models in the registry.
+    """
+    return JSONResponse(content={"result": {"models": registry_get_all(db_session)}})
+
+
+@router.get("/models/match")
+async def match_model(
+    model_type: str, language: str = "", quantization: str = ""
+) -> JSONResponse:
+    """
+    Get the model a worker uses for a job of the given model type,
+    language and preferred quantization.
+    """
+    if not (model := registry_match(db_session, model_type, language, quantization)):
+        return JSONResponse(
+            content={
+                "result": {"error": f"No {model_type} model for language {language}"}
+            },
+            status_code=404,
+        )
+
+    return JSONResponse(content={"result": {"model": model}})
+
+
+@router.get("/models/choose")
+async def choose_model(
+    language: str, seconds: float, latency_target: float
+) -> JSONResponse:
+    """
+    Get the most accurate model transcribing the given seconds of audio
+    in the language within the latency target, for workers that detected
+    the language of a job.
+    """
+    if not (model := registry_choose(db_session, language, seconds, latency_target)):
+        return JSONResponse(
+            content={"result": {"error": "No benchmarked model"}}, status_code=404
+        )
+
+    return JSONResponse(content={"result": {"model": model}})
+
+
+@router.get("/models/benchmarks")
+async def get_benchmarks() -> JSONResponse:
+    """
+    Get the speed and accuracy of the models measured by the workers.
+    """
+    return JSONResponse(
+        content={"result": {"benchmarks": registry_get_benchmarks(db_session)}}
+    )
+
+
+@router.put("/models/{name}/benchmark")
+async def add_benchmark(name: str, request: Request) -> JSONResponse:
+    """
+    Report the real-time factor and word error rate of a model measured
+    by a worker on its reference corpus, used to choose the model for
+    jobs with a latency target.
+    """
+    data = await request.json()
+    worker = request.headers.get("X-Worker") or "unknown"
+
+    if not registry_get(db_session, name):
+        return JSONResponse(
+            content={"result": {"error": "Model not found"}}, status_code=404
+        )
+
+    try:
+        benchmark = registry_add_benchmark(
+            db_session,
+            name,
+            worker,
+            float(data["rtf"]),
+            float(data["wer"]),
+            float(data["audio_seconds"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        return JSONResponse(
+            content={"result": {"error": "rtf, wer and audio_seconds are required"}},
+            status_code=400,
+        )
+
+    print(f"Benchmark of model {name} on {worker}: {benchmark}")
+
+    return JSONResponse(content={"result": {"benchmark": benchmark}})
+
+
+@router.post("/models")
+async def add_model(
+    file: UploadFile,
+    name: str = Form(),
+    model_type: str = Form(),
+    language: str = Form(""),
+    quantization: str = Form(""),
+) -> JSONResponse:
+    """
+    Add a model file to the registry, replacing the model of the same
+    name. The model is used for jobs of its model type and language, or
+    of any language without a model of its own if no language is given.
+    """
+    sha256 = (await run_in_threadpool(content_digest, file.file)).hex()
+    size = file.file.tell()
+    file.file.seek(0)
+
+    if not model_storage.exists(model_key(sha256)):
+        await run_in_threadpool(model_storage.save, model_key(sha256), file.file)
+
+    previous = registry_get(db_session, name)
+    model = registry_add(
+        db_session, name, model_type, language, quantization, size, sha256
+    )
+
+    if previous and not registry_in_use(db_session, previous["sha256"]):
+        model_storage.delete(model_key(previous["sha256"]))
+
+    print(f"Added model {name}: {model_type} {language or 'any language'} {sha256}")
+
+    return JSONResponse(content={"result": {"model": model}})
+
+
+@router.delete("/models/{name}")
+async def delete_model(name: str) -> JSONResponse:
+    """
+    Remove a model from the registry, workers keep their cached copies
+    until they are evicted.
+    """
+    if not (model := registry_delete(db_session, name)):
+        return JSONResponse(
+            content={"result": {"error": "Model not found"}}, status_code=404
+        )
+
+    if not registry_in_use(db_session, model["sha256"]):
+        model_storage.delete(model_key(model["sha256"]))
+
+    return JSONResponse(content={"result": {"model": model}})
+
+
+@router.get("/models/{sha256}/file")
+async def get_model_file(sha256: str, request: Request) -> FileResponse:
+    """
+    Download a model file by checksum, with Range requests so workers
+    resume broken downloads.
+    """
+    if not registry_in_use(db_session, sha256):
+        return JSONResponse(
+            content={"result": {"error": "Model not found"}}, status_code=404
+        )
+
+    return storage_response(
+        request,
+        model_storage,
+        model_key(sha256),
+        immutable=True,
+        media_type="application/octet-stream",
+    )
@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from db.search import search_supported, search_transcripts
+from db.session import get_session
+from typing import Optional
+
+router = APIRouter(tags=["transcriber"])
+db_session = get_session()
+
+
+@router.get("/search")
+async def search(
+    q: str, job_id: Optional[str] = None, limit: int = 20, offset: int = 0
+) -> JSONResponse:
+    """
+    Search the completed transcripts. Hits are ranked best first and
+    point at a cue by its ID, its index in the transcript and its
+    start time, so the editor can jump to it.
+    """
+    if not search_supported(db_session.get_bind()):
+        return JSONResponse(
+            content={"result": {"error": "Search is not supported by the database"}},
+            status_code=400,
+        )
+
+    hits = search_transcripts(
+        db_session,
+        q,
+        job_uuid=job_id,
+        limit=min(max(limit, 1), 100),
+        offset=max(offset, 0),
+    )
+
+    return JSONResponse(content={"result": {"hits": hits}})
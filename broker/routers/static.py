@@ -1,43 +1,84 @@
+import mimetypes
+
 from fastapi import (
     APIRouter,
+    Request,
 )
 from fastapi.responses import FileResponse, JSONResponse
+from db.job import job_get, job_touch
 from db.session import get_session
+from keys import peaks_key, preview_key
+from serving import storage_response
 from settings import get_settings
-from pathlib import Path
+from storage import get_result_storage, get_upload_storage
 
 router = APIRouter(tags=["transcriber"])
 settings = get_settings()
 db_session = get_session()
 
-api_file_upload_dir = settings.API_FILE_UPLOAD_DIR
-api_file_storage_dir = settings.API_FILE_STORAGE_DIR
+upload_storage = get_upload_storage()
+result_storage = get_result_storage()
 
 
 @router.get("/static/{job_id}")
-async def get_static_file(job_id: str) -> FileResponse:
+async def get_static_file(job_id: str, request: Request) -> FileResponse:
     """
     Get the static file.
+
+    Uploads never change, so the response can be cached for a long
+    time and players can seek with Range requests.
     """
 
-    file_path = Path(api_file_upload_dir) / job_id
+    job = job_get(db_session, job_id)
 
-    if not file_path.exists():
+    if not job:
         return JSONResponse(
             content={"detail": {"error": "File not found"}},
             status_code=404,
         )
 
-    def iterfile():
-        with open(file_path, mode="rb") as file_like:
-            yield from file_like
+    job_touch(db_session, job["uuid"])
 
-    return FileResponse(
-        file_path,
-        media_type="application/octet-stream",
-        filename=file_path.name,
+    media_type = mimetypes.guess_type(job["filename"])[0]
+
+    return storage_response(
+        request,
+        upload_storage,
+        job["uuid"],
+        immutable=True,
+        media_type=media_type or "application/octet-stream",
         headers={
-            "Content-Disposition": f"attachment; filename={file_path.name}",
+            "Content-Disposition": f"inline; filename={job['uuid']}",
             "X-Accel-Buffering": "no",
         },
     )
+
+
+@router.get("/static/{job_id}/preview")
+async def get_static_preview(job_id: str, request: Request) -> FileResponse:
+    """
+    Get the low bitrate preview of the file.
+    """
+
+    return storage_response(
+        request,
+        result_storage,
+        preview_key(job_id),
+        immutable=True,
+        media_type="video/mp4",
+    )
+
+
+@router.get("/static/{job_id}/peaks")
+async def get_static_peaks(job_id: str, request: Request) -> FileResponse:
+    """
+    Get the waveform peaks of the file.
+    """
+
+    return storage_response(
+        request,
+        result_storage,
+        peaks_key(job_id),
+        immutable=True,
+        media_type="application/json",
+    )
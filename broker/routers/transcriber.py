@@ -1,21 +1,55 @@
-import aiofiles
+import hashlib
+import json
+import math
+import tempfile
 
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     UploadFile,
     Request,
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import FileResponse, JSONResponse
+from admission import AdmissionError, admission, tenant_of
 from db.session import get_session
+from dispatch import dispatcher
+from middleware import admission_response
 from db.job import (
+    job_add_failure,
+    job_cancel,
     job_create,
+    job_delete_segments,
+    job_fail_segments,
     job_get,
     job_get_all,
+    job_get_segments,
     job_update,
     job_get_next,
+    job_heartbeat,
+    job_publish_draft,
+    job_segment_completed,
+    job_split,
+    job_submit,
+    job_touch,
 )
-from db.models import JobStatus, JobType, JobStatusEnum, OutputFormatEnum
+from db.models import (
+    JobStatus,
+    JobType,
+    JobStatusEnum,
+    OutputFormatEnum,
+    ResultStageEnum,
+)
+from db.registry import registry_choose, registry_get
+from db.search import search_index_transcript
+from db.transcript import transcript_add_edits, transcript_get_edits, transcript_reset
+from keys import draft_key, edited_key, snapshot_key, snapshot_version
+from media import process_upload, split_segments
+from retry import retry_at
+from serving import delete_with_variants, precompress, storage_response
+from storage import COPY_BUFFER_SIZE, get_upload_storage, get_result_storage
+from subtitles import apply_edits, merge_cues, parse_srt, render_srt, validate_ops
 from typing import Optional
 from settings import get_settings
 from pathlib import Path
@@ -24,8 +58,266 @@ router = APIRouter(tags=["transcriber"])
 settings = get_settings()
 db_session = get_session()
 
-api_file_upload_dir = settings.API_FILE_UPLOAD_DIR
-api_file_storage_dir = settings.API_FILE_STORAGE_DIR
+upload_storage = get_upload_storage()
+result_storage = get_result_storage()
+
+# Split jobs whose segments are being merged
+merging: set[str] = set()
+
+# Seconds to wait before submitting an upload that is still being probed
+PROBE_RETRY_AFTER = 5
+
+
+def result_key(job: dict) -> Optional[str]:
+    """
+    Get the storage key of the transcription result for a job.
+    """
+    try:
+        output_format = OutputFormatEnum(job["output_format"])
+    except ValueError:
+        return None
+
+    return f"{job['uuid']}.{output_format.value}"
+
+
+def upload_key(job: dict) -> str:
+    """
+    Get the storage key of the upload of a job, segments of a split job
+    share the upload of the job.
+    """
+    return job["parent_uuid"] or job["uuid"]
+
+
+def transcript_base(job_id: str, version: int) -> int:
+    """
+    Get the version the cues of a transcript version are built from, its
+    latest snapshot or 0 for the original result, e.g. for transcripts
+    edited before snapshots were saved.
+    """
+    base = snapshot_version(version)
+
+    if base and result_storage.exists(snapshot_key(job_id, base)):
+        return base
+
+    return 0
+
+
+def transcript_cues(job: dict, base: int, edits: list[list]) -> list[dict]:
+    """
+    Get the cues of a transcript version, i.e. the original result or the
+    snapshot of the base version with the edits of the later versions up
+    to it applied.
+    """
+    if base:
+        with result_storage.open(snapshot_key(job["uuid"], base)) as fd:
+            return apply_edits(json.loads(fd.read()), edits)
+
+    with result_storage.open(result_key(job)) as fd:
+        cues = parse_srt(fd.read().decode())
+
+    return apply_edits(cues, edits)
+
+
+def save_snapshot(job_id: str, version: int, cues: list[dict]) -> None:
+    """
+    Save the cues of a transcript version as its snapshot, replacing the
+    previous snapshot.
+    """
+    with tempfile.TemporaryFile() as fd:
+        fd.write(json.dumps(cues).encode())
+        fd.seek(0)
+        result_storage.save(snapshot_key(job_id, version), fd)
+
+    if previous := snapshot_version(version - 1):
+        result_storage.delete(snapshot_key(job_id, previous))
+
+
+def content_digest(fd) -> bytes:
+    digest = hashlib.sha256()
+    while chunk := fd.read(COPY_BUFFER_SIZE):
+        digest.update(chunk)
+    return digest.digest()
+
+
+def same_content(key: str, fileobj) -> bool:
+    """
+    Check if a stored result has the same content as an uploaded file.
+    """
+    if not result_storage.exists(key):
+        return False
+
+    with result_storage.open(key) as fd:
+        stored = content_digest(fd)
+
+    uploaded = content_digest(fileobj)
+    fileobj.seek(0)
+
+    return stored == uploaded
+
+
+def is_published_draft(job: dict, fileobj=None) -> bool:
+    """
+    Check if a result reported by a worker, uploaded or already in the
+    result storage, is the draft that was published before, e.g. when
+    the worker of the draft retries after a lost response. A result of
+    the refinement being transcribed is never taken for the draft, even
+    if it is the same.
+    """
+    if not job["result_stage"] or job["status"] == JobStatusEnum.IN_PROGRESS:
+        return False
+
+    key = draft_key(job["uuid"], job["output_format"])
+    if fileobj is not None:
+        return same_content(key, fileobj)
+
+    if not result_storage.exists(key):
+        return False
+
+    with result_storage.open(result_key(job)) as fd:
+        stored = content_digest(fd)
+
+    with result_storage.open(key) as fd:
+        return content_digest(fd) == stored
+
+
+def publish_draft(job: dict) -> None:
+    """
+    Keep a copy of the draft result, it is replaced by the refined one.
+    """
+    with result_storage.open(result_key(job)) as fd:
+        result_storage.save(draft_key(job["uuid"], job["output_format"]), fd)
+
+
+def worker_job(job: dict) -> dict:
+    """
+    Describe a claimed job for a worker, including where to read the
+    upload and write the result when the worker can access the storage.
+    """
+    job = dict(job)
+
+    # Let workers on the same volume read and write in place
+    input_path = upload_storage.local_path(upload_key(job))
+    output_path = result_storage.local_path(result_key(job) or "")
+    if settings.API_SHARED_STORAGE and input_path and output_path:
+        job["input_path"] = str(input_path.resolve())
+        job["output_dir"] = str(output_path.parent.resolve())
+
+    # Let workers move bytes directly to and from the object storage
+    if upload_storage.presigned and result_storage.presigned:
+        job["input_url"] = upload_storage.presign_get(upload_key(job))
+        job["output_url"] = result_storage.presign_put(result_key(job))
+
+    # The model chosen for the job is used for the final result, not for
+    # a draft
+    if job["model_name"] and not job["refine_model"]:
+        job["model"] = registry_get(db_session, job["model_name"])
+
+    return jsonable_encoder(job)
+
+
+def should_split(job: dict) -> bool:
+    """
+    Check if a submitted job is long enough to be transcribed in segments
+    by several workers. Only SRT results can be merged, and drafts are
+    already a fast first result.
+    """
+    return bool(
+        settings.SPLIT_MIN_SECONDS
+        and (job["duration"] or 0) > settings.SPLIT_MIN_SECONDS
+        and job["output_format"] == OutputFormatEnum.SRT
+        and not job["refine_model"]
+    )
+
+
+def choose_model(job: dict, latency_target: float, draft: bool) -> Optional[dict]:
+    """
+    Choose the model for a submitted job by the benchmarks of the models,
+    the most accurate one transcribing it within the latency target. A
+    job split into segments only has to transcribe a segment in time.
+    Workers choose the model of a job in an unknown language once they
+    detected it.
+    """
+    if not job["duration"] or job["language"] == "auto":
+        return None
+
+    seconds = job["duration"]
+    if not draft and should_split(dict(job, refine_model=None)):
+        seconds = settings.SPLIT_SEGMENT_SECONDS + settings.SPLIT_OVERLAP_SECONDS
+
+    return registry_choose(db_session, job["language"], seconds, latency_target)
+
+
+def merge_segments(job: dict, segments: list[dict]) -> None:
+    """
+    Merge the results of the segments of a split job into its result,
+    moving the cues by the start of their segment.
+    """
+    parts = []
+    for segment in segments:
+        with result_storage.open(result_key(segment)) as fd:
+            cues = parse_srt(fd.read().decode())
+        parts.append((round(segment["segment_start"] * 1000), cues))
+
+    with tempfile.TemporaryFile() as fd:
+        fd.write(render_srt(merge_cues(parts)).encode())
+        fd.seek(0)
+        result_storage.save(result_key(job), fd)
+
+
+async def segment_completed(job_id: str) -> None:
+    """
+    Update the progress of a split job when one of its segments is done,
+    and complete it with the merged result when all of them are.
+    """
+    job, complete = job_segment_completed(db_session, job_id)
+
+    if not complete or job["status"] != JobStatusEnum.IN_PROGRESS:
+        return
+    if job_id in merging:
+        return
+
+    merging.add(job_id)
+    try:
+        segments = job_get_segments(db_session, job_id)
+        await run_in_threadpool(merge_segments, job, segments)
+
+        detected = [s["detected_language"] for s in segments if s["detected_language"]]
+        if detected:
+            job_update(db_session, job_id, detected_language=detected[0])
+
+        await result_completed(job_id, result_key(job))
+
+        for segment in segments:
+            delete_with_variants(result_storage, result_key(segment))
+        job_delete_segments(db_session, job_id)
+    except Exception as e:
+        print(f"Error merging segments of {job_id}: {e}")
+        job_update(
+            db_session,
+            job_id,
+            status=JobStatusEnum.FAILED,
+            error=f"Merging segments failed: {e}",
+        )
+    finally:
+        merging.discard(job_id)
+
+
+def render_transcript(job: dict, base: int, edits: list[list]) -> str:
+    """
+    Render the current version of an edited transcript once and cache it
+    in the result storage.
+    """
+    key = edited_key(job["uuid"], job["transcript_version"])
+
+    if not result_storage.exists(key):
+        content = render_srt(transcript_cues(job, base, edits)).encode()
+        with tempfile.TemporaryFile() as fd:
+            fd.write(content)
+            fd.seek(0)
+            result_storage.save(key, fd)
+        precompress(result_storage, key)
+
+    return key
 
 
 @router.get("/transcriber")
@@ -47,9 +339,12 @@ async def transcribe(
 @router.post("/transcriber")
 async def transcribe_file(
     file: UploadFile,
+    request: Request,
+    background_tasks: BackgroundTasks,
 ) -> JSONResponse:
     """
-    Transcribe audio file.
+    Transcribe audio file. The user in the X-User header owns the job,
+    its files count towards the user's storage quota.
     """
 
     # Create a job for the transcription
@@ -58,21 +353,19 @@ async def transcribe_file(
         job_type=JobType.TRANSCRIPTION,
         filename=file.filename,
         output_format=OutputFormatEnum.SRT,
+        owner=request.headers.get("X-User"),
     )
 
     try:
-        file_path = Path(api_file_upload_dir) / job["uuid"]
-        async with aiofiles.open(file_path, "wb") as out_file:
-            while True:
-                chunk = await file.read(1024)
-                if not chunk:
-                    break
-                await out_file.write(chunk)
+        await run_in_threadpool(upload_storage.save, job["uuid"], file.file)
     except Exception as e:
-        job = job_update(db_session, job["uuid"], status=JobStatus.FAILED, error=str(e))
+        job = job_update(
+            db_session, job["uuid"], status=JobStatusEnum.FAILED, error=str(e)
+        )
         return JSONResponse(content={"result": {"error": str(e)}}, status_code=500)
 
     job = job_update(db_session, job["uuid"], status=JobStatusEnum.UPLOADED)
+    background_tasks.add_task(process_upload, job["uuid"])
 
     return JSONResponse(
         content={
@@ -98,6 +391,18 @@ async def update_transcription_status(job_id: str, request: Request) -> JSONResp
     status = data.get("status")
     output_format = data.get("output_format")
     error = data.get("error")
+    detected_language = data.get("detected_language")
+    worker = request.headers.get("X-Worker")
+
+    try:
+        latency_target = (
+            float(data["latency_target"]) if data.get("latency_target") else None
+        )
+    except (TypeError, ValueError):
+        return JSONResponse(
+            content={"result": {"error": "latency_target must be a number of seconds"}},
+            status_code=400,
+        )
 
     print(f"Job ID: {job_id}")
     print(f"Language: {language}")
@@ -105,6 +410,73 @@ async def update_transcription_status(job_id: str, request: Request) -> JSONResp
     print(f"Status: {status}")
     print(f"Output Format: {output_format}")
 
+    # Jobs submitted by users, also again to run another model, are
+    # admitted, jobs given back by workers are always queued again
+    job = job_get(db_session, job_id)
+    submitted = job and job["status"] in (
+        JobStatusEnum.UPLOADED,
+        JobStatusEnum.COMPLETED,
+        JobStatusEnum.FAILED,
+        JobStatusEnum.DEAD_LETTER,
+        JobStatusEnum.CANCELLED,
+    )
+
+    # A worker stopping a cancelled job does not bring it back
+    if job and job["status"] == JobStatusEnum.CANCELLED and worker:
+        return JSONResponse(content={"result": result_summary(job, job["filename"])})
+
+    # Admission and splitting need the media information of the upload
+    if (
+        submitted
+        and status == JobStatusEnum.PENDING
+        and job["status"] == JobStatusEnum.UPLOADED
+        and not job["probed_at"]
+    ):
+        return admission_response(
+            AdmissionError(503, "The upload is still being probed", PROBE_RETRY_AFTER)
+        )
+
+    if submitted and status == JobStatusEnum.PENDING:
+        try:
+            admission.admit_job(
+                db_session, tenant_of(job["owner"]), job["duration"] or 0
+            )
+        except AdmissionError as e:
+            return admission_response(e)
+
+    # Failures reported by workers are retried by the policy of their
+    # class, jobs without attempts left become dead letters
+    if (
+        job
+        and status == JobStatusEnum.FAILED
+        and job["status"] == JobStatusEnum.IN_PROGRESS
+    ):
+        error_class = data.get("error_class") or "unknown"
+        not_before = retry_at(error_class, job["attempts"] + 1)
+        job = job_add_failure(
+            db_session, job_id, error, error_class, worker, not_before
+        )
+
+        if not_before:
+            print(f"Retrying job {job_id} after {error_class} error at {not_before}")
+            return JSONResponse(
+                content={"result": result_summary(job, job["filename"])}
+            )
+
+        status = JobStatusEnum.DEAD_LETTER
+
+    # A failed refinement leaves the draft as the final result
+    result_stage = None
+    if (
+        job
+        and status in (JobStatusEnum.FAILED, JobStatusEnum.DEAD_LETTER)
+        and job["result_stage"] == ResultStageEnum.DRAFT
+        and job["status"] != JobStatusEnum.COMPLETED
+    ):
+        status = JobStatusEnum.COMPLETED
+        error = f"Refinement failed: {error}"
+        result_stage = ResultStageEnum.FINAL
+
     job = job_update(
         db_session,
         job_id,
@@ -113,6 +485,9 @@ async def update_transcription_status(job_id: str, request: Request) -> JSONResp
         status=status,
         output_format=output_format,
         error=error,
+        detected_language=detected_language,
+        result_stage=result_stage,
+        worker=worker,
     )
 
     if not job:
@@ -120,6 +495,48 @@ async def update_transcription_status(job_id: str, request: Request) -> JSONResp
             content={"result": {"error": "Job not found"}}, status_code=404
         )
 
+    if submitted and status == JobStatusEnum.PENDING:
+        delete_with_variants(result_storage, draft_key(job_id, job["output_format"]))
+        quantization = data.get("quantization") or ""
+        model_name = None
+
+        # Use the most accurate model meeting the latency target
+        if latency_target and (
+            chosen := choose_model(job, latency_target, bool(data.get("draft")))
+        ):
+            job = job_update(db_session, job_id, model_type=chosen["model_type"])
+            quantization = chosen["quantization"]
+            model_name = chosen["name"]
+            print(f"Chose model {chosen['name']} for job {job_id}")
+
+        job = job_submit(
+            db_session,
+            job_id,
+            settings.DRAFT_MODEL if data.get("draft") else None,
+            quantization,
+            latency_target,
+            model_name,
+        )
+
+        # Let several workers transcribe a long recording at once
+        if should_split(job):
+            segments = await run_in_threadpool(split_segments, job_id, job["duration"])
+            job_split(db_session, job_id, segments)
+            job = job_get(db_session, job_id)
+            print(f"Split job {job_id} into {len(segments)} segments")
+
+    # A segment without attempts left fails the job it is part of
+    if job["parent_uuid"] and status == JobStatusEnum.DEAD_LETTER:
+        job_fail_segments(
+            db_session,
+            job["parent_uuid"],
+            job,
+            f"Segment at {job['segment_start']:.0f} seconds failed: {error}",
+        )
+
+    if job["status"] == JobStatusEnum.PENDING:
+        dispatcher.notify()
+
     return JSONResponse(
         content={
             "result": {
@@ -132,15 +549,70 @@ async def update_transcription_status(job_id: str, request: Request) -> JSONResp
     )
 
 
+@router.put("/transcriber/{job_id}/heartbeat")
+async def put_transcription_heartbeat(job_id: str) -> JSONResponse:
+    """
+    Keep a job that a worker is still processing from being cleaned up.
+    """
+    job = job_heartbeat(db_session, job_id)
+
+    if not job:
+        return JSONResponse(
+            content={"result": {"error": "Job not found"}}, status_code=404
+        )
+
+    # The worker stops a job that was cancelled or is no longer its own
+    return JSONResponse(
+        content={
+            "result": {
+                "uuid": job["uuid"],
+                "status": job["status"],
+                "cancel": job["status"] != JobStatusEnum.IN_PROGRESS,
+            }
+        }
+    )
+
+
+@router.post("/transcriber/{job_id}/cancel")
+async def cancel_transcription(job_id: str) -> JSONResponse:
+    """
+    Cancel a queued or running transcription job. Workers connected for
+    pushed jobs stop it right away, polling workers on their next
+    heartbeat.
+    """
+    if not job_get(db_session, job_id):
+        return JSONResponse(
+            content={"result": {"error": "Job not found"}}, status_code=404
+        )
+
+    if not (cancelled := job_cancel(db_session, job_id)):
+        return JSONResponse(
+            content={"result": {"error": "Job is not queued or being transcribed"}},
+            status_code=409,
+        )
+
+    print(f"Cancelled job {job_id}")
+    await dispatcher.cancel(cancelled)
+    job = job_get(db_session, job_id)
+
+    return JSONResponse(
+        content={"result": {"uuid": job["uuid"], "status": job["status"]}}
+    )
+
+
 @router.get("/transcriber/{job_id}")
-async def get_transcription_job(job_id: str) -> JSONResponse:
+async def get_transcription_job(job_id: str, request: Request) -> JSONResponse:
     """
     Get the status of a transcription job.
     """
 
     if job_id == "next":
-        job = job_get_next(db_session)
-        return JSONResponse(content={"result": jsonable_encoder(job)})
+        job = job_get_next(db_session, request.headers.get("X-Worker"))
+
+        if not job:
+            return JSONResponse(content={"result": {}})
+
+        return JSONResponse(content={"result": worker_job(job)})
 
     job = job_get(db_session, job_id)
 
@@ -153,7 +625,7 @@ async def get_transcription_job(job_id: str) -> JSONResponse:
 
 
 @router.get("/transcriber/{job_id}/file")
-async def get_transcription_file(job_id: str) -> FileResponse:
+async def get_transcription_file(job_id: str, request: Request) -> FileResponse:
     """
     Get the transcription file.
     """
@@ -164,59 +636,394 @@ async def get_transcription_file(job_id: str) -> FileResponse:
             content={"result": {"error": "Job not found"}}, status_code=404
         )
 
-    file_path = Path(api_file_upload_dir) / job["filename"]
+    return storage_response(
+        request,
+        upload_storage,
+        upload_key(job),
+        immutable=True,
+        media_type="application/octet-stream",
+    )
+
+
+async def result_completed(
+    job_id: str, filename: str, worker: Optional[str] = None
+) -> dict:
+    """
+    Mark a job as completed once its result is in the result storage.
+    """
+    await run_in_threadpool(precompress, result_storage, filename)
+
+    job = job_get(db_session, job_id)
+
+    # Segments of a split job are merged into its result when all are done
+    if job["parent_uuid"]:
+        job = job_update(
+            db_session, job_id, status=JobStatusEnum.COMPLETED, worker=worker
+        )
+        await segment_completed(job["parent_uuid"])
+
+        return result_summary(job, filename)
+
+    # Edits were made on top of the previous result
+    if version := job.get("transcript_version"):
+        delete_with_variants(result_storage, edited_key(job_id, version))
+        if snapshot := snapshot_version(version):
+            result_storage.delete(snapshot_key(job_id, snapshot))
+        transcript_reset(db_session, job_id)
+        job["transcript_version"] = 0
+
+    # Index the subtitles for search, replacing the previous result
+    if filename == result_key(job) and job["output_format"] == OutputFormatEnum.SRT:
+        try:
+            cues = await run_in_threadpool(transcript_cues, job, 0, [])
+            search_index_transcript(db_session, job_id, cues)
+        except Exception as e:
+            print(f"Error indexing transcript {job_id}: {e}")
+
+    # Serve the result of the draft model and queue the refinement
+    if job["refine_model"] and filename == result_key(job):
+        await run_in_threadpool(publish_draft, job)
+        job = job_publish_draft(db_session, job_id, settings.REFINE_PRIORITY)
+        dispatcher.notify()
+
+        return result_summary(job, filename)
 
-    if not file_path.exists():
-        return {"result": {"error": "File not found"}}
+    job = job_update(
+        db_session,
+        job_id,
+        status=JobStatusEnum.COMPLETED,
+        error=None,
+        result_stage=ResultStageEnum.FINAL,
+        worker=worker,
+    )
 
-    return FileResponse(file_path)
+    return result_summary(job, filename)
+
+
+def result_summary(job: dict, filename: str) -> dict:
+    """
+    Get the response to an uploaded result.
+    """
+    return {
+        "uuid": job["uuid"],
+        "status": job["status"],
+        "job_type": job["job_type"],
+        "filename": filename,
+    }
 
 
 @router.put("/transcriber/{job_id}/result")
-async def put_transcription_result(job_id: str, file: UploadFile) -> JSONResponse:
+async def put_transcription_result(
+    job_id: str, file: UploadFile, request: Request
+) -> JSONResponse:
     """
     Upload the transcription result.
+
+    Uploading the same result again, e.g. when a worker retries after a
+    lost response, leaves the job and its edits as they are.
     """
-    if not job_get(db_session, job_id):
+    if not (job := job_get(db_session, job_id)):
         return JSONResponse(
             content={"result": {"error": "Job not found"}}, status_code=404
         )
 
+    # Results of cancelled jobs are refused, so workers drop them
+    if job["status"] == JobStatusEnum.CANCELLED:
+        return JSONResponse(
+            content={"result": {"error": "Job was cancelled"}}, status_code=410
+        )
+
     try:
-        file_path = Path(api_file_storage_dir) / file.filename
-        async with aiofiles.open(file_path, "wb") as out_file:
-            while True:
-                chunk = await file.read(1024)
-                if not chunk:
-                    break
-                await out_file.write(chunk)
+        filename = Path(file.filename).name
 
-        job = job_update(
-            db_session,
-            job_id,
-            status=JobStatusEnum.COMPLETED,
-            error=None,
+        if job["status"] == JobStatusEnum.COMPLETED and await run_in_threadpool(
+            same_content, filename, file.file
+        ):
+            return JSONResponse(content={"result": result_summary(job, filename)})
+
+        if await run_in_threadpool(is_published_draft, job, file.file):
+            return JSONResponse(content={"result": result_summary(job, filename)})
+
+        await run_in_threadpool(result_storage.save, filename, file.file)
+
+        result = await result_completed(
+            job_id, filename, request.headers.get("X-Worker")
         )
 
+        return JSONResponse(content={"result": result})
+    except Exception as e:
+        return JSONResponse(content={"result": {"error": str(e)}}, status_code=500)
+
+
+@router.put("/transcriber/{job_id}/result/shared")
+async def put_transcription_result_shared(
+    job_id: str, request: Request
+) -> JSONResponse:
+    """
+    Complete a job whose result the worker wrote directly into the
+    shared storage directory or uploaded with a presigned URL.
+
+    Completing a completed job again, e.g. when a worker retries after a
+    lost response, leaves the job and its edits as they are.
+    """
+    if not settings.API_SHARED_STORAGE and not result_storage.presigned:
+        return JSONResponse(
+            content={"result": {"error": "Shared storage is not enabled"}},
+            status_code=400,
+        )
+
+    if not (job := job_get(db_session, job_id)):
+        return JSONResponse(
+            content={"result": {"error": "Job not found"}}, status_code=404
+        )
+
+    if job["status"] == JobStatusEnum.CANCELLED:
+        return JSONResponse(
+            content={"result": {"error": "Job was cancelled"}}, status_code=410
+        )
+
+    data = await request.json()
+    filename = Path(data.get("filename", "")).name
+
+    if not filename.startswith(job_id) or not result_storage.exists(filename):
+        return JSONResponse(
+            content={"result": {"error": "File not found"}}, status_code=404
+        )
+
+    if job["status"] == JobStatusEnum.COMPLETED or await run_in_threadpool(
+        is_published_draft, job
+    ):
+        return JSONResponse(content={"result": result_summary(job, filename)})
+
+    result = await result_completed(job_id, filename, request.headers.get("X-Worker"))
+
+    return JSONResponse(content={"result": result})
+
+
+@router.get("/transcriber/{job_id}/result")
+async def get_transcription_result(
+    job_id: str,
+    request: Request,
+    v: Optional[str] = None,
+    original: bool = False,
+    stage: Optional[ResultStageEnum] = None,
+) -> FileResponse:
+    """
+    Get the transcription result, with all saved edits applied unless
+    the original result is requested. The X-Result-Stage header tells
+    if it is a draft or the final result, pass stage=draft to get the
+    draft after it was refined.
+
+    Pass the ETag of the result as v to get a response that can be
+    cached for a long time.
+    """
+    job = job_get(db_session, job_id)
+
+    if not job:
+        return JSONResponse(
+            content={"result": {"error": "Job not found"}}, status_code=404
+        )
+
+    if not (key := result_key(job)):
+        return JSONResponse(
+            content={"result": {"error": "Unsupported output format"}},
+            status_code=400,
+        )
+
+    if stage == ResultStageEnum.DRAFT:
+        key = draft_key(job_id, job["output_format"])
+    elif job["transcript_version"] and not original and result_storage.exists(key):
+        version = job["transcript_version"]
+        base = transcript_base(job_id, version)
+        edits = transcript_get_edits(db_session, job_id, version, base)
+        key = await run_in_threadpool(render_transcript, job, base, edits)
+
+    job_touch(db_session, job_id)
+
+    return storage_response(
+        request,
+        result_storage,
+        key,
+        version=v,
+        headers={"X-Result-Stage": stage.value if stage else job["result_stage"] or ""},
+    )
+
+
+@router.get("/transcriber/{job_id}/transcript")
+async def get_transcript(job_id: str) -> JSONResponse:
+    """
+    Get the cues of the current transcript version together with the
+    version number, which must be passed when saving edits.
+    """
+    job = job_get(db_session, job_id)
+
+    if not job:
+        return JSONResponse(
+            content={"result": {"error": "Job not found"}}, status_code=404
+        )
+
+    if job["output_format"] != OutputFormatEnum.SRT or not result_storage.exists(
+        result_key(job)
+    ):
+        return JSONResponse(
+            content={"result": {"error": "No SRT result for job"}}, status_code=400
+        )
+
+    job_touch(db_session, job_id)
+
+    version = job["transcript_version"]
+    base = transcript_base(job_id, version)
+    edits = transcript_get_edits(db_session, job_id, version, base)
+    cues = await run_in_threadpool(transcript_cues, job, base, edits)
+
+    return JSONResponse(
+        content={
+            "result": {
+                "version": job["transcript_version"],
+                "stage": job["result_stage"],
+                "cues": cues,
+            }
+        }
+    )
+
+
+@router.patch("/transcriber/{job_id}/transcript")
+async def patch_transcript(job_id: str, request: Request) -> JSONResponse:
+    """
+    Save cue edits (insert, update or delete by cue ID) as a new version
+    on top of the given version. Only the edits are stored, the new
+    version is rendered when it is requested. Every
+    TRANSCRIPT_SNAPSHOT_VERSIONS versions the cues are saved as a
+    snapshot, so reading a version replays only the edits after it.
+    """
+    job = job_get(db_session, job_id)
+
+    if not job:
+        return JSONResponse(
+            content={"result": {"error": "Job not found"}}, status_code=404
+        )
+
+    if job["output_format"] != OutputFormatEnum.SRT:
+        return JSONResponse(
+            content={"result": {"error": "Only SRT results can be edited"}},
+            status_code=400,
+        )
+
+    # Edits would be lost when the refined result replaces the draft
+    if job["result_stage"] == ResultStageEnum.DRAFT:
+        return JSONResponse(
+            content={"result": {"error": "Drafts can not be edited until refined"}},
+            status_code=400,
+        )
+
+    data = await request.json()
+    version = data.get("version")
+    ops = data.get("ops")
+
+    if error := validate_ops(ops):
+        return JSONResponse(content={"result": {"error": error}}, status_code=400)
+
+    if not (new_version := transcript_add_edits(db_session, job_id, version, ops)):
         return JSONResponse(
             content={
                 "result": {
-                    "uuid": job["uuid"],
-                    "status": job["status"],
-                    "job_type": job["job_type"],
-                    "filename": file.filename,
+                    "error": "Transcript has been changed",
+                    "version": job["transcript_version"],
                 }
-            }
+            },
+            status_code=409,
         )
-    except Exception as e:
-        return JSONResponse(content={"result": {"error": str(e)}}, status_code=500)
 
+    delete_with_variants(result_storage, edited_key(job_id, version))
 
-@router.get("/transcriber/{job_id}/result")
-async def get_transcription_result(job_id: str) -> FileResponse:
+    if new_version == snapshot_version(new_version):
+        base = transcript_base(job_id, version)
+        edits = transcript_get_edits(db_session, job_id, new_version, base)
+        cues = await run_in_threadpool(transcript_cues, job, base, edits)
+        await run_in_threadpool(save_snapshot, job_id, new_version, cues)
+
+    return JSONResponse(content={"result": {"uuid": job_id, "version": new_version}})
+
+
+@router.post("/transcriber/upload")
+async def create_direct_upload(request: Request) -> JSONResponse:
+    """
+    Create a job and return presigned URLs so the client can upload
+    the file directly to the storage backend. Files larger than the
+    part size are uploaded in parts.
+    """
+    if not upload_storage.presigned:
+        return JSONResponse(
+            content={"result": {"error": "Direct uploads are not supported"}},
+            status_code=400,
+        )
+
+    data = await request.json()
+    filename = data.get("filename")
+    size = int(data.get("size", 0))
+
+    if not filename:
+        return JSONResponse(
+            content={"result": {"error": "Filename is required"}}, status_code=400
+        )
+
+    try:
+        admission.check_submission(db_session, tenant_of(request.headers.get("X-User")))
+    except AdmissionError as e:
+        return admission_response(e)
+
+    job = job_create(
+        db_session,
+        job_type=JobType.TRANSCRIPTION,
+        filename=filename,
+        output_format=OutputFormatEnum.SRT,
+        owner=request.headers.get("X-User"),
+    )
+
+    result = {
+        "uuid": job["uuid"],
+        "status": job["status"],
+        "job_type": job["job_type"],
+        "filename": filename,
+    }
+
+    part_size = settings.S3_MULTIPART_PART_SIZE
+
+    if size <= part_size:
+        result["url"] = upload_storage.presign_put(job["uuid"])
+        return JSONResponse(content={"result": result})
+
+    upload_id = upload_storage.create_multipart_upload(job["uuid"])
+    result["upload_id"] = upload_id
+    result["part_size"] = part_size
+    result["parts"] = [
+        {
+            "part_number": part_number,
+            "url": upload_storage.presign_upload_part(
+                job["uuid"], upload_id, part_number
+            ),
+        }
+        for part_number in range(1, math.ceil(size / part_size) + 1)
+    ]
+
+    return JSONResponse(content={"result": result})
+
+
+@router.post("/transcriber/{job_id}/upload/complete")
+async def complete_direct_upload(
+    job_id: str, request: Request, background_tasks: BackgroundTasks
+) -> JSONResponse:
     """
-    Get the transcription result.
+    Mark a direct upload as done, completing the multipart upload if
+    the file was uploaded in parts. Completing an upload again returns
+    the job as it is.
     """
+    if not upload_storage.presigned:
+        return JSONResponse(
+            content={"result": {"error": "Direct uploads are not supported"}},
+            status_code=400,
+        )
+
     job = job_get(db_session, job_id)
 
     if not job:
@@ -224,20 +1031,50 @@ async def get_transcription_result(job_id: str) -> FileResponse:
             content={"result": {"error": "Job not found"}}, status_code=404
         )
 
-    match job["output_format"]:
-        case OutputFormatEnum.TXT:
-            file_path = Path(api_file_storage_dir) / f"{job['uuid']}.txt"
-        case OutputFormatEnum.SRT:
-            file_path = Path(api_file_storage_dir) / f"{job['uuid']}.srt"
-        case OutputFormatEnum.CSV:
-            file_path = Path(api_file_storage_dir) / f"{job['uuid']}.csv"
-        case _:
+    if job["status"] not in (JobStatusEnum.UPLOADING, JobStatusEnum.UPLOADED):
+        return JSONResponse(
+            content={"result": {"error": "Job is not being uploaded"}},
+            status_code=409,
+        )
+
+    if job["status"] == JobStatusEnum.UPLOADING:
+        data = await request.json()
+        upload_id = data.get("upload_id")
+
+        try:
+            if upload_id:
+                await run_in_threadpool(
+                    upload_storage.complete_multipart_upload,
+                    job_id,
+                    upload_id,
+                    data.get("parts", []),
+                )
+        except Exception as e:
+            try:
+                await run_in_threadpool(
+                    upload_storage.abort_multipart_upload, job_id, upload_id
+                )
+            except Exception as abort_error:
+                print(f"Error aborting upload {upload_id}: {abort_error}")
+
+            job_update(db_session, job_id, status=JobStatusEnum.FAILED, error=str(e))
+            return JSONResponse(content={"result": {"error": str(e)}}, status_code=500)
+
+        if not upload_storage.exists(job_id):
             return JSONResponse(
-                content={"result": {"error": "Unsupported output format"}},
-                status_code=400,
+                content={"result": {"error": "File not found"}}, status_code=404
             )
 
-    if not file_path.exists():
-        return {"result": {"error": "File not found"}}
+        job = job_update(db_session, job_id, status=JobStatusEnum.UPLOADED)
+        background_tasks.add_task(process_upload, job_id)
 
-    return FileResponse(file_path)
+    return JSONResponse(
+        content={
+            "result": {
+                "uuid": job["uuid"],
+                "status": job["status"],
+                "job_type": job["job_type"],
+                "filename": job["filename"],
+            }
+        }
+    )
@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from pathlib import Path
+from starlette.responses import Response
+from storage import Storage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Cache lifetime for content that never changes under the same URL
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Pre-compressed variants in order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def file_etag(file_path: Path) -> str:
+    """
+    Get the ETag of a file, computed the same way as FileResponse does.
+    """
+    stat_result = file_path.stat()
+    etag_base = f"{stat_result.st_mtime}-{stat_result.st_size}"
+
+    return f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """
+    Check the conditional request headers against the file.
+    """
+    if if_none_match := request.headers.get("if-none-match"):
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if if_modified_since := request.headers.get("if-modified-since"):
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def accepted_encoding(request: Request, file_path: Path) -> tuple[str, Path]:
+    """
+    Find a pre-compressed variant of the file accepted by the client.
+    """
+    if request.headers.get("range"):
+        return "", file_path
+
+    accept_encoding = request.headers.get("accept-encoding", "")
+    accepted = {value.split(";")[0].strip() for value in accept_encoding.split(",")}
+
+    for encoding, suffix in ENCODINGS:
+        variant = file_path.with_name(file_path.name + suffix)
+        if encoding in accepted and variant.exists():
+            return encoding, variant
+
+    return "", file_path
+
+
+def precompress(storage: Storage, key: str) -> None:
+    """
+    Store compressed variants of a text file next to it so they are
+    not compressed again on every request.
+    """
+    if not (file_path := storage.local_path(key)) or not file_path.exists():
+        return
+
+    data = file_path.read_bytes()
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        variants[".br"] = brotli.compress(data, mode=brotli.MODE_TEXT)
+
+    for suffix, compressed in variants.items():
+        variant = file_path.with_name(file_path.name + suffix)
+        tmp_path = variant.with_name(f"{variant.name}.part")
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, variant)
+        shutil.copystat(file_path, variant)
+
+
+def delete_with_variants(storage: Storage, key: str) -> None:
+    """
+    Delete an object together with its pre-compressed variants.
+    """
+    storage.delete(key)
+
+    for _, suffix in ENCODINGS:
+        storage.delete(key + suffix)
+
+
+def storage_response(
+    request: Request,
+    storage: Storage,
+    key: str,
+    immutable: bool = False,
+    version: str = None,
+    media_type: str = None,
+    headers: dict = None,
+    **kwargs,
+) -> Response:
+    """
+    Serve an object from storage, either directly from the local
+    filesystem or by redirecting to a presigned URL.
+
+    Local files support Range requests, conditional requests answered
+    with 304 and pre-compressed variants created by precompress(). Files
+    that never change, or requested with their current ETag as version,
+    are cached for a year.
+    """
+    if not storage.exists(key):
+        return JSONResponse(
+            content={"result": {"error": "File not found"}}, status_code=404
+        )
+
+    if not (file_path := storage.local_path(key)):
+        return RedirectResponse(url=storage.presign_get(key))
+
+    mtime = file_path.stat().st_mtime
+    etag = file_etag(file_path)
+
+    if version and version == etag.strip('"'):
+        immutable = True
+
+    headers = {
+        **(headers or {}),
+        "Cache-Control": (
+            f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+            if immutable
+            else "no-cache"
+        ),
+        "Vary": "Accept-Encoding",
+        "Last-Modified": formatdate(mtime, usegmt=True),
+    }
+
+    encoding, variant = accepted_encoding(request, file_path)
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+        headers["Content-Encoding"] = encoding
+
+    headers["ETag"] = etag
+
+    if is_not_modified(request, etag, mtime):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        variant,
+        media_type=media_type
+        or mimetypes.guess_type(file_path.name)[0]
+        or "text/plain",
+        headers=headers,
+        **kwargs,
+    )
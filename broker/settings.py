@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
 
@@ -23,6 +24,58 @@ class Settings(BaseSettings):
     API_DESCRIPTION: str = "A REST API for the Whisper ASR model"
     API_FILE_UPLOAD_DIR: str = "/tmp/uploads"
     API_FILE_STORAGE_DIR: str = "/tmp/downloads"
+    API_MODEL_DIR: str = "/tmp/models"
+    API_SHARED_STORAGE: bool = False
+    STORAGE_BACKEND: str = "local"
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_REGION: str = "us-east-1"
+    S3_BUCKET: str = "whisper-rest"
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_PRESIGN_EXPIRES: int = 3600
+    S3_MULTIPART_PART_SIZE: int = 64 * 1024 * 1024
+    MEDIA_WORKERS: int = 2
+    PREVIEW_ENABLED: bool = True
+    PREVIEW_HEIGHT: int = 360
+    PREVIEW_VIDEO_BITRATE: str = "300k"
+    PREVIEW_AUDIO_BITRATE: str = "64k"
+    PEAKS_SAMPLES_PER_BUCKET: int = 1600
+    RETENTION_INTERVAL: int = 60 * 10
+    RETENTION_MAX_AGE_DAYS: int = 30
+    RETENTION_ORPHAN_GRACE: int = 60 * 60
+    RETENTION_BATCH_SIZE: int = 500
+    UPLOAD_QUOTA_BYTES: int = 0
+    RESULT_QUOTA_BYTES: int = 0
+    USER_QUOTA_BYTES: int = 0
+    ADMISSION_MIN_FREE_BYTES: int = 5 * 1024**3
+    ADMISSION_MAX_INFLIGHT_BYTES: int = 20 * 1024**3
+    ADMISSION_MAX_QUEUE_HOURS: float = 48
+    ADMISSION_RETRY_AFTER: int = 30
+    TENANT_REQUESTS_PER_MINUTE: float = 30
+    TENANT_BURST: int = 10
+    TENANT_AUDIO_MINUTES_PER_DAY: int = 0
+    USAGE_PERSIST_INTERVAL: int = 60
+    TRANSCRIPT_SNAPSHOT_VERSIONS: int = 20
+    DRAFT_MODEL: str = "tiny"
+    REFINE_PRIORITY: int = -10
+    SPLIT_MIN_SECONDS: int = 30 * 60
+    SPLIT_SEGMENT_SECONDS: int = 10 * 60
+    SPLIT_SEARCH_SECONDS: int = 30
+    SPLIT_OVERLAP_SECONDS: float = 2
+    ANALYTICS_ROLLUP_INTERVAL: int = 60 * 10
+    ANALYTICS_EVENT_DAYS: int = 30
+    RETRY_POLICIES: dict[str, tuple[int, float]] = {
+        "killed": (3, 60),
+        "resources": (3, 300),
+        "network": (5, 30),
+        "process": (2, 30),
+        "missing": (1, 0),
+        "timeout": (2, 60),
+        "stalled": (3, 60),
+        "memory": (2, 300),
+        "unknown": (2, 60),
+    }
+    RETRY_MAX_DELAY: int = 60 * 60
 
 
 @lru_cache
@@ -34,5 +87,7 @@ def get_settings() -> Settings:
         os.makedirs(Settings().API_FILE_UPLOAD_DIR)
     if not os.path.exists(Settings().API_FILE_STORAGE_DIR):
         os.makedirs(Settings().API_FILE_STORAGE_DIR)
+    if not os.path.exists(Settings().API_MODEL_DIR):
+        os.makedirs(Settings().API_MODEL_DIR)
 
     return Settings()
@@ -0,0 +1,303 @@
+import os
+import shutil
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+from settings import get_settings
+
+settings = get_settings()
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class Storage(ABC):
+    """
+    Base class for storage backends holding uploads and results.
+    """
+
+    # Backends that can hand out presigned URLs for direct transfers
+    presigned: bool = False
+
+    @abstractmethod
+    def save(self, key: str, fileobj: BinaryIO) -> None:
+        """
+        Store the contents of a file object under the given key.
+        """
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """
+        Open the object for reading.
+        """
+
+    @abstractmethod
+    def size(self, key: str) -> Optional[int]:
+        """
+        Return the size of the object, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Delete the object if it exists.
+        """
+
+    @abstractmethod
+    def list_objects(self) -> Iterator[tuple[str, int, float]]:
+        """
+        List all objects as (key, size, modification time) without
+        loading the whole listing into memory.
+        """
+
+    def exists(self, key: str) -> bool:
+        """
+        Check if the object exists.
+        """
+        return self.size(key) is not None
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """
+        Return a local filesystem path for the object, if there is one.
+        """
+        return None
+
+    def presign_get(self, key: str) -> Optional[str]:
+        """
+        Return a presigned URL for downloading the object.
+        """
+        return None
+
+    def presign_put(self, key: str) -> Optional[str]:
+        """
+        Return a presigned URL for uploading the object.
+        """
+        return None
+
+    def create_multipart_upload(self, key: str) -> str:
+        """
+        Start a multipart upload and return its upload ID.
+        """
+        raise NotImplementedError("Multipart uploads are not supported")
+
+    def presign_upload_part(self, key: str, upload_id: str, part_number: int) -> str:
+        """
+        Return a presigned URL for uploading one part of a multipart upload.
+        """
+        raise NotImplementedError("Multipart uploads are not supported")
+
+    def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: list[dict]
+    ) -> None:
+        """
+        Complete a multipart upload from a list of part numbers and ETags.
+        """
+        raise NotImplementedError("Multipart uploads are not supported")
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        """
+        Abort a multipart upload and discard the uploaded parts.
+        """
+        raise NotImplementedError("Multipart uploads are not supported")
+
+
+class LocalStorage(Storage):
+    """
+    Storage backend using a directory on the local filesystem.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def local_path(self, key: str) -> Path:
+        # Never allow keys to escape the storage directory
+        return self.root / Path(key).name
+
+    def save(self, key: str, fileobj: BinaryIO) -> None:
+        file_path = self.local_path(key)
+        tmp_path = file_path.with_name(f"{file_path.name}.part")
+
+        with open(tmp_path, "wb") as out_file:
+            shutil.copyfileobj(fileobj, out_file, COPY_BUFFER_SIZE)
+
+        # Readers never see a partially written file
+        os.replace(tmp_path, file_path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return self.local_path(key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> None:
+        self.local_path(key).unlink(missing_ok=True)
+
+    def list_objects(self) -> Iterator[tuple[str, int, float]]:
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+
+                yield entry.name, stat.st_size, stat.st_mtime
+
+
+class S3Storage(Storage):
+    """
+    Storage backend using an S3 compatible object store such as MinIO.
+    """
+
+    presigned = True
+
+    def __init__(self, bucket: str, prefix: str = ""):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError as e:
+            raise RuntimeError("The S3 storage backend requires boto3") from e
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expires = settings.S3_PRESIGN_EXPIRES
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            config=Config(signature_version="s3v4"),
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{Path(key).name}"
+
+    def save(self, key: str, fileobj: BinaryIO) -> None:
+        # upload_fileobj switches to multipart uploads for large files
+        self.client.upload_fileobj(fileobj, self.bucket, self._key(key))
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+
+    def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+        return response["ContentLength"]
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list_objects(self) -> Iterator[tuple[str, int, float]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield (
+                    item["Key"][len(self.prefix) :],
+                    item["Size"],
+                    item["LastModified"].timestamp(),
+                )
+
+    def presign_get(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=self.expires,
+        )
+
+    def presign_put(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=self.expires,
+        )
+
+    def create_multipart_upload(self, key: str) -> str:
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self._key(key)
+        )
+
+        return response["UploadId"]
+
+    def presign_upload_part(self, key: str, upload_id: str, part_number: int) -> str:
+        return self.client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self._key(key),
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+            },
+            ExpiresIn=self.expires,
+        )
+
+    def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: list[dict]
+    ) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": int(part["part_number"]), "ETag": part["etag"]}
+                    for part in sorted(parts, key=lambda p: int(p["part_number"]))
+                ]
+            },
+        )
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self._key(key), UploadId=upload_id
+        )
+
+
+def create_storage(local_dir: str, prefix: str) -> Storage:
+    """
+    Create the storage backend selected in the settings.
+    """
+    match settings.STORAGE_BACKEND:
+        case "local":
+            return LocalStorage(local_dir)
+        case "s3":
+            return S3Storage(settings.S3_BUCKET, prefix)
+        case _:
+            raise ValueError(f"Unsupported storage backend: {settings.STORAGE_BACKEND}")
+
+
+@lru_cache
+def get_upload_storage() -> Storage:
+    """
+    Get the storage for uploaded media files.
+    """
+    return create_storage(settings.API_FILE_UPLOAD_DIR, "uploads/")
+
+
+@lru_cache
+def get_result_storage() -> Storage:
+    """
+    Get the storage for transcription results.
+    """
+    return create_storage(settings.API_FILE_STORAGE_DIR, "results/")
+
+
+@lru_cache
+def get_model_storage() -> Storage:
+    """
+    Get the storage for the model files of the registry.
+    """
+    return create_storage(settings.API_MODEL_DIR, "models/")
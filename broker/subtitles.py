@@ -0,0 +1,287 @@
+import re
+
+from typing import Optional
+
+TIMESTAMP_RE = re.compile(r"^\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*$")
+
+
+def parse_timestamp(value: str) -> Optional[int]:
+    """
+    Parse an SRT timestamp (HH:MM:SS,mmm) into milliseconds.
+    Returns None if the timestamp is invalid.
+    """
+    if not (match := TIMESTAMP_RE.match(value)):
+        return None
+
+    hours, minutes, seconds, milliseconds = match.groups()
+    if int(minutes) > 59 or int(seconds) > 59:
+        return None
+
+    total_seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+    return total_seconds * 1000 + int(milliseconds.ljust(3, "0"))
+
+
+def format_timestamp(ms: int) -> str:
+    """
+    Format milliseconds as an SRT timestamp (HH:MM:SS,mmm).
+    """
+    seconds, ms = divmod(max(ms, 0), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def parse_srt(content: str) -> list[dict]:
+    """
+    Parse SRT content into a list of cues in a single pass.
+
+    Every timing line starts a new cue and the cue text runs until the
+    next timing line, minus its index line. Cue IDs are the position of
+    the cue in the file, starting from 1.
+    """
+    cues = []
+    cue = None
+    text_lines = []
+
+    def close_cue(next_cue: bool):
+        while text_lines and not text_lines[-1].strip():
+            text_lines.pop()
+
+        # The last line before the next timing line is that cue's index
+        if next_cue and text_lines and text_lines[-1].strip().isdigit():
+            text_lines.pop()
+            while text_lines and not text_lines[-1].strip():
+                text_lines.pop()
+
+        cue["text"] = "\n".join(line.strip() for line in text_lines)
+
+    for line in content.lstrip("\ufeff").splitlines():
+        if "-->" in line:
+            start, _, end = line.partition("-->")
+            start_ms = parse_timestamp(start)
+            end_ms = parse_timestamp(end.split()[0] if end.split() else "")
+
+            if start_ms is not None and end_ms is not None:
+                if cue is not None:
+                    close_cue(next_cue=True)
+
+                cue = {
+                    "id": str(len(cues) + 1),
+                    "start_ms": start_ms,
+                    "end_ms": end_ms,
+                    "text": "",
+                }
+                cues.append(cue)
+                text_lines = []
+                continue
+
+        if cue is not None and (text_lines or line.strip()):
+            text_lines.append(line)
+
+    if cue is not None:
+        close_cue(next_cue=False)
+
+    return cues
+
+
+def render_srt(cues: list[dict]) -> str:
+    """
+    Render cues as SRT content.
+    """
+    return "".join(
+        f"{index}\n{format_timestamp(cue['start_ms'])} --> "
+        f"{format_timestamp(cue['end_ms'])}\n{cue['text']}\n\n"
+        for index, cue in enumerate(cues, start=1)
+    )
+
+
+def normalized_words(text: str) -> list[tuple[int, str]]:
+    """
+    Get the words of a cue text as (index, word) with the index of the
+    word in text.split(), lowercase and without punctuation.
+    """
+    words = (re.sub(r"[^\w]", "", word.lower()) for word in text.split())
+
+    return [(index, word) for index, word in enumerate(words) if word]
+
+
+def repeated_words(previous: str, text: str) -> int:
+    """
+    Get the number of words at the start of a cue after a seam that
+    repeat the end of the cue before it, ignoring case and punctuation.
+    The audio at a seam is in both segments and the later copy usually
+    starts in the middle of a word, so the first word only has to match
+    the end of a word.
+    """
+    tail = [word for _, word in normalized_words(previous)]
+    head = [word for _, word in normalized_words(text)]
+
+    for count in range(min(len(tail), len(head)), 0, -1):
+        before = tail[-count:]
+        after = head[:count]
+        if before[1:] == after[1:] and before[0].endswith(after[0]):
+            return count
+
+    return 0
+
+
+def strip_words(text: str, count: int) -> str:
+    """
+    Remove the given number of words from the start of a cue text.
+    """
+    words = normalized_words(text)
+    if count >= len(words):
+        return ""
+
+    return " ".join(text.split()[words[count][0] :])
+
+
+def merge_cues(segments: list[tuple[int, list[dict]]]) -> list[dict]:
+    """
+    Merge the cues of consecutive segments of a recording, given as
+    (start_ms, cues) with times relative to the start of the segment.
+
+    A segment may run past the start of the next one, its cues starting
+    after that are dropped, so speech across a seam is in the last cue
+    before it. Cues of the next segment within that cue are dropped, and
+    words it repeats are removed from the cue running past it. Cues are
+    shortened so they do not overlap the next segment. Cue IDs are
+    renumbered in the order of the merged cues.
+    """
+    merged = []
+
+    for index, (start_ms, cues) in enumerate(segments):
+        next_start = segments[index + 1][0] if index + 1 < len(segments) else None
+        seam = bool(merged)
+
+        for cue in cues:
+            cue = dict(
+                cue,
+                start_ms=cue["start_ms"] + start_ms,
+                end_ms=cue["end_ms"] + start_ms,
+            )
+            if next_start is not None and cue["start_ms"] >= next_start:
+                break
+
+            if seam:
+                previous = merged[-1]
+
+                if cue["start_ms"] < previous["end_ms"]:
+                    if cue["end_ms"] <= previous["end_ms"]:
+                        continue
+
+                    if count := repeated_words(previous["text"], cue["text"]):
+                        cue["text"] = strip_words(cue["text"], count)
+                        cue["start_ms"] = previous["end_ms"]
+
+                    if not cue["text"]:
+                        continue
+
+                previous["end_ms"] = min(previous["end_ms"], cue["start_ms"])
+
+            seam = False
+            merged.append(cue)
+
+    for position, cue in enumerate(merged, start=1):
+        cue["id"] = str(position)
+
+    return merged
+
+
+def validate_ops(ops: list) -> Optional[str]:
+    """
+    Validate a list of cue edits, returning an error message if invalid.
+
+    Supported edits:
+      {"op": "insert", "id": ..., "after": id or None, "start_ms", "end_ms", "text"}
+      {"op": "update", "id": ..., and any of "start_ms", "end_ms", "text"}
+      {"op": "delete", "id": ...}
+    """
+    if not isinstance(ops, list) or not ops:
+        return "No edits given"
+
+    for op in ops:
+        if not isinstance(op, dict) or not isinstance(op.get("id"), str):
+            return "Every edit needs a cue ID"
+        if op.get("op") not in ("insert", "update", "delete"):
+            return f"Unsupported edit: {op.get('op')}"
+        for field in ("start_ms", "end_ms"):
+            if field in op and (not isinstance(op[field], int) or op[field] < 0):
+                return f"Invalid {field} in edit of cue {op['id']}"
+        if "text" in op and not isinstance(op["text"], str):
+            return f"Invalid text in edit of cue {op['id']}"
+        if op["op"] == "insert" and not {"start_ms", "end_ms", "text"} <= op.keys():
+            return f"Inserted cue {op['id']} needs start_ms, end_ms and text"
+
+    return None
+
+
+def apply_edits(cues: list[dict], edits: list[list[dict]]) -> list[dict]:
+    """
+    Apply lists of cue edits, in order, on top of the original cues.
+
+    Cues are kept in a linked list so every edit costs O(1) and the
+    result is assembled in one pass. Edits of unknown cues are ignored.
+    """
+    by_id = {cue["id"]: dict(cue) for cue in cues}
+    next_id = {}
+    prev_id = {}
+
+    previous = None
+    for cue in cues:
+        next_id[previous] = cue["id"]
+        prev_id[cue["id"]] = previous
+        previous = cue["id"]
+    next_id[previous] = None
+
+    for ops in edits:
+        for op in ops:
+            cue_id = op["id"]
+
+            match op["op"]:
+                case "insert":
+                    after = op.get("after")
+                    if cue_id in by_id or (after is not None and after not in by_id):
+                        continue
+
+                    by_id[cue_id] = {
+                        "id": cue_id,
+                        "start_ms": op["start_ms"],
+                        "end_ms": op["end_ms"],
+                        "text": op["text"],
+                    }
+                    following = next_id.get(after)
+                    next_id[after] = cue_id
+                    prev_id[cue_id] = after
+                    next_id[cue_id] = following
+                    if following is not None:
+                        prev_id[following] = cue_id
+                case "update":
+                    if cue_id in by_id:
+                        by_id[cue_id].update(
+                            {
+                                key: op[key]
+                                for key in ("start_ms", "end_ms", "text")
+                                if key in op
+                            }
+                        )
+                case "delete":
+                    if cue_id not in by_id:
+                        continue
+
+                    del by_id[cue_id]
+                    before = prev_id.pop(cue_id)
+                    following = next_id.pop(cue_id)
+                    next_id[before] = following
+                    if following is not None:
+                        prev_id[following] = before
+
+    result = []
+    cue_id = next_id.get(None)
+    while cue_id is not None:
+        result.append(by_id[cue_id])
+        cue_id = next_id[cue_id]
+
+    return result
@@ -0,0 +1,32 @@
+import os
+import pytest
+import sys
+import tempfile
+
+from pathlib import Path
+
+# The broker modules import each other from the broker directory, and the
+# settings are read on import, so keep the tests away from a real database
+# and storage.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+directory = tempfile.mkdtemp(prefix="broker-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{directory}/jobs.db")
+os.environ.setdefault("API_FILE_UPLOAD_DIR", f"{directory}/uploads")
+os.environ.setdefault("API_FILE_STORAGE_DIR", f"{directory}/downloads")
+os.environ.setdefault("API_MODEL_DIR", f"{directory}/models")
+
+
+@pytest.fixture
+def session():
+    """A database session, the rows the test added are removed after it"""
+    from db.models import Job, JobEvent, TranscriptCue, TranscriptEdit
+    from db.session import get_session
+
+    session = get_session()
+    yield session
+    session.rollback()
+    for model in (TranscriptCue, TranscriptEdit, JobEvent, Job):
+        session.query(model).delete()
+    session.commit()
+    session.close()
@@ -0,0 +1,47 @@
+import admission
+import pytest
+
+from admission import TokenBucket
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_allows_burst(clock):
+    bucket = TokenBucket(rate=1, burst=3)
+
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(1)
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, burst=1)
+
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(0.5)
+
+    clock.now += 0.25
+    assert bucket.take() == pytest.approx(0.25)
+
+    clock.now += 0.25
+    assert bucket.take() == 0
+
+
+def test_token_bucket_does_not_exceed_burst(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+
+    clock.now += 3600
+    assert [bucket.take() for _ in range(2)] == [0, 0]
+    assert bucket.take() == pytest.approx(1)
@@ -0,0 +1,30 @@
+import pytest
+
+from db.analytics import bucket_seconds, latency_bucket, percentile
+
+
+def test_percentile_of_empty_histogram():
+    assert percentile({}, 0.5) == 0.0
+
+
+def test_percentile_of_one_bucket():
+    bucket = latency_bucket(10)
+
+    assert percentile({bucket: 5}, 0.5) == bucket_seconds(bucket)
+    assert percentile({bucket: 5}, 0.99) == bucket_seconds(bucket)
+
+
+def test_percentile_picks_bucket_by_count():
+    fast, slow = latency_bucket(1), latency_bucket(100)
+    histogram = {slow: 10, fast: 90}
+
+    assert percentile(histogram, 0.5) == bucket_seconds(fast)
+    assert percentile(histogram, 0.9) == bucket_seconds(fast)
+    assert percentile(histogram, 0.95) == bucket_seconds(slow)
+
+
+def test_bucket_seconds_within_bucket():
+    for seconds in (0.05, 1, 42, 3600):
+        assert bucket_seconds(latency_bucket(seconds)) == pytest.approx(
+            seconds, rel=0.2
+        )
@@ -0,0 +1,144 @@
+import asyncio
+import dispatch
+
+from db.models import Job, JobStatusEnum, JobType
+from dispatch import Dispatcher, WorkerConnection
+
+
+class FakeWebSocket:
+    def __init__(self, fail: bool = False) -> None:
+        self.sent = []
+        self.fail = fail
+
+    async def send_json(self, message: dict) -> None:
+        if self.fail:
+            raise ConnectionError("Connection closed")
+        self.sent.append(message)
+
+
+def add_job(session, language: str = "sv", model_type: str = "base") -> str:
+    job = Job(
+        job_type=JobType.TRANSCRIPTION,
+        status=JobStatusEnum.PENDING,
+        language=language,
+        model_type=model_type,
+    )
+    session.add(job)
+    session.commit()
+    return job.uuid
+
+
+def connect(dispatcher: Dispatcher, free: int, warm=(), fail=False):
+    worker = WorkerConnection(FakeWebSocket(fail))
+    worker.update({"name": f"worker-{len(dispatcher.workers)}", "free": free})
+    worker.warm = set(warm)
+    dispatcher.connect(worker)
+    return worker
+
+
+def status(session, uuid: str) -> JobStatusEnum:
+    session.expire_all()
+    return session.query(Job).filter(Job.uuid == uuid).one().status
+
+
+def dispatch_jobs(dispatcher: Dispatcher) -> None:
+    asyncio.run(dispatcher.dispatch(lambda job: {"uuid": job["uuid"]}))
+
+
+def test_dispatch_prefers_warm_worker(session):
+    dispatcher = Dispatcher()
+    cold = connect(dispatcher, 2)
+    warm = connect(dispatcher, 1, warm=[("sv", "large")])
+    uuid = add_job(session, "sv", "large")
+
+    dispatch_jobs(dispatcher)
+
+    assert warm.websocket.sent == [{"type": "job", "job": {"uuid": uuid}}]
+    assert cold.websocket.sent == []
+    assert uuid in warm.unacked
+    assert status(session, uuid) == JobStatusEnum.IN_PROGRESS
+
+
+def test_dispatch_fills_free_slots_only(session):
+    dispatcher = Dispatcher()
+    worker = connect(dispatcher, 2)
+    uuids = [add_job(session) for _ in range(3)]
+
+    dispatch_jobs(dispatcher)
+
+    assert [message["job"]["uuid"] for message in worker.websocket.sent] == uuids[:2]
+    assert worker.free == 0
+    assert status(session, uuids[2]) == JobStatusEnum.PENDING
+
+    # Unacknowledged jobs do not count as free slots
+    worker.update({"free": 2})
+    assert worker.free == 0
+
+
+def test_ack_keeps_job_with_worker(session):
+    dispatcher = Dispatcher()
+    worker = connect(dispatcher, 1)
+    uuid = add_job(session)
+    dispatch_jobs(dispatcher)
+
+    asyncio.run(dispatcher.ack(worker, uuid))
+    dispatcher.disconnect(worker)
+
+    assert worker.unacked == {}
+    assert status(session, uuid) == JobStatusEnum.IN_PROGRESS
+    assert len(worker.websocket.sent) == 1
+
+
+def test_requeue_expired_assignment(session, monkeypatch):
+    dispatcher = Dispatcher()
+    worker = connect(dispatcher, 1)
+    uuid = add_job(session)
+    dispatch_jobs(dispatcher)
+
+    monkeypatch.setattr(dispatch, "ACK_TIMEOUT", -1)
+    dispatcher.requeue_expired()
+
+    assert worker.unacked == {}
+    assert status(session, uuid) == JobStatusEnum.PENDING
+    assert dispatcher.wakeup.is_set()
+
+    # The late acknowledgement stops the job on the worker
+    asyncio.run(dispatcher.ack(worker, uuid))
+    assert worker.websocket.sent[-1] == {"type": "cancel", "uuids": [uuid]}
+
+
+def test_disconnect_requeues_unacknowledged_jobs(session):
+    dispatcher = Dispatcher()
+    worker = connect(dispatcher, 1)
+    uuid = add_job(session)
+    dispatch_jobs(dispatcher)
+
+    dispatcher.disconnect(worker)
+
+    assert worker not in dispatcher.workers
+    assert status(session, uuid) == JobStatusEnum.PENDING
+
+
+def test_dispatch_requeues_job_worker_can_not_receive(session):
+    dispatcher = Dispatcher()
+    worker = connect(dispatcher, 1, fail=True)
+    uuid = add_job(session)
+
+    dispatch_jobs(dispatcher)
+
+    assert worker not in dispatcher.workers
+    assert status(session, uuid) == JobStatusEnum.PENDING
+
+
+def test_cancel_forgets_unacknowledged_job(session):
+    dispatcher = Dispatcher()
+    worker = connect(dispatcher, 1)
+    other = connect(dispatcher, 0)
+    uuid = add_job(session)
+    dispatch_jobs(dispatcher)
+
+    asyncio.run(dispatcher.cancel([uuid]))
+
+    assert worker.unacked == {}
+    assert worker.websocket.sent[-1] == {"type": "cancel", "uuids": [uuid]}
+    assert other.websocket.sent == [{"type": "cancel", "uuids": [uuid]}]
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from db.job import (
+    job_cancel,
+    job_cleanup,
+    job_get_unprobed,
+    job_reject_upload,
+    job_update_media,
+)
+from db.models import Job, JobStatusEnum, JobType, ResultStageEnum
+
+
+def add_job(session, status: JobStatusEnum, hours: float, **kwargs) -> Job:
+    """Add a job last updated the given number of hours ago"""
+    time = datetime.utcnow() - timedelta(hours=hours)
+    job = Job(
+        job_type=JobType.TRANSCRIPTION,
+        status=status,
+        updated_at=time,
+        status_at=time,
+        **kwargs,
+    )
+    session.add(job)
+    session.commit()
+    return job
+
+
+def test_job_cleanup_keeps_queued_and_submitted_jobs(session):
+    jobs = [
+        add_job(session, JobStatusEnum.PENDING, 24),
+        add_job(session, JobStatusEnum.UPLOADED, 24),
+        add_job(session, JobStatusEnum.COMPLETED, 24),
+        add_job(session, JobStatusEnum.DEAD_LETTER, 24),
+        add_job(session, JobStatusEnum.CANCELLED, 24),
+    ]
+
+    assert job_cleanup(session) == []
+    assert session.query(Job).count() == len(jobs)
+
+
+def test_job_cleanup_removes_stuck_jobs(session):
+    stuck = {
+        add_job(session, JobStatusEnum.IN_PROGRESS, 2).uuid,
+        add_job(session, JobStatusEnum.UPLOADING, 2).uuid,
+        add_job(session, JobStatusEnum.FAILED, 2).uuid,
+    }
+    add_job(session, JobStatusEnum.IN_PROGRESS, 0.5)
+    add_job(
+        session,
+        JobStatusEnum.FAILED,
+        2,
+        not_before=datetime.utcnow() + timedelta(minutes=5),
+    )
+
+    assert set(job_cleanup(session)) == stuck
+    assert session.query(Job).count() == 2
+
+
+def test_job_cleanup_keeps_jobs_with_heartbeat(session):
+    job = add_job(session, JobStatusEnum.IN_PROGRESS, 2)
+    job.updated_at = datetime.utcnow()
+    session.commit()
+
+    assert job_cleanup(session) == []
+
+
+def test_job_cleanup_requeues_segments_and_refinements(session):
+    parent = add_job(session, JobStatusEnum.IN_PROGRESS, 2, segment_count=2)
+    segment = add_job(session, JobStatusEnum.IN_PROGRESS, 2, parent_uuid=parent.uuid)
+    refinement = add_job(
+        session,
+        JobStatusEnum.IN_PROGRESS,
+        2,
+        result_stage=ResultStageEnum.DRAFT.value,
+    )
+
+    assert job_cleanup(session) == []
+
+    for job in (parent, segment, refinement):
+        session.refresh(job)
+    assert parent.status == JobStatusEnum.IN_PROGRESS
+    assert segment.status == JobStatusEnum.PENDING
+    assert refinement.status == JobStatusEnum.PENDING
+
+
+def test_job_reject_upload_fails_uploaded_job(session):
+    job = add_job(session, JobStatusEnum.UPLOADED, 0)
+
+    assert job_reject_upload(session, job.uuid, "Not a media file")
+
+    session.refresh(job)
+    assert job.status == JobStatusEnum.FAILED
+    assert job.error == "Not a media file"
+    assert job.probed_at is not None
+
+
+def test_job_reject_upload_leaves_submitted_job(session):
+    for status in (JobStatusEnum.PENDING, JobStatusEnum.IN_PROGRESS):
+        job = add_job(session, status, 0)
+
+        assert not job_reject_upload(session, job.uuid, "Not a media file")
+
+        session.refresh(job)
+        assert job.status == status
+        assert job.error is None
+
+
+def test_job_get_unprobed(session):
+    probed = add_job(session, JobStatusEnum.UPLOADED, 0)
+    unprobed = add_job(session, JobStatusEnum.UPLOADED, 0)
+    add_job(session, JobStatusEnum.PENDING, 0)
+    job_update_media(session, probed.uuid, {"duration": 10.0})
+
+    assert job_get_unprobed(session) == [unprobed.uuid]
+
+
+def test_job_cancel(session):
+    job = add_job(session, JobStatusEnum.IN_PROGRESS, 0)
+    segments = [
+        add_job(session, JobStatusEnum.PENDING, 0, parent_uuid=job.uuid),
+        add_job(session, JobStatusEnum.IN_PROGRESS, 0, parent_uuid=job.uuid),
+    ]
+    finished = add_job(session, JobStatusEnum.COMPLETED, 0, parent_uuid=job.uuid)
+
+    cancelled = job_cancel(session, job.uuid)
+
+    assert cancelled == [job.uuid] + [segment.uuid for segment in segments]
+    assert job.status == JobStatusEnum.CANCELLED
+    assert all(segment.status == JobStatusEnum.CANCELLED for segment in segments)
+    assert finished.status == JobStatusEnum.COMPLETED
+
+
+def test_job_cancel_refinement_keeps_draft(session):
+    job = add_job(
+        session,
+        JobStatusEnum.PENDING,
+        0,
+        result_stage=ResultStageEnum.DRAFT.value,
+        not_before=datetime.utcnow(),
+    )
+
+    assert job_cancel(session, job.uuid) == [job.uuid]
+    assert job.status == JobStatusEnum.COMPLETED
+    assert job.result_stage == ResultStageEnum.FINAL.value
+    assert job.not_before is None
+
+
+def test_job_cancel_inactive(session):
+    job = add_job(session, JobStatusEnum.COMPLETED, 0)
+
+    assert job_cancel(session, job.uuid) == []
+    assert job_cancel(session, "missing") == []
+    assert job.status == JobStatusEnum.COMPLETED
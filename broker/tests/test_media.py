@@ -0,0 +1,73 @@
+import media
+import numpy as np
+import pytest
+
+from media import quietest_point, split_segments
+
+
+def peaks(amplitude: list[int], samples_per_pixel: int = 1600) -> dict:
+    """Waveform peaks of (min, max) pairs with the given amplitudes"""
+    data = []
+    for value in amplitude:
+        data += [-(value // 2), value - value // 2]
+
+    return {
+        "data": data,
+        "length": len(amplitude),
+        "samples_per_pixel": samples_per_pixel,
+        "sample_rate": 16000,
+    }
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    monkeypatch.setattr(media.settings, "SPLIT_SEGMENT_SECONDS", 60)
+    monkeypatch.setattr(media.settings, "SPLIT_SEARCH_SECONDS", 5)
+    monkeypatch.setattr(media.settings, "SPLIT_OVERLAP_SECONDS", 2)
+    return media.settings
+
+
+def test_quietest_point_finds_silence():
+    amplitude = np.full(200, 1000)
+    amplitude[120:130] = 0
+
+    # Buckets of 0.1 s, silence from 12 to 13 s
+    assert 12 < quietest_point(amplitude, 0.1, 10, 5) < 13
+
+
+def test_quietest_point_only_searches_near_target():
+    amplitude = np.full(400, 1000)
+    amplitude[300:310] = 0
+
+    assert 5 <= quietest_point(amplitude, 0.1, 10, 5) <= 15
+
+
+def test_quietest_point_without_enough_audio():
+    assert quietest_point(np.zeros(3), 0.1, 10, 5) == 10
+
+
+def test_split_segments_short_upload(settings, monkeypatch):
+    monkeypatch.setattr(media, "load_peaks", lambda job_id: None)
+
+    assert split_segments("job", 40) == [(0.0, 40)]
+
+
+def test_split_segments_without_waveform(settings, monkeypatch):
+    monkeypatch.setattr(media, "load_peaks", lambda job_id: None)
+
+    assert split_segments("job", 180) == [(0.0, 62), (60, 62), (120, 60)]
+
+
+def test_split_segments_cuts_at_silence(settings, monkeypatch):
+    # Buckets of 0.1 s, silence from 63 to 64 s near the cut at 60 s
+    amplitude = [1000] * 1200
+    amplitude[630:640] = [0] * 10
+    monkeypatch.setattr(media, "load_peaks", lambda job_id: peaks(amplitude))
+
+    segments = split_segments("job", 120)
+
+    assert len(segments) == 2
+    cut = segments[1][0]
+    assert 63 < cut < 64
+    assert segments[0] == (0.0, pytest.approx(cut + 2))
+    assert segments[1][0] + segments[1][1] == 120
@@ -0,0 +1,78 @@
+import pytest
+import retention
+
+from datetime import datetime, timedelta
+from db.models import Job
+from retention import select_evictions
+
+NOW = datetime(2025, 1, 31)
+
+
+def job(uuid: str, days: int, upload: int = 0, result: int = 0, owner=None) -> Job:
+    """A finished job last read the given number of days ago"""
+    return Job(
+        uuid=uuid,
+        owner=owner,
+        upload_bytes=upload,
+        result_bytes=result,
+        accessed_at=NOW - timedelta(days=days),
+    )
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    for name in (
+        "RETENTION_MAX_AGE_DAYS",
+        "UPLOAD_QUOTA_BYTES",
+        "RESULT_QUOTA_BYTES",
+        "USER_QUOTA_BYTES",
+    ):
+        monkeypatch.setattr(retention.settings, name, 0)
+    return retention.settings
+
+
+def uuids(jobs: list) -> list[str]:
+    return [job.uuid for job in jobs]
+
+
+def test_select_evictions_unlimited(settings):
+    jobs = [job("a", 400, 100, 10), job("b", 1, 100, 10)]
+
+    assert select_evictions(jobs, {"a": 100, "b": 100}, {"a": 10, "b": 10}, NOW) == []
+
+
+def test_select_evictions_by_age(settings):
+    settings.RETENTION_MAX_AGE_DAYS = 30
+    jobs = [job("a", 40), job("b", 31), job("c", 29)]
+
+    assert uuids(select_evictions(jobs, {}, {}, NOW)) == ["a", "b"]
+
+
+def test_select_evictions_upload_quota(settings):
+    settings.UPLOAD_QUOTA_BYTES = 250
+    jobs = [job("a", 3, upload=100), job("b", 2, upload=100), job("c", 1, upload=100)]
+    upload_bytes = {"a": 100, "b": 100, "c": 100}
+
+    assert uuids(select_evictions(jobs, upload_bytes, {}, NOW)) == ["a"]
+
+
+def test_select_evictions_result_quota_skips_jobs_without_results(settings):
+    settings.RESULT_QUOTA_BYTES = 100
+    jobs = [job("a", 3, upload=100), job("b", 2, result=100), job("c", 1, result=100)]
+    result_bytes = {"b": 100, "c": 100}
+
+    assert uuids(select_evictions(jobs, {"a": 100}, result_bytes, NOW)) == ["b"]
+
+
+def test_select_evictions_user_quota(settings):
+    settings.USER_QUOTA_BYTES = 150
+    jobs = [
+        job("a", 4, upload=100, owner="alice"),
+        job("b", 3, upload=100, owner="bob"),
+        job("c", 2, upload=100, owner="alice"),
+        job("d", 1, upload=100),
+        job("e", 1, upload=100),
+    ]
+    upload_bytes = {job.uuid: 100 for job in jobs}
+
+    assert uuids(select_evictions(jobs, upload_bytes, {}, NOW)) == ["a"]
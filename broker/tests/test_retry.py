@@ -0,0 +1,50 @@
+import retry
+
+from datetime import datetime, timedelta
+from retry import retry_at
+
+
+def test_retry_at_with_attempts_left(monkeypatch):
+    monkeypatch.setattr(retry.settings, "RETRY_POLICIES", {"network": (3, 100)})
+    before = datetime.utcnow()
+
+    retried = retry_at("network", 1)
+
+    assert before + timedelta(seconds=50) <= retried
+    assert retried <= datetime.utcnow() + timedelta(seconds=100)
+
+
+def test_retry_at_doubles_delay(monkeypatch):
+    monkeypatch.setattr(retry.settings, "RETRY_POLICIES", {"network": (5, 100)})
+    before = datetime.utcnow()
+
+    retried = retry_at("network", 3)
+
+    assert before + timedelta(seconds=200) <= retried
+    assert retried <= datetime.utcnow() + timedelta(seconds=400)
+
+
+def test_retry_at_caps_delay(monkeypatch):
+    monkeypatch.setattr(retry.settings, "RETRY_POLICIES", {"network": (20, 100)})
+    monkeypatch.setattr(retry.settings, "RETRY_MAX_DELAY", 300)
+
+    assert retry_at("network", 10) <= datetime.utcnow() + timedelta(seconds=300)
+
+
+def test_retry_at_without_attempts_left(monkeypatch):
+    monkeypatch.setattr(retry.settings, "RETRY_POLICIES", {"network": (3, 100)})
+
+    assert retry_at("network", 3) is None
+
+
+def test_retry_at_unknown_error_class(monkeypatch):
+    monkeypatch.setattr(retry.settings, "RETRY_POLICIES", {"unknown": (2, 10)})
+
+    assert retry_at("other", 1) is not None
+    assert retry_at("other", 2) is None
+
+
+def test_retry_at_without_policy(monkeypatch):
+    monkeypatch.setattr(retry.settings, "RETRY_POLICIES", {})
+
+    assert retry_at("other", 1) is None
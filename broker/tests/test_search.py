@@ -0,0 +1,195 @@
+import random
+
+from db.models import Job, JobStatusEnum, JobType, TranscriptCue
+from db.search import (
+    POSITION_GAP,
+    search_apply_edits,
+    search_delete_transcript,
+    search_index_transcript,
+    search_query,
+    search_transcripts,
+)
+from subtitles import apply_edits
+
+
+def cue(id: str, text: str, start_ms: int = 0) -> dict:
+    return {"id": id, "start_ms": start_ms, "end_ms": start_ms + 900, "text": text}
+
+
+def add_transcript(session, filename: str, cues: list[dict]) -> str:
+    job = Job(
+        job_type=JobType.TRANSCRIPTION,
+        status=JobStatusEnum.COMPLETED,
+        filename=filename,
+    )
+    session.add(job)
+    session.commit()
+    search_index_transcript(session, job.uuid, cues)
+    return job.uuid
+
+
+def indexed(session, uuid: str) -> list[str]:
+    """The IDs of the indexed cues of a transcript in order"""
+    cues = (
+        session.query(TranscriptCue)
+        .filter(TranscriptCue.job_uuid == uuid)
+        .order_by(TranscriptCue.position)
+    )
+    return [cue.cue_id for cue in cues]
+
+
+def test_search_query():
+    assert search_query("") is None
+    assert search_query(" ,. ") is None
+    assert search_query("Hello wor") == '"Hello" "wor"*'
+    assert search_query('say "hi"') == '"say" "hi"*'
+
+
+def test_search_transcripts_finds_cues(session):
+    uuid = add_transcript(
+        session,
+        "meeting.mp4",
+        [
+            cue("a", "Good morning everyone", 0),
+            cue("b", "The budget is approved", 1000),
+            cue("c", "More on the budget later", 2000),
+        ],
+    )
+    add_transcript(session, "other.mp4", [cue("a", "No money talk here")])
+
+    hits = search_transcripts(session, "budg")
+
+    assert {(hit["uuid"], hit["cue_id"], hit["cue_index"]) for hit in hits} == {
+        (uuid, "b", 2),
+        (uuid, "c", 3),
+    }
+    assert all(hit["filename"] == "meeting.mp4" for hit in hits)
+    assert "<mark>budget</mark>" in hits[0]["snippet"]
+    assert search_transcripts(session, "morning everyone")[0]["start_ms"] == 0
+
+
+def test_search_transcripts_of_one_job(session):
+    first = add_transcript(session, "a.mp4", [cue("a", "Hej hej")])
+    second = add_transcript(session, "b.mp4", [cue("a", "Hej då")])
+
+    assert [hit["uuid"] for hit in search_transcripts(session, "hej", second)] == [
+        second
+    ]
+    assert len(search_transcripts(session, "hej")) == 2
+
+    search_delete_transcript(session, first)
+    assert [hit["uuid"] for hit in search_transcripts(session, "hej")] == [second]
+
+
+def test_search_apply_edits(session):
+    uuid = add_transcript(
+        session, "a.mp4", [cue("1", "one"), cue("2", "two"), cue("3", "three")]
+    )
+
+    search_apply_edits(
+        session,
+        uuid,
+        [
+            {
+                "op": "insert",
+                "id": "x",
+                "after": None,
+                "start_ms": 0,
+                "end_ms": 0,
+                "text": "zero",
+            },
+            {
+                "op": "insert",
+                "id": "y",
+                "after": "2",
+                "start_ms": 0,
+                "end_ms": 0,
+                "text": "between",
+            },
+            {"op": "update", "id": "3", "text": "drei"},
+            {"op": "delete", "id": "1"},
+            {"op": "delete", "id": "unknown"},
+        ],
+    )
+    session.commit()
+
+    assert indexed(session, uuid) == ["x", "2", "y", "3"]
+    assert search_transcripts(session, "drei")[0]["cue_index"] == 4
+    assert search_transcripts(session, "three") == []
+
+
+def test_search_apply_edits_only_writes_edited_cues(session):
+    uuid = add_transcript(session, "a.mp4", [cue(str(i), "text") for i in range(5)])
+    positions = {
+        cue.cue_id: cue.position
+        for cue in session.query(TranscriptCue).filter(TranscriptCue.job_uuid == uuid)
+    }
+
+    search_apply_edits(session, uuid, [{"op": "delete", "id": "1"}])
+    session.commit()
+
+    for cue_id in ("0", "2", "3", "4"):
+        assert (
+            session.query(TranscriptCue)
+            .filter(TranscriptCue.job_uuid == uuid, TranscriptCue.cue_id == cue_id)
+            .one()
+            .position
+            == positions[cue_id]
+        )
+
+
+def test_search_apply_edits_respaces_full_gap(session):
+    cues = [cue("a", "first"), cue("b", "last")]
+    uuid = add_transcript(session, "a.mp4", cues)
+
+    # Every insert after the first cue halves the gap until it is used up
+    edits = [
+        [
+            {
+                "op": "insert",
+                "id": f"n{i}",
+                "after": "a",
+                "start_ms": 0,
+                "end_ms": 0,
+                "text": "new",
+            }
+        ]
+        for i in range(POSITION_GAP.bit_length() + 2)
+    ]
+    for ops in edits:
+        search_apply_edits(session, uuid, ops)
+    session.commit()
+
+    assert indexed(session, uuid) == [cue["id"] for cue in apply_edits(cues, edits)]
+
+
+def test_search_apply_edits_matches_apply_edits(session):
+    cues = [cue(str(i), f"cue {i}") for i in range(20)]
+    uuid = add_transcript(session, "a.mp4", cues)
+    random.seed(3)
+    edits = []
+
+    for n in range(200):
+        ids = [cue["id"] for cue in apply_edits(cues, edits)]
+        match random.choice(("insert", "insert", "update", "delete")):
+            case "insert":
+                after = random.choice(ids + [None])
+                ops = [
+                    {
+                        "op": "insert",
+                        "id": f"n{n}",
+                        "after": after,
+                        "start_ms": 0,
+                        "end_ms": 0,
+                        "text": f"new {n}",
+                    }
+                ]
+            case "update":
+                ops = [{"op": "update", "id": random.choice(ids), "text": f"edit {n}"}]
+            case "delete":
+                ops = [{"op": "delete", "id": random.choice(ids)}]
+        edits.append(ops)
+        search_apply_edits(session, uuid, ops)
+    session.commit()
+
+    assert indexed(session, uuid) == [cue["id"] for cue in apply_edits(cues, edits)]
@@ -0,0 +1,129 @@
+import gzip
+import io
+import pytest
+import serving
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from serving import (
+    delete_with_variants,
+    file_etag,
+    precompress,
+    storage_response,
+)
+from storage import LocalStorage
+
+TEXT = b"1\n00:00:00,000 --> 00:00:01,000\nHello\n\n" * 100
+
+
+@pytest.fixture
+def storage(tmp_path) -> LocalStorage:
+    storage = LocalStorage(str(tmp_path / "storage"))
+    storage.save("a.srt", io.BytesIO(TEXT))
+    return storage
+
+
+@pytest.fixture
+def client(storage) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/files/{key}")
+    def download(request: Request, key: str, version: str = None):
+        return storage_response(request, storage, key, version=version)
+
+    return TestClient(app)
+
+
+def test_storage_response(client, storage):
+    response = client.get("/files/a.srt", headers={"Accept-Encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.content == TEXT
+    assert response.headers["ETag"] == file_etag(storage.local_path("a.srt"))
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert "Last-Modified" in response.headers
+
+
+def test_storage_response_not_found(client):
+    response = client.get("/files/missing.srt")
+
+    assert response.status_code == 404
+
+
+def test_storage_response_range(client):
+    response = client.get("/files/a.srt", headers={"Range": "bytes=2-5"})
+
+    assert response.status_code == 206
+    assert response.content == TEXT[2:6]
+
+
+def test_storage_response_not_modified(client):
+    etag = client.get("/files/a.srt").headers["ETag"]
+
+    response = client.get("/files/a.srt", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    response = client.get("/files/a.srt", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_storage_response_modified_since(client):
+    last_modified = client.get("/files/a.srt").headers["Last-Modified"]
+
+    response = client.get("/files/a.srt", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    response = client.get(
+        "/files/a.srt", headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"}
+    )
+    assert response.status_code == 200
+
+
+def test_storage_response_immutable_version(client, storage):
+    etag = file_etag(storage.local_path("a.srt"))
+
+    response = client.get("/files/a.srt", params={"version": etag.strip('"')})
+    assert "immutable" in response.headers["Cache-Control"]
+
+    response = client.get("/files/a.srt", params={"version": "stale"})
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_storage_response_precompressed(client, storage, monkeypatch):
+    monkeypatch.setattr(serving, "brotli", None)
+    precompress(storage, "a.srt")
+
+    variant = storage.local_path("a.srt.gz")
+    assert gzip.decompress(variant.read_bytes()) == TEXT
+
+    response = client.get("/files/a.srt", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"].endswith('-gzip"')
+    assert response.content == TEXT
+
+    # Ranges are served from the uncompressed file
+    response = client.get(
+        "/files/a.srt", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-0"}
+    )
+    assert "Content-Encoding" not in response.headers
+    assert response.content == TEXT[:1]
+
+    # A 304 has no body, so no encoding either
+    etag = client.get("/files/a.srt", headers={"Accept-Encoding": "gzip"}).headers[
+        "ETag"
+    ]
+    response = client.get(
+        "/files/a.srt", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert "Content-Encoding" not in response.headers
+
+
+def test_delete_with_variants(storage, monkeypatch):
+    monkeypatch.setattr(serving, "brotli", None)
+    precompress(storage, "a.srt")
+
+    delete_with_variants(storage, "a.srt")
+
+    assert list(storage.root.iterdir()) == []
@@ -0,0 +1,61 @@
+import io
+import pytest
+
+from storage import LocalStorage
+
+
+@pytest.fixture
+def storage(tmp_path) -> LocalStorage:
+    return LocalStorage(str(tmp_path / "storage"))
+
+
+def test_local_storage_save_and_open(storage):
+    storage.save("a.wav", io.BytesIO(b"audio"))
+
+    assert storage.exists("a.wav")
+    assert storage.size("a.wav") == 5
+    with storage.open("a.wav") as fileobj:
+        assert fileobj.read() == b"audio"
+
+    # The partial file is renamed into place
+    assert [path.name for path in storage.root.iterdir()] == ["a.wav"]
+
+
+def test_local_storage_missing(storage):
+    assert storage.size("missing.wav") is None
+    assert not storage.exists("missing.wav")
+
+    # Deleting a missing object is not an error
+    storage.delete("missing.wav")
+
+
+def test_local_storage_delete(storage):
+    storage.save("a.wav", io.BytesIO(b"audio"))
+    storage.delete("a.wav")
+
+    assert not storage.exists("a.wav")
+
+
+def test_local_storage_keys_stay_in_root(storage):
+    assert storage.local_path("../../etc/passwd") == storage.root / "passwd"
+
+    storage.save("../a.wav", io.BytesIO(b"audio"))
+    assert (storage.root / "a.wav").exists()
+
+
+def test_local_storage_list_objects(storage):
+    storage.save("a.wav", io.BytesIO(b"audio"))
+    storage.save("b.srt", io.BytesIO(b"subtitles"))
+    (storage.root / "directory").mkdir()
+
+    objects = {key: size for key, size, _ in storage.list_objects()}
+
+    assert objects == {"a.wav": 5, "b.srt": 9}
+
+
+def test_local_storage_is_not_presigned(storage):
+    assert not storage.presigned
+    assert storage.presign_get("a.wav") is None
+    assert storage.presign_put("a.wav") is None
+    with pytest.raises(NotImplementedError):
+        storage.create_multipart_upload("a.wav")
@@ -0,0 +1,253 @@
+from subtitles import apply_edits, merge_cues, validate_ops
+
+
+def cue(id: str, start_ms: int, end_ms: int, text: str) -> dict:
+    return {"id": id, "start_ms": start_ms, "end_ms": end_ms, "text": text}
+
+
+CUES = [
+    cue("1", 0, 1000, "One"),
+    cue("2", 1000, 2000, "Two"),
+    cue("3", 2000, 3000, "Three"),
+]
+
+
+def texts(cues: list[dict]) -> list[str]:
+    return [cue["text"] for cue in cues]
+
+
+def test_validate_ops_accepts_edits():
+    assert (
+        validate_ops(
+            [
+                {"op": "update", "id": "1", "text": "Uno"},
+                {"op": "delete", "id": "2"},
+                {
+                    "op": "insert",
+                    "id": "x",
+                    "after": None,
+                    "start_ms": 0,
+                    "end_ms": 10,
+                    "text": "First",
+                },
+            ]
+        )
+        is None
+    )
+
+
+def test_validate_ops_rejects_invalid_edits():
+    assert validate_ops([]) == "No edits given"
+    assert validate_ops({"op": "delete", "id": "1"}) == "No edits given"
+    assert validate_ops([{"op": "delete"}]) == "Every edit needs a cue ID"
+    assert validate_ops([{"op": "move", "id": "1"}]) == "Unsupported edit: move"
+    assert validate_ops([{"op": "update", "id": "1", "start_ms": -1}]) == (
+        "Invalid start_ms in edit of cue 1"
+    )
+    assert validate_ops([{"op": "update", "id": "1", "end_ms": "10"}]) == (
+        "Invalid end_ms in edit of cue 1"
+    )
+    assert validate_ops([{"op": "update", "id": "1", "text": 1}]) == (
+        "Invalid text in edit of cue 1"
+    )
+    assert validate_ops([{"op": "insert", "id": "x", "text": "New"}]) == (
+        "Inserted cue x needs start_ms, end_ms and text"
+    )
+
+
+def test_apply_edits_without_edits_copies_cues():
+    result = apply_edits(CUES, [])
+
+    assert result == CUES
+    result[0]["text"] = "Changed"
+    assert CUES[0]["text"] == "One"
+
+
+def test_apply_edits_update_and_delete():
+    result = apply_edits(
+        CUES,
+        [
+            [{"op": "update", "id": "2", "text": "Deux", "end_ms": 1500}],
+            [{"op": "delete", "id": "1"}],
+        ],
+    )
+
+    assert result == [cue("2", 1000, 1500, "Deux"), cue("3", 2000, 3000, "Three")]
+
+
+def test_apply_edits_insert():
+    result = apply_edits(
+        CUES,
+        [
+            [
+                {
+                    "op": "insert",
+                    "id": "a",
+                    "after": None,
+                    "start_ms": 0,
+                    "end_ms": 0,
+                    "text": "Start",
+                },
+                {
+                    "op": "insert",
+                    "id": "b",
+                    "after": "3",
+                    "start_ms": 3000,
+                    "end_ms": 4000,
+                    "text": "End",
+                },
+                {
+                    "op": "insert",
+                    "id": "c",
+                    "after": "1",
+                    "start_ms": 1000,
+                    "end_ms": 1000,
+                    "text": "Between",
+                },
+            ]
+        ],
+    )
+
+    assert texts(result) == ["Start", "One", "Between", "Two", "Three", "End"]
+
+
+def test_apply_edits_in_order():
+    result = apply_edits(
+        CUES,
+        [
+            [
+                {
+                    "op": "insert",
+                    "id": "a",
+                    "after": "2",
+                    "start_ms": 2000,
+                    "end_ms": 2000,
+                    "text": "New",
+                }
+            ],
+            [{"op": "delete", "id": "2"}],
+            [{"op": "update", "id": "a", "text": "Newer"}],
+            [
+                {
+                    "op": "insert",
+                    "id": "b",
+                    "after": "a",
+                    "start_ms": 2000,
+                    "end_ms": 2000,
+                    "text": "Newest",
+                }
+            ],
+        ],
+    )
+
+    assert texts(result) == ["One", "Newer", "Newest", "Three"]
+
+
+def test_apply_edits_ignores_unknown_cues():
+    result = apply_edits(
+        CUES,
+        [
+            [
+                {"op": "update", "id": "9", "text": "Nine"},
+                {"op": "delete", "id": "9"},
+                {
+                    "op": "insert",
+                    "id": "1",
+                    "after": None,
+                    "start_ms": 0,
+                    "end_ms": 0,
+                    "text": "Duplicate",
+                },
+                {
+                    "op": "insert",
+                    "id": "x",
+                    "after": "9",
+                    "start_ms": 0,
+                    "end_ms": 0,
+                    "text": "Orphan",
+                },
+            ]
+        ],
+    )
+
+    assert result == CUES
+
+
+def test_merge_cues_offsets_and_renumbers():
+    result = merge_cues(
+        [
+            (0, [cue("a", 0, 1000, "Hello"), cue("b", 1000, 2000, "there")]),
+            (2000, [cue("a", 0, 1000, "General Kenobi")]),
+        ]
+    )
+
+    assert result == [
+        cue("1", 0, 1000, "Hello"),
+        cue("2", 1000, 2000, "there"),
+        cue("3", 2000, 3000, "General Kenobi"),
+    ]
+
+
+def test_merge_cues_drops_cues_after_next_segment_start():
+    result = merge_cues(
+        [
+            (0, [cue("a", 0, 9500, "The speech runs"), cue("b", 10200, 11000, "Cut")]),
+            (10000, [cue("a", 0, 1000, "past the seam")]),
+        ]
+    )
+
+    assert texts(result) == ["The speech runs", "past the seam"]
+    assert result[1]["start_ms"] == 10000
+
+
+def test_merge_cues_drops_cue_within_previous_cue():
+    result = merge_cues(
+        [
+            (0, [cue("a", 9000, 11500, "across the seam")]),
+            (10000, [cue("a", 0, 1200, "seam"), cue("b", 1500, 2500, "and on")]),
+        ]
+    )
+
+    assert result == [
+        cue("1", 9000, 11500, "across the seam"),
+        cue("2", 11500, 12500, "and on"),
+    ]
+
+
+def test_merge_cues_strips_repeated_words():
+    result = merge_cues(
+        [
+            (0, [cue("a", 9000, 11000, "We talked about the")]),
+            (10000, [cue("a", 500, 2000, "bout the weather, today.")]),
+        ]
+    )
+
+    assert result == [
+        cue("1", 9000, 11000, "We talked about the"),
+        cue("2", 11000, 12000, "weather, today."),
+    ]
+
+
+def test_merge_cues_drops_fully_repeated_cue():
+    result = merge_cues(
+        [
+            (0, [cue("a", 9000, 11000, "Thank you.")]),
+            (10000, [cue("a", 500, 1500, "you"), cue("b", 2000, 3000, "Bye")]),
+        ]
+    )
+
+    assert texts(result) == ["Thank you.", "Bye"]
+
+
+def test_merge_cues_trims_overlapping_cue():
+    result = merge_cues(
+        [
+            (0, [cue("a", 9000, 11000, "First words")]),
+            (10000, [cue("a", 500, 2000, "other words")]),
+        ]
+    )
+
+    assert result == [
+        cue("1", 9000, 10500, "First words"),
+        cue("2", 10500, 12000, "other words"),
+    ]
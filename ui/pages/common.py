@@ -1,15 +1,26 @@
 import asyncio
+import html
+import httpx
 import requests
 
+from collections import OrderedDict
 from nicegui import ui
-from typing import Optional
+from typing import BinaryIO, Callable, Optional
+from urllib.parse import quote
 from settings import get_settings
 
 settings = get_settings()
 
 API_URL = settings.API_URL
+
+# Uploads streamed to the broker at the same time, by all users
+upload_slots = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
 STATIC_FILES = settings.STATIC_FILES
 
+# Transcription results by job UUID, together with their ETag
+RESULT_CACHE_SIZE = 32
+result_cache = OrderedDict()
+
 
 def page_init(header_text: Optional[str] = "") -> None:
     """
@@ -53,11 +64,23 @@ def get_jobs():
         if job["status"] == "in_progress":
             job["status"] = "transcribing"
 
-        if job["status"] != "completed":
+        # Jobs out of retries are shown as failed so they can be run again
+        if job["status"] == "dead_letter":
+            job["status"] = "failed"
+
+        # The draft is served while the job is refined with a larger model
+        if job.get("result_stage") == "draft":
+            job["status"] = "draft"
+
+        if job["status"] not in ("completed", "draft"):
             output_format = ""
         else:
             output_format = job["output_format"].upper()
 
+        language = job["language"]
+        if language == "auto" and job.get("detected_language"):
+            language = f"{job['detected_language']} (detected)"
+
         job_data = {
             "id": idx,
             "uuid": job["uuid"],
@@ -66,6 +89,7 @@ def get_jobs():
             "updated_at": job["updated_at"],
             "status": job["status"].capitalize(),
             "format": output_format,
+            "language": language,
         }
 
         jobs.append(job_data)
@@ -76,6 +100,104 @@ def get_jobs():
     return jobs
 
 
+def get_result(uuid: str) -> Optional[bytes]:
+    """
+    Get the result of a transcription job from the API, revalidating
+    a cached copy with its ETag instead of downloading it again.
+    """
+    headers = {}
+    if cached := result_cache.get(uuid):
+        headers["If-None-Match"] = cached[0]
+
+    response = requests.get(
+        f"{API_URL}/api/v1/transcriber/{uuid}/result", headers=headers
+    )
+
+    if response.status_code == 304 and cached:
+        result_cache.move_to_end(uuid)
+        return cached[1]
+
+    if response.status_code != 200:
+        return None
+
+    if etag := response.headers.get("ETag"):
+        result_cache[uuid] = (etag, response.content)
+        result_cache.move_to_end(uuid)
+
+        if len(result_cache) > RESULT_CACHE_SIZE:
+            result_cache.popitem(last=False)
+
+    return response.content
+
+
+def search_transcripts(query: str) -> list[dict]:
+    """
+    Search the completed transcripts, best matches first.
+    """
+    response = requests.get(f"{API_URL}/api/v1/search", params={"q": query})
+
+    if response.status_code != 200:
+        return []
+
+    return response.json()["result"]["hits"]
+
+
+def format_position(ms: int) -> str:
+    """
+    Format milliseconds as a position in a recording (H:MM:SS).
+    """
+    minutes, seconds = divmod(ms // 1000, 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def table_search() -> None:
+    """
+    Handle the click event on the Search transcripts button.
+    """
+
+    @ui.refreshable
+    def search_results(hits: list[dict]) -> None:
+        for hit in hits:
+            link = (
+                f"/srt?uuid={quote(hit['uuid'])}&filename={quote(hit['filename'])}"
+                f"&cue={quote(hit['cue_id'])}&index={hit['cue_index']}"
+            )
+            snippet = (
+                html.escape(hit["snippet"])
+                .replace("&lt;mark&gt;", "<mark>")
+                .replace("&lt;/mark&gt;", "</mark>")
+            )
+
+            with ui.item(on_click=lambda link=link: ui.navigate.to(link)):
+                with ui.item_section():
+                    ui.item_label(hit["filename"]).classes("text-weight-medium")
+                    ui.html(snippet)
+                with ui.item_section().props("side"):
+                    ui.item_label(format_position(hit["start_ms"]))
+
+    async def search(event) -> None:
+        hits = await asyncio.to_thread(search_transcripts, event.value or "")
+        search_results.refresh(hits)
+
+    with ui.dialog() as dialog:
+        with ui.card().style("background-color: white; width: 100%; max-width: 800px;"):
+            ui.label("Search transcripts").classes("text-h6")
+            with (
+                ui.input(placeholder="Words spoken in a recording")
+                .props("type=search debounce=300 autofocus")
+                .classes("w-full")
+                .on_value_change(search)
+                .add_slot("append")
+            ):
+                ui.icon("search")
+            with ui.list().classes("w-full").props("separator"):
+                search_results([])
+
+        dialog.open()
+
+
 def table_click(event) -> None:
     """
     Handle the click event on the table rows.
@@ -86,7 +208,7 @@ def table_click(event) -> None:
     filename = event.args[1]["filename"]
     output_format = event.args[1]["format"]
 
-    if status != "completed":
+    if status not in ("completed", "draft"):
         return
 
     match output_format.lower():
@@ -102,30 +224,82 @@ def table_click(event) -> None:
             )
 
 
-def post_file(file: str, filename: str) -> None:
+class ProgressFile:
     """
-    Post a file to the API.
+    File object reporting the bytes read from it, so the progress of an
+    upload streamed from it can be shown.
     """
-    files_json = {"file": (filename, file.read())}
-    response = requests.post(f"{API_URL}/api/v1/transcriber", files=files_json)
+
+    def __init__(self, file: BinaryIO, callback: Callable[[int], None]) -> None:
+        self.file = file
+        self.callback = callback
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.callback(len(data))
+        return data
+
+    def __getattr__(self, name: str):
+        return getattr(self.file, name)
+
+
+async def post_file(
+    client: httpx.AsyncClient, file: BinaryIO, filename: str, progress: ui.element
+) -> None:
+    """
+    Post a file to the API, streaming it from the spooled upload in
+    chunks instead of reading it into memory.
+    """
+    size = file.seek(0, 2) or 1
+    file.seek(0)
+    sent = 0
+
+    def update(count: int) -> None:
+        nonlocal sent
+        sent += count
+
+        # Update the browser at most once per percent
+        if (value := round(min(sent / size, 1), 2)) != progress.value:
+            progress.value = value
+
+    async with upload_slots:
+        response = await client.post(
+            f"{API_URL}/api/v1/transcriber",
+            files={"file": (filename, ProgressFile(file, update))},
+        )
 
     if response.status_code != 200:
         raise Exception(f"Failed to upload file: {response.json()['result']['error']}")
 
-    return True
-
 
-async def upload_file(files):
+async def upload_file(files, container: ui.element) -> None:
     """
-    Upload a file to the server.
+    Upload the files to the server in parallel, showing the progress of
+    each file in the container.
     """
-    try:
-        for file, filename in zip(files.contents, files.names):
-            await asyncio.to_thread(post_file, file, filename)
+
+    async def upload(client: httpx.AsyncClient, file: BinaryIO, filename: str):
+        with container:
+            ui.label(filename).classes("text-caption")
+            progress = ui.linear_progress(value=0, show_value=False)
+
+        try:
+            await post_file(client, file, filename, progress)
             ui.notify(f"Uploaded: {filename}")
-    except Exception as e:
-        ui.notify(f"Error: Failed to save file {filename}: {e}")
-        return
+        except Exception as e:
+            progress.props("color=negative")
+            ui.notify(f"Error: Failed to save file {filename}: {e}", type="negative")
+        finally:
+            file.close()
+
+    timeout = httpx.Timeout(settings.UPLOAD_TIMEOUT, connect=10)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        await asyncio.gather(
+            *[
+                upload(client, file, filename)
+                for file, filename in zip(files.contents, files.names)
+            ]
+        )
 
 
 def table_upload(table) -> None:
@@ -136,14 +310,31 @@ def table_upload(table) -> None:
         with ui.card().style(
             "background-color: white; align-self: center; border: 0; width: 100%; height: 30%;"
         ):
-            ui.upload(
-                on_multi_upload=lambda file: upload_file(file),
-                multiple=True,
-                max_files=5,
-                label="Upload file",
-            ).style(
-                "width: 100%; align-self: center; border-radius: 10px; height: 100%;"
-            )
+            if settings.UPLOAD_DIRECT:
+                # The browser sends the files straight to the broker
+                ui.upload(
+                    multiple=True,
+                    max_files=5,
+                    label="Upload file",
+                ).props(
+                    f'url="{settings.API_PUBLIC_URL}/api/v1/transcriber" '
+                    'field-name="file"'
+                ).on("uploaded", lambda: ui.notify("Uploaded")).on(
+                    "failed", lambda: ui.notify("Error: Failed to upload file")
+                ).style(
+                    "width: 100%; align-self: center; border-radius: 10px; height: 100%;"
+                )
+            else:
+                ui.upload(
+                    on_multi_upload=lambda files: upload_file(files, progress),
+                    multiple=True,
+                    max_files=5,
+                    label="Upload file",
+                ).style(
+                    "width: 100%; align-self: center; border-radius: 10px; height: 100%;"
+                )
+
+            progress = ui.column().classes("w-full")
 
         dialog.open()
 
@@ -153,15 +344,20 @@ def table_transcribe(table) -> None:
     Handle the click event on the Transcribe button.
     """
 
-    selected_rows = table.selected
-
-    if not selected_rows:
+    if not table.selected:
         ui.notify("Error: No files selected", type="negative", position="top")
         return
 
-    if not any(row["status"] == "Uploaded" for row in selected_rows):
+    # Finished files can be transcribed again, e.g. with a larger model
+    selected_rows = [
+        row
+        for row in table.selected
+        if row["status"] in ("Uploaded", "Completed", "Failed", "Cancelled")
+    ]
+
+    if not selected_rows:
         ui.notify(
-            "Error: Selected files already transcribed",
+            "Error: Selected files are already being transcribed",
             type="negative",
             position="top",
         )
@@ -179,7 +375,7 @@ def table_transcribe(table) -> None:
                 with ui.column().classes("col-12 col-sm-24"):
                     ui.label("Language").classes("text-subtitle2 q-mb-sm")
                     language = ui.select(
-                        ["Swedish", "English"],
+                        ["Auto-detect", "Swedish", "English"],
                         label="Select language",
                     ).classes("w-full")
 
@@ -196,6 +392,12 @@ def table_transcribe(table) -> None:
                         ["SRT", "TXT"],
                         label="Select output format",
                     ).classes("w-full")
+
+                with ui.column().classes("col-12 col-sm-24"):
+                    draft = ui.checkbox("Fast draft first").tooltip(
+                        "Get a draft from the tiny model within seconds, "
+                        "it is replaced when the selected model is done"
+                    )
             ui.separator()
             with ui.row():
                 ui.button(
@@ -206,6 +408,7 @@ def table_transcribe(table) -> None:
                         language.value,
                         model.value,
                         output_format.value,
+                        draft.value,
                     ),
                 ).props("color=primary")
                 ui.button(
@@ -217,13 +420,15 @@ def table_transcribe(table) -> None:
 
 
 def start_transcription(
-    rows: list, language: str, model: str, output_format: str
+    rows: list, language: str, model: str, output_format: str, draft: bool = False
 ) -> None:
     # Get selected values
     selected_language = language
     selected_model = model
 
     match selected_language:
+        case "Auto-detect":
+            selected_language = "auto"
         case "Swedish":
             selected_language = "sv"
         case "English":
@@ -265,6 +470,7 @@ def start_transcription(
                     "model": f"{selected_model}",
                     "output_format": f"{output_format}",
                     "status": "pending",
+                    "draft": draft,
                 },
             )
 
@@ -279,3 +485,45 @@ def start_transcription(
 
     except Exception as e:
         ui.notify(f"Error: {str(e)}", type="negative", position="top")
+
+
+def table_cancel(table) -> None:
+    """
+    Handle the click event on the Stop button.
+    """
+
+    if not table.selected:
+        ui.notify("Error: No files selected", type="negative", position="top")
+        return
+
+    # Only files waiting for or being transcribed can be stopped
+    selected_rows = [
+        row
+        for row in table.selected
+        if row["status"] in ("Pending", "Transcribing", "Draft")
+    ]
+
+    if not selected_rows:
+        ui.notify(
+            "Error: Selected files are not being transcribed",
+            type="negative",
+            position="top",
+        )
+        return
+
+    try:
+        for row in selected_rows:
+            uuid = row["uuid"]
+            response = requests.post(f"{API_URL}/api/v1/transcriber/{uuid}/cancel")
+
+            if response.status_code != 200:
+                error = response.json()["result"]["error"]
+                ui.notify(
+                    f"Error: Failed to stop transcription: {error}",
+                    type="negative",
+                    position="top",
+                )
+                return
+
+    except Exception as e:
+        ui.notify(f"Error: {str(e)}", type="negative", position="top")
@@ -2,7 +2,9 @@ from nicegui import ui
 from pages.common import (
     page_init,
     get_jobs,
+    table_cancel,
     table_click,
+    table_search,
     table_transcribe,
     table_upload,
 )
@@ -35,6 +37,12 @@ def create_table_jobs() -> None:
             "field": "updated_at",
             "align": "left",
         },
+        {
+            "name": "language",
+            "label": "Language",
+            "field": "language",
+            "align": "left",
+        },
         {
             "name": "format",
             "label": "Format",
@@ -65,7 +73,7 @@ def create_table_jobs() -> None:
             "body-cell-status",
             """
             <q-td key="status" :props="props">
-                <q-badge v-if="{Completed: 'green', Uploaded: 'orange', Failed: 'red', Transcribing: 'orange', Pending: 'blue'}[props.value]" :color="{Completed: 'green', Uploaded: 'orange', Failed: 'red', Transcribing: 'orange', Pending: 'blue'}[props.value]">
+                <q-badge v-if="{Completed: 'green', Draft: 'teal', Uploaded: 'orange', Failed: 'red', Cancelled: 'grey', Transcribing: 'orange', Pending: 'blue'}[props.value]" :color="{Completed: 'green', Draft: 'teal', Uploaded: 'orange', Failed: 'red', Cancelled: 'grey', Transcribing: 'orange', Pending: 'blue'}[props.value]">
                     {{props.value}}
                 </q-badge>
                 <p v-else>
@@ -97,6 +105,10 @@ def create_table_jobs() -> None:
                     table, "filter"
                 ).add_slot("append"):
                     ui.icon("search")
+                with ui.button("Search transcripts") as search:
+                    search.props("color=primary")
+                    search.on("click", table_search)
+                    ui.icon("manage_search")
                 with ui.button("Upload") as upload:
                     upload.props("color=primary")
                     upload.on("click", lambda: table_upload(table))
@@ -107,6 +119,10 @@ def create_table_jobs() -> None:
                         "click", lambda: table_transcribe(table), table.selected
                     )
                     ui.icon("play_circle_filled")
+                with ui.button("Stop") as stop:
+                    stop.props("color=primary")
+                    stop.on("click", lambda: table_cancel(table), table.selected)
+                    ui.icon("stop_circle")
 
 
 rows = []
@@ -1,15 +1,31 @@
+import math
 import requests
+
 from nicegui import ui, app
 from pages.common import page_init, API_URL
+from subtitles import make_cue, parse_timestamp
+from typing import Optional
+from uuid import uuid4
+
+ROWS_PER_PAGE = 50
+
+
+class Editor:
+    """
+    State of the editor of one client, every client opening the page
+    gets its own.
+    """
 
-# Set up global state
-expanded_row = None  # Track which row is currently expanded
-edit_inputs = {}  # Store input elements for the currently edited row
-data = []
-edit_panel = None
-video = None
-table = None
-table_page = None
+    def __init__(self, job_uuid: str, version: int, cues: list, stage: Optional[str]):
+        self.job_uuid = job_uuid
+        # Transcript version on the broker the edits are based on
+        self.version = version
+        # All cues in order, the table only holds the current page
+        self.cues = cues
+        self.stage = stage  # Stage of the result, draft or final
+        self.edit_panel = None
+        self.video = None
+        self.table = None
 
 
 def format_time(time_str):
@@ -20,73 +36,122 @@ def format_time(time_str):
     return time_str
 
 
-def is_valid_time(time_str):
-    """Validate the SRT timestamp format"""
-    try:
-        parts = time_str.split(",")
-        if len(parts) != 2:
-            return False
+def calculate_duration(start_ms, end_ms):
+    """Calculate duration between two timestamps in milliseconds"""
+    diff_ms = end_ms - start_ms
+
+    # Format result
+    if diff_ms < 0:
+        return "Invalid (end before start)"
+
+    diff_s, ms = divmod(diff_ms, 1000)
+    diff_m, diff_s = divmod(diff_s, 60)
+
+    if diff_m > 0:
+        return f"{diff_m}m {diff_s}s {ms}ms"
+    else:
+        return f"{diff_s}s {ms}ms"
+
+
+def page_rows(cues: list, pagination: dict, search: str) -> tuple[list, int]:
+    """Get the rows of one table page and the number of matching cues"""
+    if search:
+        search = search.lower()
+        positions = [i for i, cue in enumerate(cues) if search in cue["text"].lower()]
+    else:
+        positions = range(len(cues))
+
+    rows_per_page = pagination.get("rowsPerPage", ROWS_PER_PAGE) or len(positions)
+    start = (pagination.get("page", 1) - 1) * rows_per_page
+
+    rows = [
+        {**cues[position], "index": position + 1}
+        for position in positions[start : start + rows_per_page]
+    ]
+
+    return rows, len(positions)
+
 
-        time_parts = parts[0].split(":")
-        if len(time_parts) != 3:
-            return False
+def update_page(editor: Editor, pagination: Optional[dict] = None) -> None:
+    """Send only the rows of the current page to the client"""
+    table = editor.table
+    pagination = {**table.pagination, **(pagination or {})}
+    rows, rows_number = page_rows(editor.cues, pagination, table.filter)
 
-        hours, minutes, seconds = map(int, time_parts)
-        milliseconds = int(parts[1])
+    # Go back a page if the last row of the last page was deleted
+    if not rows and pagination.get("page", 1) > 1:
+        pagination["page"] -= 1
+        rows, rows_number = page_rows(editor.cues, pagination, table.filter)
 
-        return (
-            0 <= hours <= 99
-            and 0 <= minutes <= 59
-            and 0 <= seconds <= 59
-            and 0 <= milliseconds <= 999
+    table.pagination = {**pagination, "rowsNumber": rows_number}
+    table.rows = rows
+
+
+def on_request(editor: Editor, event) -> None:
+    """Handle pagination and search requests from the table"""
+    editor.table.filter = event.args.get("filter") or ""
+    update_page(editor, event.args["pagination"])
+
+
+def get_transcript(uuid: str) -> Optional[tuple[int, list, Optional[str]]]:
+    """Get the current version of the transcript, its cues and its stage"""
+    response = requests.get(f"{API_URL}/api/v1/transcriber/{uuid}/transcript")
+
+    if response.status_code != 200:
+        return None
+
+    result = response.json()["result"]
+    cues = [
+        make_cue(cue["id"], cue["start_ms"], cue["end_ms"], cue["text"])
+        for cue in result["cues"]
+    ]
+
+    return result["version"], cues, result.get("stage")
+
+
+def save_ops(editor: Editor, ops: list) -> bool:
+    """Save cue edits on the broker as a new transcript version"""
+    response = requests.patch(
+        f"{API_URL}/api/v1/transcriber/{editor.job_uuid}/transcript",
+        json={"version": editor.version, "ops": ops},
+    )
+
+    if response.status_code == 409:
+        ui.notify(
+            "The transcript has been changed elsewhere, reload the page",
+            type="negative",
         )
-    except Exception:
         return False
 
+    if response.status_code != 200:
+        error = response.json()["result"].get("error", "Failed to save changes")
+        ui.notify(f"Error: {error}", type="negative")
+        return False
 
-def calculate_duration(start_time, end_time):
-    """Calculate duration between two timestamps"""
-    try:
-        # Parse start time
-        start_parts = start_time.split(",")
-        start_time_parts = start_parts[0].split(":")
-        start_h, start_m, start_s = map(int, start_time_parts)
-        start_ms = int(start_parts[1])
-        start_total_ms = ((start_h * 3600) + (start_m * 60) + start_s) * 1000 + start_ms
+    editor.version = response.json()["result"]["version"]
 
-        # Parse end time
-        end_parts = end_time.split(",")
-        end_time_parts = end_parts[0].split(":")
-        end_h, end_m, end_s = map(int, end_time_parts)
-        end_ms = int(end_parts[1])
-        end_total_ms = ((end_h * 3600) + (end_m * 60) + end_s) * 1000 + end_ms
+    return True
 
-        # Calculate difference
-        diff_ms = end_total_ms - start_total_ms
 
-        # Format result
-        if diff_ms < 0:
-            return "Invalid (end before start)"
+def find_cue(cues: list, row: dict) -> int:
+    """Find the position of a cue, using the row index as a hint"""
+    position = row["index"] - 1
 
-        diff_s, ms = divmod(diff_ms, 1000)
-        diff_m, diff_s = divmod(diff_s, 60)
+    if 0 <= position < len(cues) and cues[position]["id"] == row["id"]:
+        return position
 
-        if diff_m > 0:
-            return f"{diff_m}m {diff_s}s {ms}ms"
-        else:
-            return f"{diff_s}s {ms}ms"
-    except Exception:
-        return "Invalid format"
+    for position, cue in enumerate(cues):
+        if cue["id"] == row["id"]:
+            return position
 
+    return -1
 
-@ui.refreshable
-def render_data_table():
-    """Render the data table with expandable rows"""
-    global expanded_row, edit_inputs, data, table
 
+def render_data_table(editor: Editor):
+    """Render the paginated data table, rows are fetched page by page"""
     with ui.card().classes("w-full no-shadow no-border"):
         # No data message
-        if len(data) == 0:
+        if len(editor.cues) == 0:
             with ui.row().classes("w-full p-8 text-center text-gray-500"):
                 ui.label('No subtitle entries. Click "Add New" to create one.').classes(
                     "text-lg"
@@ -95,7 +160,7 @@ def render_data_table():
         with ui.row().classes("w-full items-center justify-between p-2"):
             table = (
                 ui.table(
-                    rows=data,
+                    rows=[],
                     columns=[
                         {
                             "name": "index",
@@ -123,161 +188,201 @@ def render_data_table():
                             "style": "text-wrap: wrap; heigh: auto; white-space: pre-line;",
                         },
                     ],
-                    row_key="index",
+                    row_key="id",
+                    pagination={"rowsPerPage": ROWS_PER_PAGE, "page": 1},
                 )
                 .classes("w-full max-h-50")
                 .style(
                     "width: 100%; height: calc(100vh - 130px); overflow: auto; box-shadow: none;"
                 )
+                .props("virtual-scroll")
             )
 
             with table.add_slot("top-right"):
                 with ui.row().classes("items-center gap-2"):
-                    with ui.input(placeholder="Search").props("type=search").bind_value(
-                        table, "filter"
-                    ).add_slot("append"):
+                    with ui.input(placeholder="Search").props(
+                        "type=search debounce=300"
+                    ).bind_value(table, "filter").add_slot("append"):
                         ui.icon("search")
 
-            table.on("rowClick", lambda e: show_edit_panel(e))
+            editor.table = table
+            table.on("request", lambda e: on_request(editor, e))
+            table.on("rowClick", lambda e: show_edit_panel(editor, e))
+            update_page(editor)
 
 
-def save_edit(index, text, start_time, end_time):
-    """Save the edited data"""
-    global edit_inputs, expanded_row, data
+def save_edit(editor: Editor, row, text, start_time, end_time):
+    """Save the edited cue"""
+    start_ms = parse_timestamp(start_time)
+    end_ms = parse_timestamp(end_time)
 
     # Validate time formats
-    if not is_valid_time(start_time) or not is_valid_time(end_time):
+    if start_ms is None or end_ms is None:
         ui.notify("Invalid time format! Use HH:MM:SS,mmm", type="negative")
         return
 
-    # Find and update item
-    for item in data:
-        if item["index"] == index:
-            item["start_time"] = start_time
-            item["end_time"] = end_time
-            item["text"] = text
-            break
+    if end_ms < start_ms:
+        ui.notify("End time must be after start time", type="negative")
+        return
+
+    if (position := find_cue(editor.cues, row)) == -1:
+        ui.notify("Entry not found", type="negative")
+        return
 
-    ui.notify("Changes saved successfully", type="positive")
-    render_data_table.refresh()
+    if not save_ops(
+        editor,
+        [
+            {
+                "op": "update",
+                "id": row["id"],
+                "start_ms": start_ms,
+                "end_ms": end_ms,
+                "text": text,
+            }
+        ],
+    ):
+        return
 
+    editor.cues[position] = make_cue(row["id"], start_ms, end_ms, text)
 
-def delete_entry(index):
-    """Delete an entry from the data"""
-    global expanded_row, edit_inputs, data
+    ui.notify("Changes saved successfully", type="positive")
+    update_page(editor)
 
-    # Find the item to remove
-    for i, item in enumerate(data):
-        if item["index"] == index:
-            data.pop(i)
-            break
 
-    # Reset expanded row if it was deleted
-    if expanded_row == index:
-        expanded_row = None
+def delete_entry(editor: Editor, row):
+    """Delete a cue"""
+    if (position := find_cue(editor.cues, row)) == -1:
+        ui.notify("Entry not found", type="negative")
+        return
 
-    # Remove from edit inputs if present
-    if index in edit_inputs:
-        del edit_inputs[index]
+    if not save_ops(editor, [{"op": "delete", "id": row["id"]}]):
+        return
 
-    # Re-index remaining items
-    for i, item in enumerate(data):
-        item["index"] = i + 1
+    editor.cues.pop(position)
 
+    editor.edit_panel.style("display: none;")
     ui.notify("Entry deleted", type="info")
-    render_data_table.refresh()
+    update_page(editor)
+
+
+def add_new_entry(editor: Editor, row):
+    """Add a new cue after the given row"""
+    cues = editor.cues
+    position = find_cue(cues, row)
+    start_ms = cues[position]["end_ms"] if position != -1 else 0
+    cue = make_cue(uuid4().hex, start_ms, start_ms, "New subtitle text")
+
+    if not save_ops(
+        editor,
+        [
+            {
+                "op": "insert",
+                "id": cue["id"],
+                "after": cues[position]["id"] if position != -1 else None,
+                "start_ms": cue["start_ms"],
+                "end_ms": cue["end_ms"],
+                "text": cue["text"],
+            }
+        ],
+    ):
+        return
 
+    cues.insert(position + 1, cue)
 
-def add_new_entry(index: int):
-    """Add a new entry to the data"""
-    global data, expanded_row, edit_inputs
+    update_page(editor)
 
-    if index == -1:
-        index = 0
 
-    # Get default start time from the last entry end time if available
-    default_start = data[-1]["end_time"] if data else "00:00:00,000"
+def seek_video(editor: Editor, row: dict) -> None:
+    """Seek the video to the specified start time"""
 
-    # Create new entry
-    new_entry = {
-        "index": None,
-        "start_time": default_start,
-        "end_time": default_start,
-        "text": "New subtitle text",
-    }
+    editor.video.seek(row["start_ms"] / 1000)
 
-    # Add to data to index position in list
-    data.insert(index, new_entry)
 
-    # Auto-expand and edit the new entry
-    expanded_row = index
-    edit_inputs[index] = {}
+def get_peaks(uuid: str) -> Optional[dict]:
+    """Get the precomputed waveform peaks of the media file"""
+    response = requests.get(f"{API_URL}/static/{uuid}/peaks")
 
-    # Set new index for all items
-    for i, item in enumerate(data):
-        item["index"] = i
+    if response.status_code != 200:
+        return None
 
-    # Sort data by index
-    data = sorted(data, key=lambda d: d["index"])
+    return response.json()
 
-    expanded_row = None
 
-    render_data_table.refresh()
+def get_video_url(uuid: str) -> str:
+    """Use the low bitrate preview if the broker has created one"""
+    preview_url = f"{API_URL}/static/{uuid}/preview"
+    response = requests.get(preview_url, headers={"Range": "bytes=0-0"})
 
+    if response.status_code in (200, 206):
+        return preview_url
 
-def parse_srt(data):
-    """Parse SRT data into a structured format"""
-    parsed_data = []
-    lines = data.splitlines()
+    return f"{API_URL}/static/{uuid}"
 
-    for i in range(0, len(lines), 4):
-        if i + 3 < len(lines):
-            index = int(lines[i])
-            time_range = lines[i + 1].split(" --> ")
-            start_time = time_range[0].strip()
-            end_time = time_range[1].strip()
-            text = lines[i + 2].strip()
 
-            parsed_data.append(
-                {
-                    "index": index,
-                    "start_time": start_time,
-                    "end_time": end_time,
-                    "text": text,
-                }
-            )
+def waveform_svg(peaks: dict, width: int = 1000, height: int = 60) -> str:
+    """Draw the waveform peaks as an SVG with at most width columns"""
+    data = peaks["data"]
+    length = peaks["length"]
+    step = max(1, math.ceil(length / width))
+    scale = height / 256
+    middle = height / 2
 
-    return parsed_data
+    path = ""
+    for x, i in enumerate(range(0, length, step)):
+        low = min(data[2 * i : 2 * (i + step) : 2])
+        high = max(data[2 * i + 1 : 2 * (i + step) : 2])
+        path += (
+            f"M{x + 0.5} {middle - high * scale:.1f}V{middle - low * scale + 0.5:.1f}"
+        )
 
-def seek_video(row: dict) -> None:
-    """Seek the video to the specified start time"""
+    return (
+        f'<svg viewBox="0 0 {math.ceil(length / step)} {height}" '
+        f'preserveAspectRatio="none" style="width: 100%; height: {height}px;">'
+        f'<path d="{path}" stroke="#77aadb" stroke-width="1" fill="none"/></svg>'
+    )
 
-    global video
 
-    start_time = row["start_time"].split(",")[0]
-    start_time_parts = start_time.split(":")
-    start_time_seconds = (
-        int(start_time_parts[0]) * 3600
-        + int(start_time_parts[1]) * 60
-        + int(start_time_parts[2])
+def render_waveform(editor: Editor, peaks: dict) -> None:
+    """Render the waveform, clicking it seeks the video"""
+    duration = peaks["length"] * peaks["samples_per_pixel"] / peaks["sample_rate"]
+
+    ui.html(waveform_svg(peaks)).classes("w-full cursor-pointer").on(
+        "click",
+        lambda e: editor.video.seek(e.args * duration),
+        js_handler="(e) => emit(e.offsetX / e.currentTarget.clientWidth)",
     )
 
-    video.seek(start_time_seconds)
+
+def show_edit_panel(editor: Editor, event):
+    open_edit_panel(editor, event.args[1])
 
 
+def jump_to_cue(editor: Editor, cue_id: str, index: int) -> None:
+    """Show the page with the cue, e.g. a search hit, and start editing it"""
+    position = find_cue(editor.cues, {"id": cue_id, "index": index})
+
+    if position < 0:
+        ui.notify("The subtitle has been changed or removed", type="warning")
+        return
 
+    editor.table.filter = ""
+    update_page(editor, {"page": position // ROWS_PER_PAGE + 1})
+    open_edit_panel(editor, {**editor.cues[position], "index": position + 1})
 
-def show_edit_panel(event):
+
+def open_edit_panel(editor: Editor, row: dict) -> None:
+    edit_panel = editor.edit_panel
     edit_panel.style("display: block;")
     edit_panel.clear()
 
-    row = event.args[1]
-
-    seek_video(row)
+    seek_video(editor, row)
 
     with edit_panel as edit:
         edit.classes("w-full p-4 bg-gray-100")
-        ui.label(f"Edit Subtitle {row["index"]}").classes("text-h6")
+        ui.label(f"Edit Subtitle {row['index']}").classes("text-h6")
+        ui.label(calculate_duration(row["start_ms"], row["end_ms"])).classes(
+            "text-gray-500"
+        )
 
         with ui.row().classes("w-full"):
             start_time = ui.input(
@@ -302,47 +407,46 @@ def show_edit_panel(event):
         with ui.row().style("margin-top: 20px;"):
             ui.button(
                 icon="add_circle",
-                on_click=lambda: add_new_entry(row["index"] + 1),
+                on_click=lambda: add_new_entry(editor, row),
             ).props("color=primary")
             ui.button(
                 icon="delete",
-                on_click=lambda: delete_entry(row["index"]),
-            ).props("color=negative")            
+                on_click=lambda: delete_entry(editor, row),
+            ).props("color=negative")
             ui.button(
                 icon="save",
-                on_click=lambda: save_edit(row["index"], text.value, start_time.value, end_time.value),
+                on_click=lambda: save_edit(
+                    editor, row, text.value, start_time.value, end_time.value
+                ),
             ).props("color=primary")
 
 
-def export_srt():
-    """Export data in SRT format"""
-    srt_content = ""
-    for item in sorted(data, key=lambda x: x["index"]):
-        srt_content += f"{item['index']}\n"
-        srt_content += f"{item['start_time']} --> {item['end_time']}\n"
-        srt_content += f"{item['text']}\n\n"
-
-    ui.download("subtitles.srt", srt_content)
+def export_srt(editor: Editor):
+    """Export the current transcript version, rendered by the broker"""
+    ui.download(
+        f"{API_URL}/api/v1/transcriber/{editor.job_uuid}/result", "subtitles.srt"
+    )
     ui.notify("SRT file ready for download", type="positive")
 
 
 def create() -> None:
     @ui.page("/srt")
-    def result(uuid: str, filename: str) -> None:
+    def result(
+        uuid: str, filename: str, cue: Optional[str] = None, index: int = 0
+    ) -> None:
         """
-        Display the result of the transcription job.
+        Display the result of the transcription job, optionally opened at
+        the cue with the given ID and index.
         """
-        global data, edit_panel, video, table, table_page
         page_init()
 
-        response = requests.get(f"{API_URL}/api/v1/transcriber/{uuid}/result")
+        transcript = get_transcript(uuid)
 
-        if response.status_code != 200:
+        if transcript is None:
             ui.notify("Error: Failed to get result")
             return
 
-        data = response.content.decode()
-        data = parse_srt(data)
+        editor = Editor(uuid, *transcript)
 
         # Create a toolbar with buttons on the top and the text under button icon
         with ui.row().classes("justify-between items-center"):
@@ -352,27 +456,39 @@ def create() -> None:
             ui.button(
                 "Export SRT",
                 icon="save",
-                on_click=export_srt,
+                on_click=lambda: export_srt(editor),
             ).style("width: 150px;")
 
+            if editor.stage == "draft":
+                ui.badge("Draft", color="teal").tooltip(
+                    "A larger model is refining this transcript, "
+                    "it can be edited once the refined version is done"
+                )
+
         # Split screen in 2/3 and 1/3
         with ui.splitter(value=70) as splitter:
             with splitter.before:
                 with ui.card().classes("w-full"):
-                    render_data_table()
+                    render_data_table(editor)
 
             with splitter.after:
                 # Add transcription information
                 ui.label("Transcription Information").classes("text-h6 q-mb-md")
                 ui.separator()
-                print(f"{API_URL}/static/{uuid}")
-                video = ui.video(
-                    f"{API_URL}/static/{uuid}",
+                editor.video = ui.video(
+                    get_video_url(uuid),
                     autoplay=False,
                     controls=True,
                     muted=False,
                 ).style("width: 75%; align-self: center;")
 
+                if peaks := get_peaks(uuid):
+                    render_waveform(editor, peaks)
+
                 ui.separator()
                 with ui.row() as edit_panel:
                     edit_panel.style("display: none;")
+                editor.edit_panel = edit_panel
+
+        if cue:
+            jump_to_cue(editor, cue, index)
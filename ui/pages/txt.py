@@ -1,6 +1,5 @@
-import requests
 from nicegui import ui, app
-from pages.common import API_URL, page_init
+from pages.common import get_result, page_init
 
 
 def save_file(data: str, filename: str) -> None:
@@ -37,13 +36,13 @@ def create() -> None:
         """
 
         app.add_static_files(url_path="/static", local_directory="static/")
-        response = requests.get(f"{API_URL}/api/v1/transcriber/{uuid}/result")
+        result = get_result(uuid)
 
-        if response.status_code != 200:
+        if result is None:
             ui.notify("Error: Failed to get result")
             return
 
-        data = response.content.decode("utf-8")
+        data = result.decode("utf-8")
 
         page_init()
 
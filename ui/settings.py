@@ -18,6 +18,10 @@ class Settings(BaseSettings):
     DEBUG: bool = True
     API_URL: str = "http://localhost:8000"
     STATIC_FILES: str = "static"
+    UPLOAD_CONCURRENCY: int = 2
+    UPLOAD_TIMEOUT: float = 60 * 60
+    UPLOAD_DIRECT: bool = False
+    API_PUBLIC_URL: str = "http://localhost:8000"
 
 
 @lru_cache
@@ -0,0 +1,47 @@
+import re
+
+from typing import Optional
+
+TIMESTAMP_RE = re.compile(r"^\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*$")
+
+
+def parse_timestamp(value: str) -> Optional[int]:
+    """
+    Parse an SRT timestamp (HH:MM:SS,mmm) into milliseconds.
+    Returns None if the timestamp is invalid.
+    """
+    if not (match := TIMESTAMP_RE.match(value)):
+        return None
+
+    hours, minutes, seconds, milliseconds = match.groups()
+    if int(minutes) > 59 or int(seconds) > 59:
+        return None
+
+    total_seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+    return total_seconds * 1000 + int(milliseconds.ljust(3, "0"))
+
+
+def format_timestamp(ms: int) -> str:
+    """
+    Format milliseconds as an SRT timestamp (HH:MM:SS,mmm).
+    """
+    seconds, ms = divmod(max(ms, 0), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def make_cue(cue_id: str, start_ms: int, end_ms: int, text: str) -> dict:
+    """
+    Create a cue, with the timestamps formatted once for display.
+    """
+    return {
+        "id": cue_id,
+        "start_ms": start_ms,
+        "end_ms": end_ms,
+        "start_time": format_timestamp(start_ms),
+        "end_time": format_timestamp(end_ms),
+        "text": text,
+    }
@@ -1,14 +1,23 @@
+import errno
 import logging
+import os
+import re
 import requests
+import shutil
 import subprocess
 import traceback
 import threading
 
+from cache import AudioCache, ModelCache
+from client import create_session, download
 from enum import Enum
 from settings import get_settings
 from time import sleep
 from pathlib import Path
 from random import randint
+from reflow import reflow_file
+from typing import Optional
+from watchdog import RealTimeFactors, Watchdog, WatchdogError, kill_group
 
 
 class JobStatusEnum(str, Enum):
@@ -30,6 +39,44 @@ api_broker_url = settings.API_BROKER_URL
 api_file_storage_dir = settings.API_FILE_STORAGE_DIR
 api_version = settings.API_VERSION
 api_url = f"{api_broker_url}/api/{api_version}/transcriber"
+models_url = f"{api_broker_url}/api/{api_version}/models"
+
+# Pooled connections to the broker, shared by all worker threads. Claiming
+# a job is not idempotent, so it is never retried.
+session = create_session(no_retry_urls=[f"{api_url}/next"])
+
+# Results that could not be uploaded, kept until the broker takes them
+outbox_dir = Path(api_file_storage_dir) / "outbox"
+outbox_lock = threading.Lock()
+
+# Transcoded audio kept for later runs on the same upload
+audio_cache = AudioCache(
+    Path(api_file_storage_dir) / "cache", settings.AUDIO_CACHE_BYTES
+)
+
+# Models downloaded from the broker registry
+model_cache = ModelCache(Path(settings.MODEL_CACHE_DIR), settings.MODEL_CACHE_BYTES)
+
+# Files of a job in the storage directory, named by the job UUID and these
+# suffixes: the download, the transcoded audio, the cut segment, the
+# language sample and the results. Other files of the job are left alone
+# in case the directory is shared with the broker.
+JOB_FILE_SUFFIXES = ["", ".wav", ".segment.wav", ".sample.wav"] + [
+    f".{output_format}{part}"
+    for output_format in ("txt", "srt", "csv")
+    for part in ("", ".part")
+]
+
+# Language detection output of whisper.cpp
+LANGUAGE_RE = re.compile(r"auto-detected language: (\w+) \(p = ([\d.]+)\)")
+
+# Seconds every stage takes per second of audio, for the watchdog
+real_time_factors = RealTimeFactors()
+
+# Command running for every job and the jobs cancelled on the broker
+processes: dict[str, subprocess.Popen] = {}
+cancelled: set[str] = set()
+processes_lock = threading.Lock()
 
 
 def get_logger():
@@ -50,18 +97,85 @@ def get_logger():
 logger = get_logger()
 
 
-def transcode_file(filename: str):
+class JobCancelled(Exception):
     """
-    Transcode the audio file using ffmpeg.
-    The transcoded format should be 16kHz mono WAV.
+    Raised when the job being processed was cancelled on the broker.
     """
 
-    output_filename = f"{filename}.wav"
 
-    command = [
+def run_command(
+    command: list, uuid: str, stage: str, duration: Optional[float]
+) -> subprocess.CompletedProcess:
+    """
+    Run a command of a job like subprocess.run() with check=True, in a
+    process group of its own, so cancelling the job kills the command
+    together with any processes it started.
+
+    A watchdog kills the command if it runs past the time limit of the
+    stage on audio of the given duration, stops making progress or uses
+    too much memory, and WatchdogError is raised with the reason.
+    """
+    with processes_lock:
+        if uuid in cancelled:
+            raise JobCancelled(uuid)
+
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        processes[uuid] = process
+
+    watchdog = Watchdog(process.pid, stage, real_time_factors.timeout(stage, duration))
+
+    try:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=settings.WATCHDOG_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                if error := watchdog.check():
+                    logger.error(f"Killing {command[0]} of {uuid}: {error}")
+                    kill_group(process.pid)
+    finally:
+        with processes_lock:
+            processes.pop(uuid, None)
+
+    if uuid in cancelled:
+        raise JobCancelled(uuid)
+    if watchdog.error:
+        raise watchdog.error
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+
+    real_time_factors.update(stage, watchdog.elapsed(), duration)
+
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def cancel_job(uuid: str) -> None:
+    """
+    Stop a job, killing the process group of its running command.
+    """
+    with processes_lock:
+        cancelled.add(uuid)
+
+        if process := processes.get(uuid):
+            kill_group(process.pid)
+
+
+def transcode_command(filename: str, input_path: Optional[str] = None) -> list:
+    """
+    Get the ffmpeg command transcoding the file to 16kHz mono WAV.
+
+    If input_path is given the file is read from there instead of
+    the local storage directory, e.g. from a volume shared with the broker.
+    """
+    return [
         "ffmpeg",
         "-i",
-        str(Path(api_file_storage_dir) / filename),
+        input_path or str(Path(api_file_storage_dir) / filename),
         "-ar",
         "16000",
         "-ac",
@@ -69,13 +183,25 @@ def transcode_file(filename: str):
         "-f",
         "wav",
         "-y",
-        str(Path(api_file_storage_dir) / output_filename),
+        str(Path(api_file_storage_dir) / f"{filename}.wav"),
     ]
 
+
+def transcode_file(
+    filename: str, input_path: Optional[str] = None, duration: Optional[float] = None
+):
+    """
+    Transcode the audio file using ffmpeg.
+    The transcoded format should be 16kHz mono WAV.
+    """
+
+    output_filename = f"{filename}.wav"
+    command = transcode_command(filename, input_path)
+
     try:
         ffmpeg_cmd = " ".join(command)
         logger.debug(f"Transcoding command: {ffmpeg_cmd}")
-        result = subprocess.run(command, check=True, capture_output=True)
+        result = run_command(command, filename, "transcode", duration)
 
         # Check exit code
         if result.returncode != 0:
@@ -90,12 +216,63 @@ def transcode_file(filename: str):
     return True
 
 
-def transcribe_file(filename: str, language: str, model: str, output_format: str):
+def source_duration(job: dict) -> Optional[float]:
     """
-    Transcribe the audio file using whisper.cpp, we expect the executable
-    to be in PATH.
+    Get the duration of the upload of a job. The duration of the upload
+    of a segment is not known, only that of the segment.
+    """
+    return None if job.get("parent_uuid") else job.get("duration")
+
+
+def segment_path(filename: str) -> Path:
+    """
+    Get the path of the audio of a segment of a split job.
     """
-    command = [
+    return Path(api_file_storage_dir) / f"{filename}.segment.wav"
+
+
+def segment_command(filename: str, start: float, duration: float) -> list:
+    """
+    Get the ffmpeg command cutting the segment of a split job from the
+    transcoded audio of the whole upload.
+    """
+    return [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-ss",
+        str(start),
+        "-t",
+        str(duration),
+        "-i",
+        str(Path(api_file_storage_dir) / f"{filename}.wav"),
+        "-c",
+        "copy",
+        "-y",
+        str(segment_path(filename)),
+    ]
+
+
+def cut_segment(filename: str, start: float, duration: float) -> None:
+    """
+    Replace the transcoded audio with the segment of a split job, the
+    audio of the whole upload stays in the audio cache.
+    """
+    command = segment_command(filename, start, duration)
+    logger.debug(f"Segment command: {' '.join(command)}")
+    run_command(command, filename, "segment", duration)
+
+    os.replace(segment_path(filename), Path(api_file_storage_dir) / f"{filename}.wav")
+    logger.info(f"Cut segment of {duration:.0f} seconds at {start:.0f}: {filename}")
+
+
+def transcribe_command(
+    filename: str, language: str, model: str, output_format: str
+) -> list:
+    """
+    Get the whisper.cpp command transcribing the transcoded file.
+    """
+    return [
         "whisper.cpp",
         "-l",
         language,
@@ -108,10 +285,24 @@ def transcribe_file(filename: str, language: str, model: str, output_format: str
         str(Path(api_file_storage_dir) / f"{filename}.wav"),
     ]
 
+
+def transcribe_file(
+    filename: str,
+    language: str,
+    model: str,
+    output_format: str,
+    duration: Optional[float] = None,
+):
+    """
+    Transcribe the audio file using whisper.cpp, we expect the executable
+    to be in PATH.
+    """
+    command = transcribe_command(filename, language, model, output_format)
+
     try:
         whisper_cmd = " ".join(command)
         logger.debug(f"Transcription command: {whisper_cmd}")
-        result = subprocess.run(command, check=True, capture_output=True)
+        result = run_command(command, filename, f"transcribe:{model}", duration)
 
         # Check exit code
         if result.returncode != 0:
@@ -126,11 +317,99 @@ def transcribe_file(filename: str, language: str, model: str, output_format: str
     return True
 
 
+def sample_path(filename: str) -> Path:
+    """
+    Get the path of the language detection sample of a file.
+    """
+    return Path(api_file_storage_dir) / f"{filename}.sample.wav"
+
+
+def sample_command(filename: str) -> list:
+    """
+    Get the ffmpeg command cutting a short sample from the transcoded file
+    for language detection, starting where the speech starts instead of
+    at leading silence.
+    """
+    return [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        str(Path(api_file_storage_dir) / f"{filename}.wav"),
+        "-af",
+        "silenceremove=start_periods=1:start_threshold=-40dB:start_silence=0.2",
+        "-t",
+        str(settings.DETECT_LANGUAGE_SECONDS),
+        "-y",
+        str(sample_path(filename)),
+    ]
+
+
+def detect_language_command(filename: str) -> list:
+    """
+    Get the whisper.cpp command detecting the language of the sample
+    with the tiny model.
+    """
+    return [
+        "whisper.cpp",
+        "-l",
+        "auto",
+        "--detect-language",
+        "-m",
+        settings.DETECT_LANGUAGE_MODEL,
+        "-f",
+        str(sample_path(filename)),
+    ]
+
+
+def parse_language(filename: str, output: str) -> str:
+    """
+    Get the detected language from the whisper.cpp output, or "auto"
+    if no language was detected.
+    """
+    if not (match := LANGUAGE_RE.search(output)):
+        logger.error(f"No language detected for {filename}")
+        return "auto"
+
+    language, probability = match.groups()
+    logger.info(f"Detected language {language} (p = {probability}) for {filename}")
+
+    return language
+
+
+def detect_language(filename: str) -> str:
+    """
+    Detect the spoken language on a short sample with the tiny model,
+    so the cost is small and the same for every file.
+
+    Returns "auto" if the language could not be detected, which lets
+    the multilingual model detect it during the transcription.
+    """
+    try:
+        command = sample_command(filename)
+        logger.debug(f"Sample command: {' '.join(command)}")
+        run_command(command, filename, "sample", settings.DETECT_LANGUAGE_SECONDS)
+
+        command = detect_language_command(filename)
+        logger.debug(f"Language detection command: {' '.join(command)}")
+        result = run_command(
+            command, filename, "detect", settings.DETECT_LANGUAGE_SECONDS
+        )
+    except (subprocess.CalledProcessError, WatchdogError) as e:
+        logger.error(f"Error during language detection: {e}")
+        return "auto"
+
+    return parse_language(
+        filename,
+        result.stderr.decode(errors="replace") + result.stdout.decode(errors="replace"),
+    )
+
+
 def get_next_job(url: str) -> dict:
     """
     Get the next job from the API broker.
     """
-    response = requests.get(f"{api_url}/next")
+    response = session.get(f"{api_url}/next")
     response.raise_for_status()
 
     job = response.json()["result"]
@@ -144,33 +423,51 @@ def get_next_job(url: str) -> dict:
     return job
 
 
-def get_file(uuid: str) -> bool:
+def get_file(uuid: str, url: Optional[str] = None) -> bool:
     """
-    Download the file from the API broker.
+    Download the file from the API broker, or directly from the
+    storage backend if the broker handed out a presigned URL.
+    Broken transfers are resumed where they stopped.
     """
 
-    response = requests.get(f"{api_url}/{uuid}/file")
-    response.raise_for_status()
-
-    if response.status_code != 200:
-        logger.error(f"Error downloading file: {response.status_code}")
-        raise Exception("File not downloaded")
-
     file_path = Path(api_file_storage_dir) / uuid
-
-    with open(file_path, "wb") as f:
-        f.write(response.content)
+    download(session, url or f"{api_url}/{uuid}/file", file_path)
 
     return True
 
 
-def put_status(uuid: str, status: JobStatusEnum, error: str) -> bool:
+def error_class(e: Exception) -> str:
+    """
+    Classify the error a job failed with, the broker retries every class
+    of error by its own policy.
+    """
+    if isinstance(e, WatchdogError):
+        return e.reason
+    if isinstance(e, MemoryError) or (
+        isinstance(e, OSError) and e.errno in (errno.ENOSPC, errno.ENOMEM)
+    ):
+        return "resources"
+    if isinstance(e, subprocess.CalledProcessError):
+        # A negative return code is the signal that killed the process
+        return "killed" if e.returncode < 0 else "process"
+    if isinstance(e, FileNotFoundError):
+        return "missing"
+    if isinstance(e, (requests.RequestException, ConnectionError, TimeoutError)):
+        return "network"
+
+    return "unknown"
+
+
+def put_status(
+    uuid: str, status: JobStatusEnum, error: str, error_class: Optional[str] = None
+) -> bool:
     """
     Update the job status in the API broker.
     """
     try:
-        response = requests.put(
-            f"{api_url}/{uuid}", json={"status": status, "error": error}
+        response = session.put(
+            f"{api_url}/{uuid}",
+            json={"status": status, "error": error, "error_class": error_class},
         )
         response.raise_for_status()
     except requests.RequestException as e:
@@ -179,28 +476,262 @@ def put_status(uuid: str, status: JobStatusEnum, error: str) -> bool:
     return True
 
 
-def put_file(uuid: str, output_format: str) -> bool:
+def send_heartbeats(uuid: str, done: threading.Event) -> None:
+    """
+    Tell the broker the job is still being processed until it is done,
+    and stop the job if the broker says it was cancelled.
+    """
+    while not done.wait(settings.HEARTBEAT_INTERVAL):
+        try:
+            response = session.put(f"{api_url}/{uuid}/heartbeat")
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.error(f"Error sending heartbeat for {uuid}: {e}")
+            continue
+
+        if response.json()["result"].get("cancel") and not done.is_set():
+            logger.info(f"Job {uuid} was cancelled, stopping it.")
+            cancel_job(uuid)
+            return
+
+
+def put_detected_language(uuid: str, language: str) -> bool:
+    """
+    Save the detected language on the job in the API broker.
+    """
+    try:
+        response = session.put(
+            f"{api_url}/{uuid}", json={"detected_language": language}
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"Error updating detected language: {e}")
+        return False
+    return True
+
+
+def put_file(
+    uuid: str,
+    output_format: str,
+    url: Optional[str] = None,
+    file_path: Optional[Path] = None,
+) -> bool:
     """
-    Upload the file to the API broker.
+    Upload the file to the API broker, or directly to the storage
+    backend if the broker handed out a presigned URL.
+
+    Uploads are PUT requests, so they are retried on errors and the
+    broker accepts the same result more than once.
     """
 
-    file_path = Path(api_file_storage_dir) / f"{uuid}.{output_format}"
+    filename = f"{uuid}.{output_format}"
+    file_path = file_path or Path(api_file_storage_dir) / filename
+
     with open(file_path, "rb") as fd:
-        response = requests.put(f"{api_url}/{uuid}/result", files={"file": fd})
+        if not url:
+            response = session.put(
+                f"{api_url}/{uuid}/result", files={"file": (filename, fd)}
+            )
+            response.raise_for_status()
+            return True
+
+        response = session.put(url, data=fd)
         response.raise_for_status()
 
+    return put_result_stored(uuid, filename)
+
+
+def put_result_stored(uuid: str, filename: str) -> bool:
+    """
+    Report a result written directly to the broker storage as completed.
+    """
+    response = session.put(
+        f"{api_url}/{uuid}/result/shared", json={"filename": filename}
+    )
+    response.raise_for_status()
+
+    return True
+
+
+def move_file(src: Path, dst: Path) -> None:
+    """
+    Move a file, renaming it when both paths are on the same filesystem
+    and falling back to copy and rename across filesystems.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp_path = dst.with_name(f"{dst.name}.part")
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+        src.unlink()
+
+
+def put_file_shared(uuid: str, output_format: str, output_dir: str) -> bool:
+    """
+    Place the result directly in the broker storage directory and
+    report completion to the API broker.
+    """
+
+    filename = f"{uuid}.{output_format}"
+    file_path = Path(api_file_storage_dir) / filename
+    move_file(file_path, Path(output_dir) / filename)
+
+    return put_result_stored(uuid, filename)
+
+
+def keep_result(uuid: str, output_format: str) -> bool:
+    """
+    Keep a result that could not be uploaded in the outbox, so it is
+    uploaded later instead of transcribing the file again.
+    """
+    file_path = Path(api_file_storage_dir) / f"{uuid}.{output_format}"
+
+    if not file_path.exists():
+        return False
+
+    outbox_dir.mkdir(exist_ok=True)
+    move_file(file_path, outbox_dir / file_path.name)
+    logger.info(f"Kept result {file_path.name} for a later upload")
+
+    return True
+
+
+def outbox_result(uuid: str, output_format: str) -> Optional[Path]:
+    """
+    Get a kept result of a job, removing kept results in other formats.
+    """
+    result = None
+
+    for file_path in outbox_dir.glob(f"{uuid}.*"):
+        if file_path.name == f"{uuid}.{output_format}":
+            result = file_path
+        else:
+            file_path.unlink()
+
+    return result
+
 
-def get_model(model_type: str, language: str) -> str:
+def upload_outbox() -> None:
+    """
+    Upload the kept results, stopping at the first connection error.
+    Results of jobs the broker no longer knows or cancelled are dropped.
+    """
+    if not outbox_dir.exists() or not outbox_lock.acquire(blocking=False):
+        return
+
+    try:
+        for file_path in sorted(outbox_dir.iterdir()):
+            uuid, _, output_format = file_path.name.rpartition(".")
+            if not uuid or output_format == "part":
+                continue
+
+            try:
+                put_file(uuid, output_format, file_path=file_path)
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in (404, 410):
+                    logger.error(f"Error uploading kept result {file_path.name}: {e}")
+                    continue
+                logger.info(f"Dropping kept result of unknown or cancelled job {uuid}")
+            except requests.RequestException as e:
+                logger.error(f"Error uploading kept result {file_path.name}: {e}")
+                break
+            else:
+                logger.info(f"Uploaded kept result {file_path.name}")
+
+            file_path.unlink()
+    finally:
+        outbox_lock.release()
+
+
+def use_shared_storage(job: dict) -> bool:
+    """
+    Check if the job files can be accessed directly on a shared volume.
+    """
+    if not settings.SHARED_STORAGE:
+        return False
+    if not job.get("input_path") or not job.get("output_dir"):
+        return False
+
+    return Path(job["input_path"]).is_file() and Path(job["output_dir"]).is_dir()
+
+
+def find_model(
+    model_type: str, language: str, quantization: str = ""
+) -> Optional[dict]:
+    """
+    Get the model for the model type and language from the broker
+    registry, preferring the given quantization, or None if the registry
+    has no such model.
+    """
+    response = session.get(
+        f"{models_url}/match",
+        params={
+            "model_type": model_type,
+            "language": language,
+            "quantization": quantization,
+        },
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    return response.json()["result"]["model"]
+
+
+def choose_model(
+    language: str, seconds: float, latency_target: float
+) -> Optional[dict]:
+    """
+    Get the most accurate registry model transcribing the given seconds
+    of audio in the language within the latency target, or None if no
+    model is benchmarked.
+    """
+    response = session.get(
+        f"{models_url}/choose",
+        params={
+            "language": language,
+            "seconds": seconds,
+            "latency_target": latency_target,
+        },
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    return response.json()["result"]["model"]
+
+
+def cached_model(model: dict) -> str:
+    """
+    Get the path of a registry model in the model cache, downloading it
+    the first time it is used. The model is kept in the cache until it
+    is released with model_cache.release().
+    """
+    url = f"{models_url}/{model['sha256']}/file"
+
+    return str(model_cache.get(model, lambda path: download(session, url, path)))
+
+
+def get_model(model_type: str, language: str, quantization: str = "") -> str:
     """
     Return the correct model file based on
     model type and language.
 
-    If langauge = sv then use kb-whisper else
-    use the default whisper model.
+    Models in the broker registry are downloaded to the model cache the
+    first time they are used, the variant of the given quantization if
+    there is one. Without a model in the registry, sv uses
+    kb-whisper and other languages the default multilingual whisper
+    model from the models directory. Raises FileNotFoundError if there
+    is no model for the model type.
     """
+    if model := find_model(model_type, language, quantization):
+        return cached_model(model)
 
     file_path = "models/"
-    file_path += "sv" if language == "sv" else "en"
+    file_path += "sv" if language == "sv" else "whisper"
 
     match model_type:
         case "tiny":
@@ -210,46 +741,49 @@ def get_model(model_type: str, language: str) -> str:
         case "large":
             file_path += "_large"
         case _:
-            file_path += "_base"
+            raise FileNotFoundError(f"No {model_type} model for language {language}")
 
     return f"{file_path}.bin"
 
 
-def postprocess_srt(uuid: str, output_format: str) -> bool:
+def job_model(job: dict, language: str) -> str:
     """
-    Postprocess the SRT file to remove unwanted characters.
+    Get the model file of a job: the registry model the broker chose for
+    its latency target, or for a job submitted with language auto the
+    model meeting it in the detected language. Other jobs, and drafts,
+    use the model of their model type and language. Release the model
+    with model_cache.release() once the transcription is done.
     """
+    if job.get("model"):
+        return cached_model(job["model"])
+
+    if (
+        job.get("latency_target")
+        and job.get("duration")
+        and job["language"] == "auto"
+        and not job.get("refine_model")
+        and (model := choose_model(language, job["duration"], job["latency_target"]))
+    ):
+        return cached_model(model)
 
-    # Timing based on reading speed
-    # • Default reading speed: 160–180 words per minute.
-    # • Minimum display time: 1.5 seconds, to avoid flickering subtitles.
+    return get_model(job["model_type"], language, job.get("quantization") or "")
 
-    # Audio-sync and natural timing
-    # • Subtitle should ideally appear 0.5 seconds before speech and remain at least 1 second after the final word.
-    # • If possible, adjust timestamps for natural rhythm in relation to spoken tempo.
 
-    # Export in professional formats
-    # • Primary export to .srt.
-    # • Support for .vtt or possibly .json if needed for further processing.
+def postprocess_srt(uuid: str, output_format: str) -> bool:
+    """
+    Reflow the SRT file: wrap lines at word boundaries and adjust the
+    timing to the reading speed, see reflow.reflow().
+    """
 
-    if output_format != "srt":
+    if output_format != "srt" or not settings.REFLOW_SRT:
         return False
 
     srt_path = Path(api_file_storage_dir) / f"{uuid}.srt"
-    with open(srt_path, "r") as f:
-        content = f.read()
-
-    for line in content.splitlines():
-        if len(line) > 42:
-            # Split line into two lines if longer than 42 characters
-            split_line = line[:42] + "\n" + line[42:]
-            content = content.replace(line, split_line)
-
-    # • Avoid line breaks in the middle of names or fixed expressions.
-    # Remove unwanted characters
-
-    with open(srt_path, "w") as f:
-        f.write(content)
+    reflow_file(
+        srt_path,
+        max_length=settings.REFLOW_MAX_LINE_LENGTH,
+        words_per_minute=settings.REFLOW_WORDS_PER_MINUTE,
+    )
 
     logger.info(f"Postprocessing completed for {uuid}.srt")
     return True
@@ -257,22 +791,14 @@ def postprocess_srt(uuid: str, output_format: str) -> bool:
 
 def delete_files(uuid: str) -> bool:
     """
-    Delete all files related to the job.
+    Delete all files the worker created for the job: the download, the
+    transcoded audio and samples, and the results in every output format.
     """
-    file_path = Path(api_file_storage_dir) / uuid
-    if file_path.exists():
-        file_path.unlink()
-        logger.info(f"Deleted file {file_path}")
-
-    wav_file_path = Path(api_file_storage_dir) / f"{uuid}.wav"
-    if wav_file_path.exists():
-        wav_file_path.unlink()
-        logger.info(f"Deleted file {wav_file_path}")
-
-    srt_file_path = Path(api_file_storage_dir) / f"{uuid}.srt"
-    if srt_file_path.exists():
-        srt_file_path.unlink()
-        logger.info(f"Deleted file {srt_file_path}")
+    for suffix in JOB_FILE_SUFFIXES:
+        file_path = Path(api_file_storage_dir) / f"{uuid}{suffix}"
+        if file_path.is_file():
+            file_path.unlink(missing_ok=True)
+            logger.info(f"Deleted file {file_path}")
 
     return True
 
@@ -286,6 +812,8 @@ def main(worker_id: int):
     )
 
     while True:
+        done = threading.Event()
+
         try:
             # Sleep for a random time between 5 and 10 seconds
             # to avoid hammering the API broker.
@@ -295,40 +823,101 @@ def main(worker_id: int):
             )
             sleep(sleep_time)
 
+            # Retry results that could not be uploaded before
+            upload_outbox()
+
             if not (job := get_next_job(api_broker_url)):
                 continue
 
             uuid = job["uuid"]
             language = job["language"]
             model_type = job["model_type"]
-            model = get_model(model_type, language)
             output_format = job["output_format"]
 
             logger.info(f"[{worker_id}] Processing job {uuid}:")
             logger.info(f"  Language: {language}")
             logger.info(f"  Model Type: {model_type}")
-            logger.info(f"  Model: {model}")
             logger.info(f"  Output Format: {output_format}")
 
-            # Download the file
-            get_file(uuid)
+            # Stop the job as soon as it is cancelled on the broker
+            cancelled.discard(uuid)
+            threading.Thread(
+                target=send_heartbeats, args=(uuid, done), daemon=True
+            ).start()
+
+            # The job was transcribed before but the upload failed
+            if kept := outbox_result(uuid, output_format):
+                put_file(uuid, output_format, file_path=kept)
+                kept.unlink()
+                logger.info(f"[{worker_id}] Job {uuid} completed from kept result.")
+                continue
 
-            # Transcode the file
-            transcode_file(uuid)
+            shared = use_shared_storage(job)
+            wav_path = Path(api_file_storage_dir) / f"{uuid}.wav"
+
+            # Segments of a split job share the upload of the job
+            source = job.get("parent_uuid") or uuid
+
+            # Reuse the audio transcoded by an earlier run on the same upload
+            if audio_cache.get(source, wav_path):
+                logger.info(f"[{worker_id}] Using cached audio for {uuid}")
+            else:
+                # Read the file in place if the broker storage is mounted,
+                # otherwise download it
+                if shared:
+                    input_path = job["input_path"]
+                else:
+                    get_file(uuid, job.get("input_url"))
+                    input_path = None
+
+                # Transcode the file, the whole upload for a segment
+                transcode_file(uuid, input_path, source_duration(job))
+                audio_cache.put(source, wav_path)
+
+            # Transcribe only the segment of a split job
+            if job.get("parent_uuid"):
+                cut_segment(uuid, job["segment_start"], job["duration"])
+
+            # Pick the model from the spoken language on a short sample
+            if language == "auto":
+                language = detect_language(uuid)
+                if language != "auto":
+                    put_detected_language(uuid, language)
+
+            model = job_model(job, language)
+            logger.info(f"  Model: {model}")
 
-            # Transcribe the file
-            transcribe_file(uuid, language, model, output_format)
+            # Transcribe the file, the model is not evicted meanwhile
+            try:
+                transcribe_file(uuid, language, model, output_format, job["duration"])
+            finally:
+                model_cache.release(model)
 
             # Postprocess subtitles
-            # postprocess_srt(uuid, output_format)
-
-            # Upload the resulting SRT
-            put_file(f"{uuid}", output_format)
+            postprocess_srt(uuid, output_format)
+
+            # Upload the resulting SRT, keeping it for a later upload if
+            # the broker can not be reached
+            try:
+                if shared:
+                    put_file_shared(uuid, output_format, job["output_dir"])
+                else:
+                    put_file(f"{uuid}", output_format, job.get("output_url"))
+            except requests.RequestException as e:
+                logger.error(f"[{worker_id}] Error uploading result of {uuid}: {e}")
+                keep_result(uuid, output_format)
+                delete_files(uuid)
+                continue
 
             # Remove all files
             delete_files(uuid)
 
             logger.info(f"[{worker_id}] Job {uuid} completed successfully.")
+        except JobCancelled:
+            logger.info(f"[{worker_id}] Job {uuid} cancelled.")
+            cancelled.discard(uuid)
+            delete_files(uuid)
+            continue
         except requests.exceptions.ConnectionError as e:
             logger.error(f"[{worker_id}] Connection error: {e}")
             continue
@@ -336,10 +925,14 @@ def main(worker_id: int):
             logger.error(f"[{worker_id}] HTTP error: {e}")
             continue
         except Exception as e:
-            put_status(uuid, JobStatusEnum.FAILED, error=str(e))
+            put_status(
+                uuid, JobStatusEnum.FAILED, error=str(e), error_class=error_class(e)
+            )
             logger.error(f"[{worker_id}] Error processing job {uuid}: {e}")
             traceback.print_exc()
             continue
+        finally:
+            done.set()
 
 
 if __name__ == "__main__":
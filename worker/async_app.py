@@ -0,0 +1,602 @@
+import asyncio
+import httpx
+import json
+import logging
+import os
+import signal
+import subprocess
+import websockets
+
+from app import (
+    JobStatusEnum,
+    api_file_storage_dir,
+    api_url,
+    audio_cache,
+    delete_files,
+    detect_language_command,
+    error_class,
+    job_model,
+    keep_result,
+    logger,
+    model_cache,
+    move_file,
+    outbox_result,
+    parse_language,
+    postprocess_srt,
+    real_time_factors,
+    sample_command,
+    segment_command,
+    segment_path,
+    source_duration,
+    transcode_command,
+    transcribe_command,
+    upload_outbox,
+    use_shared_storage,
+)
+from async_client import create_client, download, request
+from client import WORKER_NAME, backoff
+from collections import deque
+from pathlib import Path
+from random import randint
+from settings import get_settings
+from typing import Optional
+from watchdog import Watchdog, WatchdogError, kill_group
+
+settings = get_settings()
+
+# Lines of process output kept for error messages
+OUTPUT_LINES = 200
+
+# Longest line read from a process
+OUTPUT_LINE_LIMIT = 1024 * 1024
+
+
+class AsyncWorker:
+    """
+    Worker running many jobs on one event loop. Downloads, uploads and
+    heartbeats of all jobs share one HTTP client, while semaphores limit
+    the number of ffmpeg and whisper.cpp processes using the CPU.
+    """
+
+    def __init__(self) -> None:
+        self.client = create_client()
+        self.job_slots = asyncio.Semaphore(settings.ASYNC_JOBS)
+        self.transcode_slots = asyncio.Semaphore(settings.TRANSCODE_SLOTS)
+        self.transcribe_slots = asyncio.Semaphore(settings.TRANSCRIBE_SLOTS)
+        self.stopping = asyncio.Event()
+        self.jobs: dict[str, asyncio.Task] = {}
+        self.cancelled: set[str] = set()
+        self.name = WORKER_NAME
+        self.warm: deque[tuple[str, str]] = deque(maxlen=settings.WARM_MODELS)
+        self.status_changed = asyncio.Event()
+
+    async def run_command(
+        self, command: list, name: str, stage: str, duration: Optional[float]
+    ) -> str:
+        """
+        Run a command, streaming its output to the debug log. The process
+        is killed if the job is cancelled.
+
+        A watchdog kills the command if it runs past the time limit of the
+        stage on audio of the given duration, stops making progress or uses
+        too much memory, and WatchdogError is raised with the reason.
+        """
+        logger.debug(f"[{name}] Command: {' '.join(command)}")
+
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=OUTPUT_LINE_LIMIT,
+            start_new_session=True,
+        )
+        output = deque(maxlen=OUTPUT_LINES)
+
+        async def read(stream: asyncio.StreamReader) -> None:
+            async for line in stream:
+                text = line.decode(errors="replace").rstrip()
+                output.append(text)
+                logger.debug(f"[{name}] {text}")
+
+        watchdog = Watchdog(
+            process.pid, stage, real_time_factors.timeout(stage, duration)
+        )
+
+        async def watch() -> None:
+            while not watchdog.check():
+                await asyncio.sleep(settings.WATCHDOG_INTERVAL)
+
+            logger.error(f"[{name}] Killing {command[0]}: {watchdog.error}")
+            kill_group(process.pid)
+
+        watcher = asyncio.create_task(watch())
+
+        try:
+            await asyncio.gather(read(process.stdout), read(process.stderr))
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+            raise
+        finally:
+            watcher.cancel()
+
+        if watchdog.error:
+            raise watchdog.error
+        if returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode, command, output="\n".join(output)
+            )
+
+        real_time_factors.update(stage, watchdog.elapsed(), duration)
+
+        return "\n".join(output)
+
+    async def get_next_job(self) -> dict:
+        """
+        Claim the next job from the API broker.
+        """
+        response = await request(self.client, "GET", f"{api_url}/next", retry=False)
+        job = response.json()["result"]
+
+        if job and job["status"] != JobStatusEnum.IN_PROGRESS:
+            logger.info(f"Job {job['uuid']} is not in_progress. Skipping.")
+            return {}
+
+        return job
+
+    async def put_status(
+        self,
+        uuid: str,
+        status: JobStatusEnum,
+        error: Optional[str] = None,
+        error_class: Optional[str] = None,
+    ) -> bool:
+        """
+        Update the job status in the API broker.
+        """
+        try:
+            await request(
+                self.client,
+                "PUT",
+                f"{api_url}/{uuid}",
+                json={
+                    "status": status.value,
+                    "error": error,
+                    "error_class": error_class,
+                },
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Error updating job status: {e}")
+            return False
+        return True
+
+    async def put_detected_language(self, uuid: str, language: str) -> bool:
+        """
+        Save the detected language on the job in the API broker.
+        """
+        try:
+            await request(
+                self.client,
+                "PUT",
+                f"{api_url}/{uuid}",
+                json={"detected_language": language},
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Error updating detected language: {e}")
+            return False
+        return True
+
+    async def put_file(
+        self,
+        uuid: str,
+        output_format: str,
+        url: Optional[str] = None,
+        file_path: Optional[Path] = None,
+    ) -> None:
+        """
+        Upload the result to the API broker, or directly to the storage
+        backend if the broker handed out a presigned URL.
+        """
+        filename = f"{uuid}.{output_format}"
+        file_path = file_path or Path(api_file_storage_dir) / filename
+        content = await asyncio.to_thread(file_path.read_bytes)
+
+        if not url:
+            await request(
+                self.client,
+                "PUT",
+                f"{api_url}/{uuid}/result",
+                files={"file": (filename, content)},
+            )
+            return
+
+        await request(self.client, "PUT", url, content=content)
+        await self.put_result_stored(uuid, filename)
+
+    async def put_result_stored(self, uuid: str, filename: str) -> None:
+        """
+        Report a result written directly to the broker storage as completed.
+        """
+        await request(
+            self.client,
+            "PUT",
+            f"{api_url}/{uuid}/result/shared",
+            json={"filename": filename},
+        )
+
+    async def heartbeat(self, uuid: str) -> None:
+        """
+        Tell the broker the job is still being processed until cancelled,
+        and stop the job if the broker says it was cancelled.
+        """
+        while True:
+            await asyncio.sleep(settings.HEARTBEAT_INTERVAL)
+
+            try:
+                response = await request(
+                    self.client, "PUT", f"{api_url}/{uuid}/heartbeat"
+                )
+            except httpx.HTTPError as e:
+                logger.error(f"Error sending heartbeat for {uuid}: {e}")
+                continue
+
+            if response.json()["result"].get("cancel"):
+                self.cancel(uuid)
+
+    async def detect_language(self, uuid: str) -> str:
+        """
+        Detect the spoken language on a short sample with the tiny model.
+        """
+        try:
+            async with self.transcode_slots:
+                await self.run_command(
+                    sample_command(uuid),
+                    uuid,
+                    "sample",
+                    settings.DETECT_LANGUAGE_SECONDS,
+                )
+
+            async with self.transcribe_slots:
+                output = await self.run_command(
+                    detect_language_command(uuid),
+                    uuid,
+                    "detect",
+                    settings.DETECT_LANGUAGE_SECONDS,
+                )
+        except (subprocess.CalledProcessError, WatchdogError) as e:
+            logger.error(f"Error during language detection: {e}")
+            return "auto"
+
+        return parse_language(uuid, output)
+
+    async def transcribe(self, job: dict) -> None:
+        """
+        Download, transcode, transcribe and upload the result of a job.
+        """
+        uuid = job["uuid"]
+        language = job["language"]
+        model_type = job["model_type"]
+        output_format = job["output_format"]
+
+        logger.info(f"Processing job {uuid}:")
+        logger.info(f"  Language: {language}")
+        logger.info(f"  Model Type: {model_type}")
+        logger.info(f"  Output Format: {output_format}")
+
+        # The job was transcribed before but the upload failed
+        if kept := outbox_result(uuid, output_format):
+            await self.put_file(uuid, output_format, file_path=kept)
+            kept.unlink()
+            logger.info(f"Job {uuid} completed from kept result.")
+            return
+
+        shared = use_shared_storage(job)
+        wav_path = Path(api_file_storage_dir) / f"{uuid}.wav"
+
+        # Segments of a split job share the upload of the job
+        source = job.get("parent_uuid") or uuid
+
+        # Reuse the audio transcoded by an earlier run on the same upload
+        if await asyncio.to_thread(audio_cache.get, source, wav_path):
+            logger.info(f"Using cached audio for {uuid}")
+        else:
+            # Read the file in place if the broker storage is mounted,
+            # otherwise download it
+            if shared:
+                input_path = job["input_path"]
+            else:
+                url = job.get("input_url") or f"{api_url}/{uuid}/file"
+                await download(self.client, url, Path(api_file_storage_dir) / uuid)
+                input_path = None
+
+            # The whole upload is transcoded for a segment
+            async with self.transcode_slots:
+                await self.run_command(
+                    transcode_command(uuid, input_path),
+                    uuid,
+                    "transcode",
+                    source_duration(job),
+                )
+            logger.info(f"Transcoding completed: {uuid}.wav")
+
+            await asyncio.to_thread(audio_cache.put, source, wav_path)
+
+        # Transcribe only the segment of a split job
+        if job.get("parent_uuid"):
+            command = segment_command(uuid, job["segment_start"], job["duration"])
+            async with self.transcode_slots:
+                await self.run_command(command, uuid, "segment", job["duration"])
+            os.replace(segment_path(uuid), wav_path)
+            logger.info(f"Cut segment at {job['segment_start']:.0f} seconds: {uuid}")
+
+        # Pick the model from the spoken language on a short sample
+        if language == "auto":
+            language = await self.detect_language(uuid)
+            if language != "auto":
+                await self.put_detected_language(uuid, language)
+
+        model = await asyncio.to_thread(job_model, job, language)
+        logger.info(f"  Model: {model}")
+
+        # Tell the broker which models are warm, keyed like the jobs using them
+        warm = (job["language"], model_type)
+        if warm in self.warm:
+            self.warm.remove(warm)
+        self.warm.append(warm)
+
+        # The model is not evicted from the cache while it is used
+        try:
+            async with self.transcribe_slots:
+                await self.run_command(
+                    transcribe_command(uuid, language, model, output_format),
+                    uuid,
+                    f"transcribe:{model}",
+                    job["duration"],
+                )
+        finally:
+            model_cache.release(model)
+        logger.info(f"Transcription completed: {uuid}")
+
+        await asyncio.to_thread(postprocess_srt, uuid, output_format)
+
+        # Upload the result, keeping it for a later upload if the broker
+        # can not be reached
+        filename = f"{uuid}.{output_format}"
+        try:
+            if shared:
+                await asyncio.to_thread(
+                    move_file,
+                    Path(api_file_storage_dir) / filename,
+                    Path(job["output_dir"]) / filename,
+                )
+                await self.put_result_stored(uuid, filename)
+            else:
+                await self.put_file(uuid, output_format, job.get("output_url"))
+        except httpx.HTTPError as e:
+            logger.error(f"Error uploading result of {uuid}: {e}")
+            keep_result(uuid, output_format)
+            return
+
+        logger.info(f"Job {uuid} completed successfully.")
+
+    def cancel(self, uuid: str) -> None:
+        """
+        Stop a job cancelled on the broker, killing its running process.
+        """
+        if (task := self.jobs.get(uuid)) and uuid not in self.cancelled:
+            logger.info(f"Job {uuid} was cancelled, stopping it.")
+            self.cancelled.add(uuid)
+            task.cancel()
+
+    async def process(self, job: dict) -> None:
+        """
+        Process a job with heartbeats. A job cancelled by a shutdown is
+        given back to the broker so another worker picks it up.
+        """
+        uuid = job["uuid"]
+        heartbeat = asyncio.create_task(self.heartbeat(uuid))
+
+        try:
+            await self.transcribe(job)
+        except asyncio.CancelledError:
+            if uuid in self.cancelled:
+                logger.info(f"Job {uuid} cancelled.")
+                return
+
+            logger.info(f"Job {uuid} interrupted, returning it to the queue.")
+            await self.put_status(uuid, JobStatusEnum.PENDING)
+            raise
+        except httpx.HTTPError as e:
+            logger.error(f"HTTP error processing job {uuid}: {e}")
+        except Exception as e:
+            logger.error(f"Error processing job {uuid}: {e}")
+            await self.put_status(
+                uuid, JobStatusEnum.FAILED, error=str(e), error_class=error_class(e)
+            )
+        finally:
+            heartbeat.cancel()
+            self.cancelled.discard(uuid)
+            delete_files(uuid)
+
+    def start(self, job: dict) -> None:
+        """
+        Run a job in the background, it holds a job slot until done.
+        """
+        task = asyncio.create_task(self.process(job))
+        self.jobs[job["uuid"]] = task
+
+        def done(_: asyncio.Task) -> None:
+            self.jobs.pop(job["uuid"], None)
+            self.job_slots.release()
+            self.status_changed.set()
+
+        task.add_done_callback(done)
+
+    async def sleep(self, seconds: float) -> None:
+        """
+        Sleep, waking up early when shutting down.
+        """
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except TimeoutError:
+            pass
+
+    async def claim(self) -> dict:
+        """
+        Claim a job. If the claim is interrupted by a shutdown after the
+        broker handed out a job, the job is given back.
+        """
+        claim = asyncio.ensure_future(self.get_next_job())
+
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            try:
+                if job := await claim:
+                    await self.put_status(job["uuid"], JobStatusEnum.PENDING)
+            except httpx.HTTPError:
+                pass
+            raise
+
+    async def poll(self) -> None:
+        """
+        Claim jobs from the broker while there are free job slots.
+        """
+        while not self.stopping.is_set():
+            await self.job_slots.acquire()
+
+            job = {}
+            try:
+                await asyncio.to_thread(upload_outbox)
+                job = await self.claim()
+            except httpx.HTTPError as e:
+                logger.error(f"Error getting next job: {e}")
+            except Exception:
+                self.job_slots.release()
+                raise
+
+            if job:
+                self.start(job)
+                continue
+
+            self.job_slots.release()
+            await self.sleep(randint(5, 10))
+
+    def status(self) -> dict:
+        """
+        Describe the free job slots and warm models for the broker.
+        """
+        return {
+            "type": "status",
+            "name": self.name,
+            "free": settings.ASYNC_JOBS - len(self.jobs),
+            "warm": [list(warm) for warm in self.warm],
+        }
+
+    async def send_status(self, socket: websockets.ClientConnection) -> None:
+        """
+        Send the status to the broker when connected and whenever it changes.
+        """
+        while True:
+            self.status_changed.clear()
+            await socket.send(json.dumps(self.status()))
+            await self.status_changed.wait()
+
+    async def receive_jobs(self, socket: websockets.ClientConnection) -> None:
+        """
+        Start the jobs pushed by the broker and stop the jobs it cancels.
+        A job is refused if all job slots are taken, so the broker gives
+        it to another worker.
+        """
+        async for message in socket:
+            data = json.loads(message)
+            if data.get("type") == "cancel":
+                for uuid in data.get("uuids", []):
+                    self.cancel(uuid)
+                continue
+            if data.get("type") != "job":
+                continue
+
+            job = data["job"]
+            if self.stopping.is_set() or self.job_slots.locked():
+                await socket.send(json.dumps({"type": "nack", "uuid": job["uuid"]}))
+                continue
+
+            await self.job_slots.acquire()
+            try:
+                await socket.send(json.dumps({"type": "ack", "uuid": job["uuid"]}))
+            except Exception:
+                self.job_slots.release()
+                raise
+
+            self.start(job)
+
+    async def push(self) -> None:
+        """
+        Keep a WebSocket connection to the broker and run the jobs it
+        pushes, instead of polling for jobs.
+        """
+        url = "ws" + api_url.removeprefix("http") + "/dispatch"
+        attempt = 0
+
+        while not self.stopping.is_set():
+            try:
+                async with websockets.connect(
+                    url, open_timeout=settings.HTTP_CONNECT_TIMEOUT
+                ) as socket:
+                    logger.info(f"Connected to {url}, waiting for jobs.")
+                    attempt = 0
+
+                    await asyncio.to_thread(upload_outbox)
+                    sender = asyncio.create_task(self.send_status(socket))
+                    try:
+                        await self.receive_jobs(socket)
+                    finally:
+                        sender.cancel()
+            except (OSError, websockets.WebSocketException) as e:
+                logger.error(f"Error in connection to broker: {e}")
+
+            await self.sleep(backoff(attempt))
+            attempt += 1
+
+    async def run(self) -> None:
+        """
+        Run until SIGTERM or SIGINT, then let running jobs finish for up
+        to SHUTDOWN_GRACE seconds and give the others back to the broker.
+        """
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stopping.set)
+
+        logger.info(
+            f"Starting transcription service with {settings.ASYNC_JOBS} job slots, "
+            f"server URL: {api_url}, dispatch mode: {settings.DISPATCH_MODE}"
+        )
+
+        if settings.DISPATCH_MODE == "push":
+            poller = asyncio.create_task(self.push())
+        else:
+            poller = asyncio.create_task(self.poll())
+        await self.stopping.wait()
+
+        logger.info("Stopping transcription service.")
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+
+        if jobs := list(self.jobs.values()):
+            _, pending = await asyncio.wait(jobs, timeout=settings.SHUTDOWN_GRACE)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        await self.client.aclose()
+        logger.info("Transcription service stopped.")
+
+
+if __name__ == "__main__":
+    if settings.DEBUG:
+        logger.setLevel(logging.DEBUG)
+        logger.debug("Debug mode is enabled.")
+
+    asyncio.run(AsyncWorker().run())
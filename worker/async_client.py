@@ -0,0 +1,115 @@
+import asyncio
+import httpx
+
+from client import (
+    DOWNLOAD_CHUNK_SIZE,
+    IDEMPOTENT_METHODS,
+    RETRY_STATUSES,
+    WORKER_NAME,
+    backoff,
+)
+from pathlib import Path
+from settings import get_settings
+from typing import Optional
+
+settings = get_settings()
+
+
+def create_client() -> httpx.AsyncClient:
+    """
+    Create the client shared by all jobs of the worker process, keeping
+    connections to the broker alive between requests.
+    """
+    return httpx.AsyncClient(
+        headers={"X-Worker": WORKER_NAME},
+        timeout=httpx.Timeout(
+            settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT
+        ),
+        limits=httpx.Limits(
+            max_connections=settings.ASYNC_JOBS * 2,
+            max_keepalive_connections=settings.ASYNC_JOBS,
+        ),
+    )
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Get the delay requested by a Retry-After header in seconds.
+    """
+    try:
+        delay = float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+    return min(delay, settings.HTTP_BACKOFF_MAX)
+
+
+async def request(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    retry: Optional[bool] = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Send a request and raise on error responses.
+
+    Idempotent requests are retried with exponential backoff and jitter
+    on transport errors and on busy responses, the same way as the
+    session from client.create_session().
+    """
+    if retry is None:
+        retry = method in IDEMPOTENT_METHODS
+
+    attempts = settings.HTTP_RETRIES + 1 if retry else 1
+
+    for attempt in range(attempts):
+        delay = None
+
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == attempts - 1:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                response.raise_for_status()
+                return response
+
+            delay = retry_after(response)
+
+        await asyncio.sleep(delay if delay is not None else backoff(attempt))
+
+
+async def download(client: httpx.AsyncClient, url: str, file_path: Path) -> None:
+    """
+    Download a file, resuming with a Range request from where a broken
+    transfer stopped instead of starting over.
+    """
+    file_path.unlink(missing_ok=True)
+
+    for attempt in range(settings.HTTP_RETRIES + 1):
+        offset = file_path.stat().st_size if file_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        try:
+            async with client.stream("GET", url, headers=headers) as response:
+                # The whole file is already there
+                if response.status_code == 416:
+                    return
+
+                response.raise_for_status()
+
+                # Servers without Range support send everything again
+                mode = "ab" if response.status_code == 206 else "wb"
+
+                with open(file_path, mode) as fd:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(fd.write, chunk)
+
+            return
+        except httpx.TransportError:
+            if attempt == settings.HTTP_RETRIES:
+                raise
+
+            await asyncio.sleep(backoff(attempt))
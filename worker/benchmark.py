@@ -0,0 +1,196 @@
+import argparse
+import re
+import sys
+import time
+import wave
+
+from app import (
+    api_file_storage_dir,
+    model_cache,
+    models_url,
+    run_command,
+    session,
+    transcode_command,
+    transcribe_command,
+)
+from client import download
+from pathlib import Path
+from typing import Iterator, Optional
+
+# Audio files of the corpus, each with its reference transcript as .txt
+AUDIO_SUFFIXES = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus")
+
+WORD_RE = re.compile(r"\w+(?:'\w+)*")
+
+
+def words(text: str) -> list[str]:
+    """
+    Split a transcript into lowercase words without punctuation.
+    """
+    return WORD_RE.findall(text.lower())
+
+
+def word_errors(reference: list[str], hypothesis: list[str]) -> int:
+    """
+    Count the substituted, deleted and inserted words of a hypothesis,
+    the word-level edit distance to the reference.
+    """
+    previous = list(range(len(hypothesis) + 1))
+
+    for i, word in enumerate(reference, 1):
+        current = [i]
+        for j, other in enumerate(hypothesis, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (word != other),
+                )
+            )
+        previous = current
+
+    return previous[-1]
+
+
+def corpus_files(corpus: Path, language: str) -> Iterator[tuple[str, Path, Path]]:
+    """
+    Get the (language, audio, reference) files of the corpus a model of
+    the language is measured on, every language for a model of any
+    language. The corpus has a directory per language, e.g.
+    sv/interview.wav with the reference transcript sv/interview.txt.
+    """
+    if language:
+        directories = [corpus / language]
+    else:
+        directories = sorted(path for path in corpus.iterdir() if path.is_dir())
+
+    for directory in directories:
+        if not directory.is_dir():
+            continue
+
+        for audio in sorted(directory.iterdir()):
+            reference = audio.with_suffix(".txt")
+            if audio.suffix.lower() in AUDIO_SUFFIXES and reference.exists():
+                yield directory.name, audio, reference
+
+
+def wav_duration(path: Path) -> float:
+    """
+    Get the duration of a WAV file in seconds.
+    """
+    with wave.open(str(path)) as fd:
+        return fd.getnframes() / fd.getframerate()
+
+
+def benchmark_model(model: dict, corpus: Path) -> Optional[dict]:
+    """
+    Transcribe the corpus with a model from the registry like a job,
+    loading the model for every file, and measure the real-time factor
+    of the transcription and the word error rate over the corpus.
+    Returns None if the corpus has no files for the model.
+    """
+    url = f"{models_url}/{model['sha256']}/file"
+    model_path = str(model_cache.get(model, lambda path: download(session, url, path)))
+    storage = Path(api_file_storage_dir)
+
+    seconds = 0.0
+    audio_seconds = 0.0
+    errors = 0
+    reference_words = 0
+
+    for n, (language, audio, reference) in enumerate(
+        corpus_files(corpus, model["language"])
+    ):
+        filename = f"benchmark-{n}"
+
+        try:
+            run_command(
+                transcode_command(filename, str(audio)), filename, "transcode", None
+            )
+            duration = wav_duration(storage / f"{filename}.wav")
+
+            started = time.monotonic()
+            run_command(
+                transcribe_command(filename, language, model_path, "txt"),
+                filename,
+                f"transcribe:{model_path}",
+                duration,
+            )
+            seconds += time.monotonic() - started
+            audio_seconds += duration
+
+            expected = words(reference.read_text(encoding="utf-8"))
+            result = words((storage / f"{filename}.txt").read_text(encoding="utf-8"))
+            errors += word_errors(expected, result)
+            reference_words += len(expected)
+        finally:
+            for path in storage.glob(f"{filename}.*"):
+                path.unlink()
+
+    model_cache.release(model_path)
+
+    if not audio_seconds:
+        return None
+
+    return {
+        "rtf": seconds / audio_seconds,
+        "wer": errors / max(reference_words, 1),
+        "audio_seconds": audio_seconds,
+    }
+
+
+def benchmark(corpus: Path, names: list[str], report: bool) -> None:
+    """
+    Benchmark the models of the registry, or the named ones, on this
+    machine and report the results to the broker, which chooses the
+    model of jobs with a latency target by them.
+    """
+    response = session.get(models_url)
+    response.raise_for_status()
+    models = response.json()["result"]["models"]
+
+    if names:
+        models = [model for model in models if model["name"] in names]
+
+    print(f"{'Model':<32} {'Quantization':<12} {'RTF':>8} {'WER':>8} {'Audio':>8}")
+
+    for model in models:
+        if not (result := benchmark_model(model, corpus)):
+            print(f"{model['name']:<32} no audio for {model['language'] or 'any'}")
+            continue
+
+        print(
+            f"{model['name']:<32} {model['quantization'] or '-':<12} "
+            f"{result['rtf']:>8.3f} {result['wer']:>8.1%} "
+            f"{result['audio_seconds']:>7.0f}s"
+        )
+
+        if report:
+            response = session.put(
+                f"{models_url}/{model['name']}/benchmark", json=result
+            )
+            response.raise_for_status()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the speed and accuracy of the registry models."
+    )
+    parser.add_argument(
+        "corpus",
+        help="directory per language of audio files with .txt reference transcripts",
+    )
+    parser.add_argument(
+        "--models", nargs="+", metavar="NAME", help="only benchmark these models"
+    )
+    parser.add_argument(
+        "--no-report",
+        action="store_true",
+        help="print the results without reporting them to the broker",
+    )
+    args = parser.parse_args()
+
+    if not Path(args.corpus).is_dir():
+        sys.exit(f"No corpus directory {args.corpus}")
+
+    benchmark(Path(args.corpus), args.models or [], not args.no_report)
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import shutil
+import threading
+
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Container, Union
+
+# Bytes read at a time when computing checksums
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def link_or_copy(source: Path, destination: Path) -> None:
+    """
+    Hard link a file, or copy it if the paths are on different file
+    systems. The destination is replaced atomically.
+    """
+    tmp_path = destination.with_name(f"{destination.name}.part")
+    tmp_path.unlink(missing_ok=True)
+
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+
+    os.replace(tmp_path, destination)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as fd:
+        while chunk := fd.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def evict_files(
+    directory: Path, pattern: str, max_bytes: int, keep: Container[Path] = ()
+) -> None:
+    """
+    Delete the least recently used files matching the pattern until the
+    files fit in max_bytes, except the files to keep.
+    """
+    files = []
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+class AudioCache:
+    """
+    Keep the 16 kHz mono audio transcoded for a job, so later runs on the
+    same upload, e.g. the large model after a quick look with the tiny
+    one, skip the download and the transcoding.
+
+    The modification time of a cached file is its last use. The least
+    recently used files are evicted when the cache grows over max_bytes,
+    a budget of 0 disables the cache.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path(self, uuid: str) -> Path:
+        return self.directory / f"{uuid}.wav"
+
+    def get(self, uuid: str, destination: Path) -> bool:
+        """
+        Put the cached audio of a job at the destination. Returns False
+        if it is not cached.
+        """
+        with self.lock:
+            path = self.path(uuid)
+
+            try:
+                os.utime(path)
+                link_or_copy(path, destination)
+            except FileNotFoundError:
+                return False
+
+        return True
+
+    def put(self, uuid: str, source: Path) -> None:
+        """
+        Cache the audio of a job and evict the least recently used audio
+        over the budget.
+        """
+        if source.stat().st_size > self.max_bytes:
+            return
+
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            link_or_copy(source, self.path(uuid))
+            os.utime(self.path(uuid))
+            self.evict()
+
+    def evict(self) -> None:
+        evict_files(self.directory, "*.wav", self.max_bytes)
+
+
+class ModelCache:
+    """
+    Keep the model files downloaded from the broker registry, named by
+    their checksum. A model is downloaded the first time a job needs it
+    and is used only if its size and checksum match the registry.
+
+    The least recently used models are evicted when the cache grows over
+    max_bytes. A model is in use from get() until release(), models in
+    use are never evicted, so the cache can grow over the budget while
+    the jobs running at the same time need more.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.fetching: dict[str, threading.Lock] = {}
+        self.in_use: Counter[Path] = Counter()
+
+    def path(self, sha256: str) -> Path:
+        return self.directory / f"{sha256}.bin"
+
+    def get(self, model: dict, fetch: Callable[[Path], None]) -> Path:
+        """
+        Get the path of a cached model, downloading it with fetch() first
+        if it is not cached, and keep it until it is released. Jobs
+        needing the same model wait for one download. Raises ValueError
+        if the download does not match.
+        """
+        path = self.path(model["sha256"])
+
+        with self.lock:
+            fetching = self.fetching.setdefault(model["sha256"], threading.Lock())
+
+        with fetching:
+            with self.lock:
+                try:
+                    os.utime(path)
+                    self.in_use[path] += 1
+                    return path
+                except FileNotFoundError:
+                    pass
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.part")
+            fetch(tmp_path)
+
+            if (
+                tmp_path.stat().st_size != model["size"]
+                or file_sha256(tmp_path) != model["sha256"]
+            ):
+                tmp_path.unlink(missing_ok=True)
+                raise ValueError(f"Model {model['name']} does not match its checksum")
+
+            with self.lock:
+                os.replace(tmp_path, path)
+                self.in_use[path] += 1
+                evict_files(self.directory, "*.bin", self.max_bytes, keep=self.in_use)
+
+        return path
+
+    def release(self, path: Union[str, Path]) -> None:
+        """
+        Let a model be evicted again once no job uses it. Paths of models
+        outside the cache are ignored.
+        """
+        path = Path(path)
+
+        with self.lock:
+            if path in self.in_use:
+                self.in_use[path] -= 1
+                if not self.in_use[path]:
+                    del self.in_use[path]
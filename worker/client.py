@@ -0,0 +1,124 @@
+import os
+import platform
+import random
+import requests
+
+from pathlib import Path
+from typing import Iterable
+from requests.adapters import HTTPAdapter
+from settings import get_settings
+from time import sleep
+from urllib3.util.retry import Retry
+
+settings = get_settings()
+
+# Requests with these methods can be sent again without changing the result
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"])
+
+# Responses worth retrying, the broker or a proxy in front of it is busy
+RETRY_STATUSES = frozenset([408, 429, 500, 502, 503, 504])
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Name of the worker process, sent to the broker with every request
+WORKER_NAME = f"{platform.node()}-{os.getpid()}"
+
+
+class WorkerSession(requests.Session):
+    """
+    Session with a default timeout for every request.
+    """
+
+    def __init__(self, timeout: tuple[float, float]) -> None:
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def create_session(no_retry_urls: Iterable[str] = ()) -> WorkerSession:
+    """
+    Create a session that keeps connections alive, shared by the worker
+    threads of the process.
+
+    Idempotent requests are retried with exponential backoff and jitter
+    on connection errors and on busy responses. Requests to URLs starting
+    with one of no_retry_urls, e.g. claiming a job, are never retried.
+    """
+    session = WorkerSession(
+        timeout=(settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+    )
+    session.headers["X-Worker"] = WORKER_NAME
+
+    retry = Retry(
+        total=settings.HTTP_RETRIES,
+        backoff_factor=settings.HTTP_BACKOFF_FACTOR,
+        backoff_max=settings.HTTP_BACKOFF_MAX,
+        backoff_jitter=settings.HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+    # Every worker thread and the heartbeat thread of its job keep a
+    # connection open, claiming jobs is only done by the worker threads
+    adapter = HTTPAdapter(pool_maxsize=2 * settings.WORKERS, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    no_retry_adapter = HTTPAdapter(pool_maxsize=settings.WORKERS, max_retries=0)
+    for url in no_retry_urls:
+        session.mount(url, no_retry_adapter)
+
+    return session
+
+
+def backoff(attempt: int) -> float:
+    """
+    Get the time to wait before the given retry attempt, growing
+    exponentially with full jitter.
+    """
+    delay = min(settings.HTTP_BACKOFF_MAX, settings.HTTP_BACKOFF_FACTOR * 2**attempt)
+
+    return random.uniform(0, delay)
+
+
+def download(session: requests.Session, url: str, file_path: Path) -> None:
+    """
+    Download a file, resuming with a Range request from where a broken
+    transfer stopped instead of starting over.
+    """
+    file_path.unlink(missing_ok=True)
+
+    for attempt in range(settings.HTTP_RETRIES + 1):
+        offset = file_path.stat().st_size if file_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        try:
+            with session.get(url, headers=headers, stream=True) as response:
+                # The whole file is already there
+                if response.status_code == 416:
+                    return
+
+                response.raise_for_status()
+
+                # Servers without Range support send everything again
+                mode = "ab" if response.status_code == 206 else "wb"
+
+                with open(file_path, mode) as fd:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        fd.write(chunk)
+
+            return
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.Timeout,
+        ):
+            if attempt == settings.HTTP_RETRIES:
+                raise
+
+            sleep(backoff(attempt))
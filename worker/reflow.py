@@ -0,0 +1,315 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+TIMESTAMP_RE = re.compile(r"^\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*$")
+
+# Characters a line preferably ends with when a cue is split over lines
+BREAK_AFTER = (",", ".", "?", "!", ":", ";")
+
+# Maximum number of characters per line
+MAX_LINE_LENGTH = 42
+
+# Maximum number of lines per cue, longer cues are split
+MAX_LINES = 2
+
+# Reading speed used for the minimum display time of a cue
+WORDS_PER_MINUTE = 170
+
+# Minimum display time, to avoid flickering subtitles
+MIN_DURATION_MS = 1500
+
+# Show subtitles before the speech starts and keep them after it ends
+LEAD_IN_MS = 500
+LEAD_OUT_MS = 1000
+
+# Minimum gap between two cues
+MIN_GAP_MS = 80
+
+
+def parse_timestamp(value: str) -> Optional[int]:
+    """
+    Parse an SRT timestamp (HH:MM:SS,mmm) into milliseconds.
+    Returns None if the timestamp is invalid.
+    """
+    if not (match := TIMESTAMP_RE.match(value)):
+        return None
+
+    hours, minutes, seconds, milliseconds = match.groups()
+
+    total_seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+    return total_seconds * 1000 + int(milliseconds.ljust(3, "0"))
+
+
+def format_timestamp(ms: int) -> str:
+    """
+    Format milliseconds as an SRT timestamp (HH:MM:SS,mmm).
+    """
+    seconds, ms = divmod(max(ms, 0), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def parse_srt(content: str) -> Iterator[tuple[int, int, str]]:
+    """
+    Parse SRT content into (start_ms, end_ms, text) cues in a single pass.
+    """
+    start_ms = end_ms = None
+    text_lines = []
+
+    def close_cue(next_cue: bool) -> str:
+        while text_lines and not text_lines[-1].strip():
+            text_lines.pop()
+
+        # The last line before the next timing line is that cue's index
+        if next_cue and text_lines and text_lines[-1].strip().isdigit():
+            text_lines.pop()
+
+        return " ".join(line.strip() for line in text_lines if line.strip())
+
+    for line in content.lstrip("\ufeff").splitlines():
+        if "-->" in line:
+            start, _, end = line.partition("-->")
+            new_start = parse_timestamp(start)
+            new_end = parse_timestamp(end.split()[0] if end.split() else "")
+
+            if new_start is not None and new_end is not None:
+                if start_ms is not None:
+                    yield start_ms, end_ms, close_cue(next_cue=True)
+
+                start_ms, end_ms = new_start, new_end
+                text_lines = []
+                continue
+
+        if start_ms is not None:
+            text_lines.append(line)
+
+    if start_ms is not None:
+        yield start_ms, end_ms, close_cue(next_cue=False)
+
+
+def render_srt(cues: Iterable[tuple[int, int, list[str]]]) -> str:
+    """
+    Render (start_ms, end_ms, lines) cues as SRT content.
+    """
+    return "".join(
+        f"{index}\n{format_timestamp(start_ms)} --> {format_timestamp(end_ms)}\n"
+        + "\n".join(lines)
+        + "\n\n"
+        for index, (start_ms, end_ms, lines) in enumerate(cues, start=1)
+    )
+
+
+def wrap_words(words: list[str], max_length: int) -> list[list[str]]:
+    """
+    Greedily wrap words into lines of at most max_length characters.
+    Words are never broken, so a single long word gets a line of its own.
+    """
+    lines = []
+    line = []
+    length = -1
+
+    for word in words:
+        if line and length + 1 + len(word) > max_length:
+            lines.append(line)
+            line = []
+            length = -1
+
+        line.append(word)
+        length += 1 + len(word)
+
+    if line:
+        lines.append(line)
+
+    return lines
+
+
+def balance_lines(words: list[str], max_length: int) -> list[str]:
+    """
+    Split words over two lines of similar length, preferring a break
+    after punctuation. Falls back to one line if no split fits.
+    """
+    total = sum(len(word) for word in words) + len(words) - 1
+    if total <= max_length or len(words) < 2:
+        return [" ".join(words)]
+
+    best = None
+    best_cost = None
+    first = -1
+
+    for index, word in enumerate(words[:-1]):
+        first += 1 + len(word)
+        second = total - first - 1
+        if first > max_length or second > max_length:
+            continue
+
+        cost = abs(first - second)
+        if word.endswith(BREAK_AFTER):
+            cost -= max_length // 4
+
+        if best_cost is None or cost < best_cost:
+            best = index + 1
+            best_cost = cost
+
+    if best is None:
+        return [" ".join(line) for line in wrap_words(words, max_length)]
+
+    return [" ".join(words[:best]), " ".join(words[best:])]
+
+
+def split_cue(
+    start_ms: int,
+    end_ms: int,
+    text: str,
+    max_length: int = MAX_LINE_LENGTH,
+    max_lines: int = MAX_LINES,
+) -> Iterator[tuple[int, int, list[str]]]:
+    """
+    Wrap the text of a cue at word boundaries. Text that does not fit in
+    max_lines lines is split into several cues, dividing the time of
+    the cue by the number of characters in each part.
+    """
+    words = text.split()
+    if not words:
+        return
+
+    lines = wrap_words(words, max_length)
+    if len(lines) <= max_lines:
+        yield start_ms, end_ms, balance_lines(words, max_length)
+        return
+
+    groups = [
+        [word for line in lines[index : index + max_lines] for word in line]
+        for index in range(0, len(lines), max_lines)
+    ]
+    total = sum(len(word) + 1 for word in words)
+    duration = max(end_ms - start_ms, 0)
+    offset = 0
+
+    for group in groups:
+        group_start = start_ms + duration * offset // total
+        offset += sum(len(word) + 1 for word in group)
+        group_end = start_ms + duration * offset // total
+        yield group_start, group_end, balance_lines(group, max_length)
+
+
+def reflow(
+    cues: Iterable[tuple[int, int, str]],
+    max_length: int = MAX_LINE_LENGTH,
+    max_lines: int = MAX_LINES,
+    words_per_minute: int = WORDS_PER_MINUTE,
+    min_duration_ms: int = MIN_DURATION_MS,
+    lead_in_ms: int = LEAD_IN_MS,
+    lead_out_ms: int = LEAD_OUT_MS,
+    min_gap_ms: int = MIN_GAP_MS,
+) -> Iterator[tuple[int, int, list[str]]]:
+    """
+    Reflow (start_ms, end_ms, text) cues in a single pass.
+
+    Lines are wrapped at word boundaries and every cue is shown long
+    enough to be read at the given reading speed, and at least for
+    min_duration_ms. Cues appear lead_in_ms before the speech and stay
+    lead_out_ms after it, as far as possible without overlapping the
+    previous or the next cue. Extra display time is taken after the
+    speech first and before it if the next cue follows closely.
+    """
+    ms_per_word = 60000 / words_per_minute
+    previous_end = -min_gap_ms
+    current = None
+
+    def place(cue: tuple[int, int, list[str]], limit: Optional[int]) -> tuple:
+        nonlocal previous_end
+
+        start_ms, end_ms, lines = cue
+        words = sum(len(line.split()) for line in lines)
+        required = max(min_duration_ms, round(words * ms_per_word))
+        earliest = max(previous_end + min_gap_ms, 0)
+
+        start = max(start_ms - lead_in_ms, earliest)
+        end = max(end_ms + lead_out_ms, start + required)
+        if limit is not None:
+            end = min(end, limit - min_gap_ms)
+
+        start = max(min(start, end - required), earliest)
+        end = max(end, start + 1)
+
+        previous_end = end
+        return start, end, lines
+
+    for start_ms, end_ms, text in cues:
+        for cue in split_cue(start_ms, end_ms, text, max_length, max_lines):
+            if current is not None:
+                yield place(current, cue[0])
+            current = cue
+
+    if current is not None:
+        yield place(current, None)
+
+
+def reflow_srt(content: str, **kwargs) -> str:
+    """
+    Reflow SRT content, see reflow() for the keyword arguments.
+    """
+    return render_srt(reflow(parse_srt(content), **kwargs))
+
+
+def reflow_file(file_path: Path, **kwargs) -> None:
+    """
+    Reflow an SRT file in place.
+    """
+    content = reflow_srt(file_path.read_text(encoding="utf-8-sig"), **kwargs)
+
+    tmp_path = file_path.with_name(f"{file_path.name}.part")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, file_path)
+
+
+def benchmark(count: int) -> None:
+    """
+    Time the reflow of a generated SRT file with the given number of cues.
+    """
+    words = "the quick brown fox jumps over a lazy dog while it rains".split()
+    cues = []
+
+    for index in range(count):
+        start_ms = index * 3000
+        text = " ".join(words[: 3 + index % 9] * (1 + index % 3))
+        cues.append((start_ms, start_ms + 2000 + index % 900, text))
+
+    content = render_srt((start, end, [text]) for start, end, text in cues)
+
+    started = time.perf_counter()
+    result = reflow_srt(content)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"Reflowed {count} cues ({len(content)} bytes) into "
+        f"{result.count(' --> ')} cues in {elapsed * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reflow SRT subtitles.")
+    parser.add_argument("file", nargs="?", help="SRT file to reflow to stdout")
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        metavar="CUES",
+        help="time the reflow of a generated file with this many cues",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.file:
+        sys.stdout.write(reflow_srt(Path(args.file).read_text(encoding="utf-8-sig")))
+    else:
+        parser.print_help()
@@ -17,10 +17,45 @@ class Settings(BaseSettings):
 
     DEBUG: bool = True
     API_BROKER_URL: str = "http://localhost:8000"
-    API_FILE_STORAGE_DIR: str = "/tmp/downloads"
+    API_FILE_STORAGE_DIR: str = "/tmp/worker"
     TRANSCODER_FILE_STORAGE_DIR: str = "/tmp/transcoder"
     API_VERSION: str = "v1"
     WORKERS: int = 2
+    SHARED_STORAGE: bool = False
+    REFLOW_SRT: bool = True
+    DETECT_LANGUAGE_MODEL: str = "models/whisper_tiny.bin"
+    DETECT_LANGUAGE_SECONDS: int = 30
+    HTTP_CONNECT_TIMEOUT: float = 10
+    HTTP_READ_TIMEOUT: float = 120
+    HTTP_RETRIES: int = 5
+    HTTP_BACKOFF_FACTOR: float = 1
+    HTTP_BACKOFF_MAX: float = 60
+    ASYNC_JOBS: int = 8
+    TRANSCODE_SLOTS: int = 2
+    TRANSCRIBE_SLOTS: int = 1
+    HEARTBEAT_INTERVAL: int = 10
+    SHUTDOWN_GRACE: int = 25
+    DISPATCH_MODE: str = "poll"
+    WARM_MODELS: int = 4
+    AUDIO_CACHE_BYTES: int = 10 * 1024**3
+    REFLOW_MAX_LINE_LENGTH: int = 42
+    REFLOW_WORDS_PER_MINUTE: int = 170
+    MODEL_CACHE_DIR: str = "models/cache"
+    MODEL_CACHE_BYTES: int = 16 * 1024**3
+    WATCHDOG_INTERVAL: float = 5
+    WATCHDOG_RTF: dict[str, float] = {
+        "transcode": 0.1,
+        "segment": 0.01,
+        "sample": 0.1,
+        "detect": 1,
+        "transcribe": 1,
+    }
+    WATCHDOG_RTF_WEIGHT: float = 0.2
+    WATCHDOG_MARGIN: float = 3
+    WATCHDOG_MIN_SECONDS: float = 120
+    WATCHDOG_MAX_SECONDS: float = 12 * 3600
+    WATCHDOG_STALL_SECONDS: float = 120
+    WATCHDOG_MAX_RSS_BYTES: int = 0
 
 
 @lru_cache
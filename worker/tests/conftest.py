@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+from pathlib import Path
+
+# The worker modules are run as scripts from the worker directory, and
+# the settings are read on import, so keep the tests in a directory of
+# their own
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+directory = tempfile.mkdtemp(prefix="worker-tests-")
+os.environ.setdefault("API_FILE_STORAGE_DIR", f"{directory}/storage")
+os.environ.setdefault("MODEL_CACHE_DIR", f"{directory}/models")
@@ -0,0 +1,16 @@
+from app import api_file_storage_dir, delete_files
+from pathlib import Path
+
+
+def test_delete_files_leaves_broker_files():
+    storage = Path(api_file_storage_dir)
+    worker_files = ["job", "job.wav", "job.sample.wav", "job.segment.wav", "job.srt"]
+    broker_files = ["job.draft.srt", "job.v2.srt", "job.s20.json", "job.peaks.json"]
+
+    for name in worker_files + broker_files + ["other.wav"]:
+        (storage / name).write_text("")
+
+    delete_files("job")
+
+    remaining = sorted(path.name for path in storage.iterdir() if path.is_file())
+    assert remaining == sorted(broker_files + ["other.wav"])
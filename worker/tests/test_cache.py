@@ -0,0 +1,87 @@
+import hashlib
+import pytest
+
+from cache import ModelCache
+
+
+def model(name: str, size: int = 100) -> tuple[dict, bytes]:
+    """A registry model with the given content size and its content"""
+    content = name.encode().ljust(size, b"\0")
+    sha256 = hashlib.sha256(content).hexdigest()
+    return {"name": name, "sha256": sha256, "size": size}, content
+
+
+def fetcher(content: bytes, fetched: list):
+    def fetch(path):
+        fetched.append(path)
+        path.write_bytes(content)
+
+    return fetch
+
+
+def test_model_cache_downloads_once(tmp_path):
+    cache = ModelCache(tmp_path, 1000)
+    info, content = model("tiny")
+    fetched = []
+
+    first = cache.get(info, fetcher(content, fetched))
+    second = cache.get(info, fetcher(content, fetched))
+
+    assert first == second == tmp_path / f"{info['sha256']}.bin"
+    assert first.read_bytes() == content
+    assert len(fetched) == 1
+
+
+def test_model_cache_rejects_mismatch(tmp_path):
+    cache = ModelCache(tmp_path, 1000)
+    info, _ = model("tiny")
+
+    with pytest.raises(ValueError):
+        cache.get(info, fetcher(b"other", []))
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_model_cache_evicts_released_models(tmp_path):
+    cache = ModelCache(tmp_path, 150)
+    tiny, tiny_content = model("tiny")
+    base, base_content = model("base")
+
+    path = cache.get(tiny, fetcher(tiny_content, []))
+    cache.release(path)
+    cache.get(base, fetcher(base_content, []))
+
+    assert not path.exists()
+
+
+def test_model_cache_keeps_models_in_use(tmp_path):
+    cache = ModelCache(tmp_path, 150)
+    tiny, tiny_content = model("tiny")
+    base, base_content = model("base")
+    large, large_content = model("large")
+
+    # Two jobs use tiny and one uses base, over the budget of one model
+    tiny_path = cache.get(tiny, fetcher(tiny_content, []))
+    cache.get(tiny, fetcher(tiny_content, []))
+    base_path = cache.get(base, fetcher(base_content, []))
+    assert tiny_path.exists() and base_path.exists()
+
+    cache.release(tiny_path)
+    cache.release(base_path)
+    cache.get(large, fetcher(large_content, []))
+
+    # The second job still uses tiny
+    assert tiny_path.exists()
+    assert not base_path.exists()
+
+    cache.release(str(tiny_path))
+    cache.release(tiny_path)
+    assert cache.in_use == {tmp_path / f"{large['sha256']}.bin": 1}
+
+
+def test_model_cache_ignores_release_of_other_models(tmp_path):
+    cache = ModelCache(tmp_path, 150)
+
+    cache.release("models/whisper_base.bin")
+
+    assert not cache.in_use
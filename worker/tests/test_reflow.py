@@ -0,0 +1,90 @@
+from reflow import balance_lines, reflow, reflow_srt
+
+# Settings that leave the timing of cues alone
+UNTIMED = {
+    "min_duration_ms": 0,
+    "words_per_minute": 100000,
+    "lead_in_ms": 0,
+    "lead_out_ms": 0,
+    "min_gap_ms": 0,
+}
+
+
+def test_reflow_keeps_short_cue():
+    assert list(reflow([(1000, 2000, "Hello there")], **UNTIMED)) == [
+        (1000, 2000, ["Hello there"])
+    ]
+
+
+def test_reflow_wraps_long_line():
+    text = "This sentence is much too long to be shown on a single line."
+
+    [(start, end, lines)] = reflow([(0, 4000, text)], **UNTIMED)
+
+    assert (start, end) == (0, 4000)
+    assert len(lines) == 2
+    assert all(len(line) <= 42 for line in lines)
+    assert " ".join(lines) == text
+
+
+def test_balance_lines_prefers_break_after_punctuation():
+    words = "We went to the market, and then we walked all the way home".split()
+
+    assert balance_lines(words, 42) == [
+        "We went to the market,",
+        "and then we walked all the way home",
+    ]
+
+
+def test_reflow_splits_cue_by_characters():
+    text = " ".join(["word"] * 40)
+
+    cues = list(reflow([(0, 10000, text)], max_length=20, max_lines=2, **UNTIMED))
+
+    assert len(cues) > 1
+    assert cues[0][0] == 0
+    assert cues[-1][1] == 10000
+    assert all(len(lines) <= 2 for _, _, lines in cues)
+    assert all(previous[1] <= cue[0] for previous, cue in zip(cues, cues[1:]))
+    assert " ".join(word for _, _, lines in cues for word in lines) == text
+
+
+def test_reflow_extends_short_cue():
+    [(start, end, _)] = reflow(
+        [(1000, 1200, "Hi")],
+        min_duration_ms=1500,
+        lead_in_ms=500,
+        lead_out_ms=1000,
+    )
+
+    assert start == 500
+    assert end == 2200
+
+
+def test_reflow_does_not_overlap_next_cue():
+    cues = list(
+        reflow(
+            [(1000, 1200, "One"), (1500, 3000, "Two")],
+            min_duration_ms=1500,
+            lead_in_ms=500,
+            lead_out_ms=1000,
+            min_gap_ms=80,
+        )
+    )
+
+    assert cues[0][0] == 0
+    assert cues[0][1] + 80 <= cues[1][0]
+    assert cues[0][1] - cues[0][0] >= 1000
+    assert cues[1][1] == 4000
+
+
+def test_reflow_srt_renumbers_cues():
+    content = (
+        "5\n00:00:01,000 --> 00:00:02,000\nOne\n\n"
+        "9\n00:00:03,000 --> 00:00:04,000\nTwo\nlines\n\n"
+    )
+
+    assert reflow_srt(content, **UNTIMED) == (
+        "1\n00:00:01,000 --> 00:00:02,000\nOne\n\n"
+        "2\n00:00:03,000 --> 00:00:04,000\nTwo lines\n\n"
+    )
@@ -0,0 +1,89 @@
+import pytest
+import subprocess
+import sys
+import watchdog
+
+from watchdog import RealTimeFactors, Watchdog, kill_group
+
+
+@pytest.fixture
+def process():
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(60)"],
+        start_new_session=True,
+    )
+    yield process
+    kill_group(process.pid)
+    process.wait()
+
+
+def test_real_time_factors_default():
+    factors = RealTimeFactors()
+
+    assert factors.get("transcode") == watchdog.settings.WATCHDOG_RTF["transcode"]
+    assert (
+        factors.get("transcribe:base") == watchdog.settings.WATCHDOG_RTF["transcribe"]
+    )
+    assert factors.get("unknown") == 1.0
+
+
+def test_real_time_factors_update(monkeypatch):
+    monkeypatch.setattr(watchdog.settings, "WATCHDOG_RTF_WEIGHT", 0.5)
+    factors = RealTimeFactors()
+
+    factors.update("transcribe:base", 30, 60)
+    assert factors.get("transcribe:base") == 0.5
+
+    factors.update("transcribe:base", 60, 60)
+    assert factors.get("transcribe:base") == 0.75
+
+    # Models are measured apart, unknown durations are not measured
+    factors.update("transcribe:large", 10, None)
+    assert "transcribe:large" not in factors.factors
+
+
+def test_real_time_factors_timeout(monkeypatch):
+    monkeypatch.setattr(watchdog.settings, "WATCHDOG_MIN_SECONDS", 10)
+    monkeypatch.setattr(watchdog.settings, "WATCHDOG_MARGIN", 2)
+    monkeypatch.setattr(watchdog.settings, "WATCHDOG_MAX_SECONDS", 1000)
+    factors = RealTimeFactors()
+    factors.update("transcribe:base", 60, 60)
+
+    assert factors.timeout("transcribe:base", 100) == 10 + 100 * 1 * 2
+    assert factors.timeout("transcribe:base", 1000) == 1000
+    assert factors.timeout("transcribe:base", None) == 1000
+
+
+def test_watchdog_running(process):
+    assert Watchdog(process.pid, "transcribe:base", 60).check() is None
+
+
+def test_watchdog_timeout(process):
+    error = Watchdog(process.pid, "transcribe:base", -1).check()
+
+    assert error.reason == "timeout"
+    assert "transcribe stage" in str(error)
+
+
+def test_watchdog_memory(process, monkeypatch):
+    monkeypatch.setattr(watchdog.settings, "WATCHDOG_MAX_RSS_BYTES", 1)
+
+    assert Watchdog(process.pid, "transcode", 60).check().reason == "memory"
+
+
+def test_watchdog_stalled(process, monkeypatch):
+    monkeypatch.setattr(watchdog.settings, "WATCHDOG_STALL_SECONDS", -1)
+    guard = Watchdog(process.pid, "transcode", 60)
+
+    # Starting the interpreter is progress, sleeping afterwards is not
+    guard.check()
+    assert guard.check().reason == "stalled"
+
+
+def test_kill_group(process):
+    kill_group(process.pid)
+
+    assert process.wait(timeout=10) < 0
+
+    # The group is gone already
+    kill_group(process.pid)
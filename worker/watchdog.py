@@ -0,0 +1,178 @@
+import os
+import psutil
+import signal
+import threading
+import time
+
+from settings import get_settings
+from typing import Optional
+
+settings = get_settings()
+
+# CPU seconds a process group has to use between checks to make progress
+MIN_CPU_PROGRESS = 0.01
+
+
+def kill_group(pid: int) -> None:
+    """
+    Kill a process group started with start_new_session=True.
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class WatchdogError(Exception):
+    """
+    Raised when the watchdog killed a command, the reason is reported to
+    the broker as the class of the error.
+    """
+
+    def __init__(self, reason: str, message: str) -> None:
+        super().__init__(message)
+        self.reason = reason
+
+
+class RealTimeFactors:
+    """
+    Keep a moving average of the seconds every stage takes per second of
+    audio, measured on the jobs of this worker. Transcriptions are kept
+    apart by model, as "transcribe:<model>".
+
+    The time limit of a stage is derived from it with a margin for slow
+    runs. Stages not measured yet use the factor configured for them in
+    WATCHDOG_RTF.
+    """
+
+    def __init__(self) -> None:
+        self.factors: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def get(self, stage: str) -> float:
+        with self.lock:
+            if stage in self.factors:
+                return self.factors[stage]
+
+        return settings.WATCHDOG_RTF.get(stage.partition(":")[0], 1.0)
+
+    def update(self, stage: str, seconds: float, duration: Optional[float]) -> None:
+        """
+        Add the time a stage took on audio of the given duration.
+        """
+        if not duration:
+            return
+
+        factor = seconds / duration
+
+        with self.lock:
+            previous = self.factors.get(stage)
+            self.factors[stage] = (
+                factor
+                if previous is None
+                else previous + settings.WATCHDOG_RTF_WEIGHT * (factor - previous)
+            )
+
+    def timeout(self, stage: str, duration: Optional[float]) -> float:
+        """
+        Get the time limit of a stage on audio of the given duration. The
+        longest time limit applies if the duration is not known.
+        """
+        if not duration:
+            return settings.WATCHDOG_MAX_SECONDS
+
+        limit = (
+            settings.WATCHDOG_MIN_SECONDS
+            + duration * self.get(stage) * settings.WATCHDOG_MARGIN
+        )
+
+        return min(limit, settings.WATCHDOG_MAX_SECONDS)
+
+
+class Watchdog:
+    """
+    Watch the process group of a command for running past its time
+    limit, making no progress or using too much memory.
+
+    A command makes progress as long as its processes use CPU time, a
+    process blocked on a corrupt input or a dead mount does not. Memory
+    is the resident memory of all processes of the group.
+    """
+
+    def __init__(self, pid: int, stage: str, timeout: float) -> None:
+        self.stage = stage.partition(":")[0]
+        self.timeout = timeout
+        self.max_rss = (
+            settings.WATCHDOG_MAX_RSS_BYTES or psutil.virtual_memory().total // 2
+        )
+        self.started = time.monotonic()
+        self.progress_at = self.started
+        self.cpu_time = 0.0
+        self.error: Optional[WatchdogError] = None
+
+        try:
+            self.process = psutil.Process(pid)
+        except psutil.Error:
+            self.process = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def usage(self) -> tuple[float, int]:
+        """
+        Get the CPU seconds and resident memory of the process and all
+        its children.
+        """
+        if not self.process:
+            return 0.0, 0
+
+        cpu_time = 0.0
+        rss = 0
+
+        try:
+            processes = [self.process, *self.process.children(recursive=True)]
+        except psutil.Error:
+            return self.cpu_time, 0
+
+        for process in processes:
+            try:
+                times = process.cpu_times()
+                cpu_time += times.user + times.system
+                rss += process.memory_info().rss
+            except psutil.Error:
+                pass
+
+        return cpu_time, rss
+
+    def check(self) -> Optional[WatchdogError]:
+        """
+        Check the command, returning the reason it has to be killed if
+        it does.
+        """
+        now = time.monotonic()
+        elapsed = now - self.started
+        cpu_time, rss = self.usage()
+
+        if elapsed > self.timeout:
+            self.error = WatchdogError(
+                "timeout",
+                f"The {self.stage} stage timed out after {elapsed:.0f} seconds, "
+                f"over the limit of {self.timeout:.0f} seconds",
+            )
+        elif rss > self.max_rss:
+            self.error = WatchdogError(
+                "memory",
+                f"The {self.stage} stage used {rss / 1024**2:.0f} MiB of memory, "
+                f"over the limit of {self.max_rss / 1024**2:.0f} MiB",
+            )
+        elif cpu_time > self.cpu_time + MIN_CPU_PROGRESS:
+            self.cpu_time = cpu_time
+            self.progress_at = now
+        elif now - self.progress_at > settings.WATCHDOG_STALL_SECONDS:
+            self.error = WatchdogError(
+                "stalled",
+                f"The {self.stage} stage made no progress for "
+                f"{now - self.progress_at:.0f} seconds",
+            )
+
+        return self.error